@@ -0,0 +1,223 @@
+"""
+JSON lookup API over the planner core, next to the Streamlit UI.
+
+A plain ASGI app with no framework underneath:
+
+    uvicorn api:app --workers 4                 # or: python api.py --port 8600
+    PLANNER_DATA=data PLANNER_SHARED_DIR=/dev/shm/planner uvicorn api:app
+
+    GET /v1/schedule/<mis>        subjects + weekly timetable
+    GET /v1/schedule/<mis>.ics    the same timetable as an iCalendar file
+    GET /v1/grid/<mis>            compact weekly grid for a client-side renderer
+    GET /v1/feed/<mis>.ics        subscribable calendar feed (ETag + Last-Modified)
+    GET /v1/totals/<mis>          classes held so far per subject and type
+    GET /v1/vacant?day=Monday&time=10:30[&floor=1][&min_capacity=60]
+    GET /healthz                  data generation and version
+    GET /metrics                  Prometheus text format
+
+Data comes from a planner.DataManager (reloaded in the background when the
+workbooks change; shared between workers with PLANNER_SHARED_DIR). Every
+response carries an ETag derived from the data version, so a client that
+sends If-None-Match gets a 304 without the lookup running again, and
+encoded bodies are kept in an LRU for repeat requests.
+"""
+import asyncio
+import hashlib
+import json
+import os
+from datetime import date, datetime
+from urllib.parse import parse_qs, unquote
+
+import planner
+from metrics import REGISTRY, count, timer
+
+DATA_FOLDER = os.environ.get("PLANNER_DATA", planner.DATA_FOLDER)
+SHARED_DIR = os.environ.get("PLANNER_SHARED_DIR") or None
+FEED_DIR = os.environ.get("PLANNER_FEED_DIR") or (os.path.join(SHARED_DIR, "feeds") if SHARED_DIR else None)
+RESPONSE_CACHE_SIZE = 8192
+# Totals count classes up to today and the ICS starts from this week, so
+# their tags also change at midnight
+DATED_ROUTES = ("totals", "schedule_ics")
+
+# --------------------------------------------------
+# DATA
+# --------------------------------------------------
+def build_venue_index(generation):
+    return planner.VenueIndex(generation.sched_df, planner.load_venues(DATA_FOLDER))
+
+data = planner.DataManager(DATA_FOLDER, derive={"venue_index": build_venue_index}, shared_dir=SHARED_DIR)
+responses = planner.LRUMemo(RESPONSE_CACHE_SIZE)   # (route, args, etag) -> (content type, body)
+feeds = planner.FeedStore(FEED_DIR)
+student_feeds = planner.LRUMemo(RESPONSE_CACHE_SIZE)   # (data version, mis) -> FeedArtifact, None if unknown
+
+REGISTRY.add_collector("api_data", lambda: {f"api_data_{k}": v for k, v in data.metrics().items() if v is not None})
+REGISTRY.add_collector("api_responses", lambda: {f"api_response_cache_{k}": v for k, v in responses.stats().items()})
+REGISTRY.add_collector("api_feeds", lambda: {f"api_feed_cache_{k}": v for k, v in feeds.stats().items()})
+
+class NotFound(Exception):
+    pass
+
+class BadRequest(Exception):
+    pass
+
+def etag_for(*parts):
+    return '"' + hashlib.sha1("|".join(map(str, parts)).encode("utf-8")).hexdigest()[:20] + '"'
+
+def encode(payload):
+    return json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+# --------------------------------------------------
+# HANDLERS
+# --------------------------------------------------
+# Each takes (generation, arg, query) and returns (content type, body bytes).
+
+def lookup(gen, mis):
+    subs, table, name, branch = planner.get_schedule(mis, gen.sub_dfs, gen.sched_df)
+    if not subs: raise NotFound(f"MIS {mis} not found")
+    return subs, table, name, branch
+
+def schedule_json(gen, mis, query):
+    subs, table, name, branch = lookup(gen, mis)
+    return "application/json", encode({
+        "mis": planner.clean_mis(mis), "name": name, "branch": branch,
+        "subjects": subs, "timetable": table, "data_version": gen.version,
+    })
+
+def schedule_ics(gen, mis, query):
+    _, table, _, _ = lookup(gen, mis)
+    return "text/calendar; charset=utf-8", planner.generate_master_ics(table, planner.SEMESTER_END).encode("utf-8")
+
+def grid_json(gen, mis, query):
+    _, table, _, _ = lookup(gen, mis)
+    return "application/json", planner.render_grid_json(table).encode("utf-8")
+
+def totals_json(gen, mis, query):
+    _, table, _, _ = lookup(gen, mis)
+    totals = planner.calculate_semester_totals(table)
+    return "application/json", encode({"mis": planner.clean_mis(mis), "as_of": date.today().isoformat(), "totals": totals})
+
+def vacant_json(gen, _, query):
+    day = query.get("day", "").strip().title()
+    if day not in planner.WEEK_DAYS: raise BadRequest(f"day must be one of {', '.join(planner.WEEK_DAYS)}")
+    try:
+        q_time = datetime.strptime(query.get("time", ""), "%H:%M").time()
+        floor = int(query["floor"]) if query.get("floor") else None
+        min_capacity = int(query["min_capacity"]) if query.get("min_capacity") else None
+    except ValueError:
+        raise BadRequest("time must be H:MM; floor and min_capacity must be integers")
+    venues = gen.derived["venue_index"]
+    rooms = venues.vacant_until(day, q_time.hour * 60 + q_time.minute, floor, min_capacity)
+    return "application/json", encode({
+        "day": day, "time": q_time.strftime("%H:%M"),
+        "rooms": [{"venue": v, "free_until": planner.format_minutes(u), "floor": venues.info(v).get("floor"),
+                   "capacity": venues.info(v).get("capacity")} for v, u in rooms],
+    })
+
+def student_feed(gen, mis):
+    subs, table, _, _ = planner.get_schedule(mis, gen.sub_dfs, gen.sched_df)
+    return feeds.get(table) if subs else None
+
+async def feed(send, gen, mis, request_headers, head):
+    """Calendar clients poll this; an unchanged timetable is a memo lookup and a 304."""
+    with timer("api.feed"):
+        artifact = await asyncio.to_thread(student_feeds.get_or_compute, (gen.version, planner.clean_mis(mis)), lambda: student_feed(gen, mis))
+    if artifact is None:
+        count("api_requests", route="feed", status="404")
+        return await send_response(send, 404, encode({"error": f"MIS {mis} not found"}), head=head)
+    headers = [("etag", artifact.etag), ("last-modified", artifact.last_modified), ("cache-control", "no-cache")]
+    if artifact.not_modified(request_headers.get(b"if-none-match", b"").decode("latin-1"),
+                             request_headers.get(b"if-modified-since", b"").decode("latin-1")):
+        count("api_requests", route="feed", status="304")
+        return await send_response(send, 304, headers=headers, head=True)
+    count("api_requests", route="feed", status="200")
+    await send_response(send, 200, artifact.body, "text/calendar; charset=utf-8", headers, head=head)
+
+def route(path):
+    """path -> (name, handler, path argument), or None."""
+    if path.startswith("/v1/schedule/"):
+        mis = unquote(path[len("/v1/schedule/"):])
+        if mis.endswith(".ics"): return "schedule_ics", schedule_ics, mis[:-4]
+        return "schedule", schedule_json, mis
+    if path.startswith("/v1/grid/"):
+        return "grid", grid_json, unquote(path[len("/v1/grid/"):])
+    if path.startswith("/v1/totals/"):
+        return "totals", totals_json, unquote(path[len("/v1/totals/"):])
+    if path == "/v1/vacant":
+        return "vacant", vacant_json, None
+    return None
+
+# --------------------------------------------------
+# ASGI
+# --------------------------------------------------
+async def send_response(send, status, body=b"", content_type="application/json", headers=(), head=False):
+    raw = [(b"content-type", content_type.encode()), (b"content-length", str(len(body)).encode())]
+    raw += [(k.encode(), v.encode()) for k, v in headers]
+    await send({"type": "http.response.start", "status": status, "headers": raw})
+    await send({"type": "http.response.body", "body": b"" if head else body})
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            try:
+                await asyncio.to_thread(data.current)   # first load happens before the first request
+                await send({"type": "lifespan.startup.complete"})
+            except Exception as e:
+                await send({"type": "lifespan.startup.failed", "message": repr(e)})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan": return await lifespan(receive, send)
+    if scope["type"] != "http": return
+    method, path = scope["method"], scope["path"]
+    head = method == "HEAD"
+    if method not in ("GET", "HEAD"):
+        return await send_response(send, 405, encode({"error": "method not allowed"}), headers=[("allow", "GET, HEAD")])
+
+    if path == "/metrics":
+        return await send_response(send, 200, REGISTRY.prometheus().encode(), "text/plain; version=0.0.4", head=head)
+    # Only the very first load blocks, and that one runs off the event loop
+    gen = await asyncio.to_thread(data.current) if data.metrics()["generation"] == 0 else data.current()
+    if path == "/healthz":
+        return await send_response(send, 200, encode({"status": "ok", "data_version": gen.version, **data.metrics()}), head=head)
+
+    request_headers = dict(scope.get("headers") or [])
+    if path.startswith("/v1/feed/") and path.endswith(".ics"):
+        return await feed(send, gen, unquote(path[len("/v1/feed/"):-4]), request_headers, head)
+    hit = route(path)
+    if hit is None:
+        count("api_requests", route="unknown", status="404")
+        return await send_response(send, 404, encode({"error": "not found"}), head=head)
+    name, handler, arg = hit
+    query = {k: v[0] for k, v in parse_qs(scope.get("query_string", b"").decode("latin-1")).items()}
+    etag = etag_for(gen.version, name, planner.clean_mis(arg) if arg else sorted(query.items()),
+                    date.today() if name in DATED_ROUTES else "")
+    headers = [("etag", etag), ("cache-control", "no-cache")]
+
+    if etag in request_headers.get(b"if-none-match", b"").decode("latin-1"):
+        count("api_requests", route=name, status="304")
+        return await send_response(send, 304, headers=headers, head=True)
+
+    try:
+        with timer(f"api.{name}"):
+            content_type, body = await asyncio.to_thread(responses.get_or_compute, (name, arg, etag), lambda: handler(gen, arg, query))
+    except NotFound as e:
+        count("api_requests", route=name, status="404")
+        return await send_response(send, 404, encode({"error": str(e)}), head=head)
+    except BadRequest as e:
+        count("api_requests", route=name, status="400")
+        return await send_response(send, 400, encode({"error": str(e)}), head=head)
+    count("api_requests", route=name, status="200")
+    await send_response(send, 200, body, content_type, headers, head=head)
+
+if __name__ == "__main__":
+    import argparse
+    import uvicorn
+    parser = argparse.ArgumentParser(description="Planner JSON API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8600)
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+    uvicorn.run("api:app", host=args.host, port=args.port, workers=args.workers)
@@ -1,19 +1,23 @@
-import gspread
-from google.oauth2.service_account import Credentials
 import streamlit as st
 import streamlit.components.v1 as components
 import pandas as pd
-import os
-import re
-import zlib
-import json
-from datetime import datetime, timedelta, date
-from difflib import SequenceMatcher
+from collections import Counter, OrderedDict
+import uuid
+from datetime import datetime, date
 import time
 
+import planner
+from planner import (
+    DATA_FOLDER, SEMESTER_START, SEMESTER_END, LRUMemo, clean_mis, get_links_version, get_schedule,
+    generate_master_ics, render_grid, render_subject_html, calculate_semester_totals,
+)
+from metrics import REGISTRY, timer, timed, count
+from storage import AttendanceStore, attendance_sheet_stats, make_backend, get_secret
+
 # --------------------------------------------------
 # 1. PAGE CONFIGURATION & STATE INITIALIZATION
 # --------------------------------------------------
+_run_started = time.perf_counter()
 st.set_page_config(page_title="Student Timetable", page_icon="✨", layout="wide")
 
 # Initialize Theme State
@@ -23,14 +27,6 @@ if 'theme' not in st.session_state:
 def toggle_theme():
     st.session_state.theme = 'dark' if st.session_state.theme == 'light' else 'light'
 
-# --------------------------------------------------
-# 2. CONSTANTS & DATES
-# --------------------------------------------------
-DATA_FOLDER = "data"
-TIMETABLE_FILE = "timetable_schedule.xlsx"
-SEMESTER_START = date(2026, 1, 12)
-SEMESTER_END = date(2026, 5, 7)
-
 # --------------------------------------------------
 # 3. DYNAMIC THEME STYLING
 # --------------------------------------------------
@@ -374,495 +370,110 @@ table.custom-grid {{ width: 100%; min-width: 1000px; border-collapse: separate;
 # --------------------------------------------------
 # 4. HELPERS
 # --------------------------------------------------
-SUBJECT_GRADIENTS = [
-    "linear-gradient(135deg, #a18cd1 0%, #fbc2eb 100%)", "linear-gradient(135deg, #84fab0 0%, #8fd3f4 100%)",
-    "linear-gradient(135deg, #e0c3fc 0%, #8ec5fc 100%)", "linear-gradient(135deg, #ff9a9e 0%, #fecfef 100%)",
-    "linear-gradient(135deg, #fccb90 0%, #d57eeb 100%)", "linear-gradient(135deg, #fa709a 0%, #fee140 100%)",
-    "linear-gradient(135deg, #4facfe 0%, #00f2fe 100%)", "linear-gradient(135deg, #43e97b 0%, #38f9d7 100%)"
-]
-
-def get_subject_gradient(subject_name):
-    if not subject_name: return SUBJECT_GRADIENTS[0]
-    idx = zlib.adler32(subject_name.encode('utf-8')) % len(SUBJECT_GRADIENTS)
-    return SUBJECT_GRADIENTS[idx]
-
-def correct_subject_name(text):
-    if pd.isna(text): return ""
-    return str(text).replace("Quantun Physics", "Quantum Physics")
-
-def clean_text(text): 
-    if pd.isna(text): return ""
-    return re.sub(r'[^a-z0-9]', '', str(text).lower())
-
-def clean_mis(text):
-    if pd.isna(text): return ""
-    s = str(text).strip()
-    return clean_text(s[:-2] if s.endswith(".0") else s)
-
-def normalize_division(text):
-    if pd.isna(text): return ""
-    clean = str(text).lower()
-    nums = re.findall(r'\d+', clean)
-    return nums[0] if nums else clean.replace("division", "").replace("div", "").strip()
-
-def normalize_batch(text):
-    if pd.isna(text): return "all"
-    clean = str(text).lower().replace(" ", "")
-    if clean in ["-", "nan", "", "_"]: return "all"
-    nums = re.findall(r'\d+', clean)
-    return f"b{nums[0]}" if nums else "all"
-
-def is_fuzzy_match(str1, str2):
-    if str1 in str2 or str2 in str1: return True
-    return SequenceMatcher(None, str1, str2).ratio() > 0.85
-
-def parse_time(time_str):
-    """
-    Parses time strings like '10:30 TO 12:30' or '11:00 - 12:30'.
-    Returns:
-       start_str: String (e.g., "11:00")
-       duration: Float (hours, e.g., 1.5)
-    """
-    if pd.isna(time_str): return None, 1.0
-    
-    # Normalize string
-    raw = str(time_str).upper().replace('.', ':').replace('-', ' ').replace('TO', ' ')
-    times = re.findall(r'(\d{1,2}:\d{2})', raw)
-    
-    if not times: return None, 1.0
-    
-    start_str = times[0].lstrip("0")
-    duration = 1.0 # Default
-    
-    if len(times) >= 2:
-        try:
-            t1 = datetime.strptime(start_str, "%H:%M")
-            t2 = datetime.strptime(times[1], "%H:%M")
-            
-            # Handle 12-hour crossover (e.g. 11:30 to 1:30)
-            if t2 < t1:
-                t2 += timedelta(hours=12)
-            
-            diff_mins = (t2 - t1).total_seconds() / 60
-            
-            # Allow for small margin of error (e.g. 85 mins -> 1.5 hrs)
-            if diff_mins > 20:
-                duration = diff_mins / 60.0
-        except: pass
-        
-    return start_str, duration
+# Constants, parsing and rendering helpers live in planner.py,
+# Google Sheets persistence and the attendance store in storage.py.
 
-def map_to_slot(time_str, slots):
-    """
-    Maps a start time (e.g. 11:00) to the nearest previous slot (e.g. 10:30).
-    Allows a delay of up to 30 mins.
-    """
-    try:
-        t = datetime.strptime(time_str, "%H:%M")
-        best, min_diff = None, 999
-        
-        for s in slots:
-            slot_time = datetime.strptime(s, "%H:%M")
-            diff = (t - slot_time).total_seconds() / 60
-            
-            # Logic: We are looking for a slot that is equal to or BEFORE the time
-            # But not too far before (max 30 mins).
-            # e.g. 11:00 matches 10:30 (diff +30)
-            # e.g. 10:30 matches 10:30 (diff 0)
-            if 0 <= diff <= 30:
-                if diff < min_diff:
-                    min_diff = diff
-                    best = s
-        return best
-    except: pass
-    return None
-
-# --- GOOGLE SHEETS PERSISTENCE ---
-def get_google_client():
-    scope = ['https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/drive']
-    creds = Credentials.from_service_account_info(st.secrets["gcp_service_account"], scopes=scope)
-    return gspread.authorize(creds)
-
-def get_google_sheet(index=0):
-    client = get_google_client()
-    sheet_url = st.secrets["private_sheet_url"] 
-    try:
-        sh = client.open_by_url(sheet_url)
-        if index >= len(sh.worksheets()):
-            return sh.add_worksheet(title="Leaderboard", rows="1000", cols="4")
-        return sh.get_worksheet(index)
-    except Exception as e:
-        return None
-
-def load_attendance():
-    try:
-        sheet = get_google_sheet(0) 
-        data = sheet.col_values(1)
-        return {cls_id: True for cls_id in data if cls_id}
-    except Exception as e:
-        return {}
-
-def update_attendance_in_sheet(cls_id, action):
-    try:
-        sheet = get_google_sheet(0) 
-        if action == "add":
-            sheet.append_row([cls_id])
-        elif action == "remove":
-            cell = sheet.find(cls_id)
-            if cell:
-                sheet.delete_rows(cell.row)
-    except Exception as e:
-        pass
-
-# --- MASTER ICS GENERATION ---
-def generate_master_ics(weekly_schedule, semester_end_date):
-    day_map = { "Monday": "MO", "Tuesday": "TU", "Wednesday": "WE", "Thursday": "TH", "Friday": "FR", "Saturday": "SA", "Sunday": "SU" }
-    ics_lines = [ "BEGIN:VCALENDAR", "VERSION:2.0", "PRODID:-//StudentPortal//MasterTimetable//EN", "CALSCALE:GREGORIAN", "METHOD:PUBLISH" ]
-    today = date.today()
-    days_list = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
-
-    for cls in weekly_schedule:
-        try:
-            target_day_name = cls['Day'] 
-            if target_day_name not in days_list: continue
-            
-            target_idx = days_list.index(target_day_name)
-            current_idx = today.weekday()
-            days_ahead = target_idx - current_idx if target_idx >= current_idx else 7 - (current_idx - target_idx)
-            start_date = today + timedelta(days=days_ahead)
-            
-            start_h, start_m = map(int, cls['StartTime'].split(':'))
-            
-            # Fix 12-hour crossover for PM classes
-            if start_h < 8:
-                start_h += 12
+@st.cache_resource
+def storage_backend():
+    """Configured in secrets: storage_backend = "sheets" | "sqlite", sqlite_path, sheets_mirror, sheets_async."""
+    return make_backend(get_secret("storage_backend", "sheets"), get_secret("sqlite_path", "planner.db"),
+                        bool(get_secret("sheets_mirror", False)), bool(get_secret("sheets_async", True)))
 
-            dt_start = datetime.combine(start_date, datetime.min.time()).replace(hour=start_h, minute=start_m)
-            # Use a rough int duration for ICS block logic
-            dt_end = dt_start + timedelta(hours=cls.get('Duration', 1)) 
-            
-            fmt = "%Y%m%dT%H%M%S"
-            until_str = semester_end_date.strftime("%Y%m%dT235959")
-            rrule_day = day_map.get(target_day_name, "MO")
-            event_block = [
-                "BEGIN:VEVENT", f"SUMMARY:{cls['Subject']} ({cls['Type']})", f"DTSTART:{dt_start.strftime(fmt)}", f"DTEND:{dt_end.strftime(fmt)}",
-                f"RRULE:FREQ=WEEKLY;BYDAY={rrule_day};UNTIL={until_str}", f"LOCATION:{cls['Venue']}", f"DESCRIPTION:Weekly {cls['Type']} session.",
-                "BEGIN:VALARM", "TRIGGER:-PT15M", "ACTION:DISPLAY", "DESCRIPTION:Reminder", "END:VALARM", "END:VEVENT"
-            ]
-            ics_lines.extend(event_block)
-        except: continue
-    ics_lines.append("END:VCALENDAR")
-    return "\n".join(ics_lines)
-
-
-def normalize_venue(venue_text):
-    """Cleans up venue names to ensure 'AC 101' matches 'ac101'."""
-    if pd.isna(venue_text) or str(venue_text).strip() in ["-", "", "nan"]:
-        return None
-    return str(venue_text).strip().upper()
-
-def get_vacant_venues(sched_df, target_day, target_time_str):
-    """
-    Returns a list of venues that are NOT occupied at the specific Day and Time.
-    Filters out labs/restricted areas and fixes 12-hour format ambiguity.
-    """
-    if sched_df is None or sched_df.empty:
-        return []
-
-    # --- CONFIG: Venues to Ignore (Labs, Auditorium, etc.) ---
-    # These will NEVER appear in the "Available" list.
-    IGNORED_VENUES = ["COGNIZANT", "CS LAB", "EP LAB", "EC LAB", "CHEM LAB", "PHY LAB", "FPL LAB"]
-
-    # 1. Parse the Target Time
-    try:
-        q_time = datetime.strptime(target_time_str, "%H:%M").time()
-    except:
-        return [] # Invalid time format
-
-    # 2. Identify ALL known venues (Filtering out the ignored ones)
-    venue_col = next((c for c in sched_df.columns if "Venue" in c), None)
-    if not venue_col: return []
-    
-    all_venues = set()
-    for v in sched_df[venue_col].unique():
-        norm = normalize_venue(v)
-        
-        # FILTER LOGIC: Skip if it's in our ignored list
-        if norm and norm not in IGNORED_VENUES: 
-            all_venues.add(norm)
+@st.cache_resource
+def attendance_store():
+    return AttendanceStore(storage_backend())
+
+def get_session_id():
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+    return st.session_state.session_id
+
+def is_admin():
+    """Admin views are unlocked with ?admin=<admin_token from secrets>."""
+    token = st.query_params.get("admin", "")
+    return bool(token) and token == get_secret("admin_token")
 
-    # 3. Find Occupied Venues
-    occupied_venues = set()
-    
-    # Filter by Day
-    day_col = next((c for c in sched_df.columns if "Day" in c), None)
-    time_col = next((c for c in sched_df.columns if "Time" in c), None)
-    
-    target_day_clean = target_day.strip().title()
-    day_schedule = sched_df[sched_df[day_col].astype(str).str.strip().str.title() == target_day_clean]
-    
-    for _, row in day_schedule.iterrows():
-        start_str, duration = parse_time(row[time_col])
-        if start_str:
-            try:
-                # Basic Parse
-                class_start = datetime.strptime(start_str, "%H:%M")
-                
-                # AM/PM Fix: If class starts before 8:00, assume PM (e.g. 1:30 -> 13:30)
-                if class_start.hour < 8:
-                    class_start = class_start.replace(hour=class_start.hour + 12)
-                
-                class_end = class_start + timedelta(hours=duration)
-                
-                q_mins = q_time.hour * 60 + q_time.minute
-                s_mins = class_start.hour * 60 + class_start.minute
-                e_mins = class_end.hour * 60 + class_end.minute
-                
-                # Check Overlap
-                if q_mins >= s_mins and q_mins < e_mins:
-                    occ_venue = normalize_venue(row[venue_col])
-                    if occ_venue:
-                        occupied_venues.add(occ_venue)
-            except:
-                continue
-
-    # 4. Subtract Occupied from All to get Vacant
-    vacant = sorted(list(all_venues - occupied_venues))
-    return vacant
 
 # --------------------------------------------------
 # 5. DATA LOADING & LOGIC
 # --------------------------------------------------
-@st.cache_data(ttl=60)
-def load_data():
-    if not os.path.exists(DATA_FOLDER): return [], None, {}
-    sub_dfs = []
-    sched_df = None
-    link_map = {} 
-    for f in os.listdir(DATA_FOLDER):
-        if not f.endswith(".xlsx"): continue
-        path = os.path.join(DATA_FOLDER, f)
-        try:
-            df = pd.read_excel(path)
-            df.columns = df.columns.astype(str).str.strip()
-            if f.lower() == TIMETABLE_FILE.lower():
-                sched_df = df
-            elif "link" in f.lower():
-                for _, row in df.iterrows():
-                    if len(row) >= 2:
-                        link_map[clean_text(correct_subject_name(row.iloc[0]))] = str(row.iloc[1]).strip()
-            else:
-                sub_dfs.append(df)
-        except: continue
-    return sub_dfs, sched_df, link_map
-
-def get_schedule(mis, sub_dfs, sched_df):
-    found_subs = []
-    # Initialize defaults
-    name = "Unknown"
-    branch = "General" 
-    target_mis = clean_mis(mis)
-    
-    # 1. Find User Subjects & Info across ALL sheets
-    for df in sub_dfs:
-        mis_col = next((c for c in df.columns if "MIS" in c.upper()), None)
-        if not mis_col: continue
-        
-        # Create helper key for matching
-        df["_KEY"] = df[mis_col].apply(clean_mis)
-        match = df[df["_KEY"] == target_mis]
-        
-        if not match.empty:
-            row = match.iloc[0]
-            
-            # --- A. NAME LOGIC ---
-            # Capture name from the first sheet that has it
-            if name == "Unknown":
-                name_col = next((c for c in df.columns if "Name" in c), None)
-                if name_col:
-                    found_name = str(row[name_col]).strip()
-                    if found_name and found_name.lower() != "nan":
-                        name = found_name
-
-            # --- B. IMPROVED BRANCH LOGIC ---
-            # Look for a branch column in THIS specific sheet
-            branch_col = next((c for c in df.columns if "Branch" in c), None)
-            if branch_col:
-                found_branch = str(row[branch_col]).strip()
-                
-                # Update 'branch' only if:
-                # 1. We currently have the default "General"
-                # 2. The new found_branch is VALID (not "General", empty, or "nan")
-                is_valid = found_branch and found_branch.lower() not in ["nan", "", "-", "general"]
-                
-                if branch == "General" and is_valid:
-                    branch = found_branch
-
-            # --- C. SUBJECT EXTRACTION ---
-            sub_col = next((c for c in df.columns if "Subject" in c or "Title" in c), None)
-            div_col = next((c for c in df.columns if "Division" in c), None)
-            batch_col = next((c for c in df.columns if "Batch" in c or "BATCH" in c.upper()), None)
-            
-            if sub_col:
-                found_subs.append({
-                    "Subject": correct_subject_name(str(row[sub_col]).strip()),
-                    "Division": str(row[div_col]).strip() if div_col else "",
-                    "Batch": str(row[batch_col]) if batch_col else ""
-                })
-    
-    # 2. Map to Timetable (Standard Logic)
-    timetable = []
-    if sched_df is not None and found_subs:
-        cols = sched_df.columns
-        t_sub_col = next((c for c in cols if "Subject" in c or "Title" in c), None)
-        t_div_col = next((c for c in cols if "Division" in c), None)
-        t_batch_col = next((c for c in cols if "Batch" in c), None)
-        t_type_col = next((c for c in cols if "Type" in c), None)
-        t_time_col = next((c for c in cols if "Time" in c), None)
-        t_day_col = next((c for c in cols if "Day" in c), None)
-        t_venue_col = next((c for c in cols if "Venue" in c), None)
-        
-        for sub in found_subs:
-            s_sub_clean = clean_text(sub['Subject'])
-            s_div = normalize_division(sub['Division'])
-            s_batch = normalize_batch(sub['Batch'])
-            
-            for _, row in sched_df.iterrows():
-                if not is_fuzzy_match(s_sub_clean, clean_text(row[t_sub_col])): continue
-                if normalize_division(row[t_div_col]) != s_div: continue
-                
-                t_batch = normalize_batch(row[t_batch_col]) if t_batch_col else "all"
-                type_str = str(row[t_type_col]).lower() if t_type_col else ""
-                is_lab = "lab" in type_str
-                is_tutorial = "tutorial" in type_str
-                is_batch_specific = is_lab or is_tutorial
-
-                if (not is_batch_specific) or (t_batch == "all" or t_batch == s_batch):
-                    start, dur_hours = parse_time(row[t_time_col])
-                    
-                    if start:
-                        row_span = int(dur_hours)
-                        if dur_hours > 1.2 and dur_hours <= 2.2:
-                            row_span = 2
-                        elif dur_hours > 2.2:
-                            row_span = 3 
-                        
-                        is_offset = False
-                        if ":00" in start or (dur_hours == 1.5):
-                             is_offset = True
-
-                        display_type = "LAB" if is_lab else "TUTORIAL" if is_tutorial else "THEORY"
-
-                        timetable.append({
-                            "Day": str(row[t_day_col]).title().strip(), 
-                            "StartTime": start, 
-                            "Duration": row_span,
-                            "DurationFloat": dur_hours,
-                            "IsOffset": is_offset,
-                            "Subject": sub['Subject'], 
-                            "Type": display_type, 
-                            "Venue": str(row[t_venue_col]) if t_venue_col else "-"
-                        })
-                
-    return found_subs, timetable, name, branch
+def build_venue_index(generation):
+    """Venue registry + occupancy index for a data generation."""
+    count("cache_miss", cache="venue_index")
+    return planner.VenueIndex(generation.sched_df, planner.load_venues(DATA_FOLDER))
+
+def build_validation_report(generation):
+    """Clash / double-booking check for a data generation; also written to reports/."""
+    with timer("validate_timetable"):
+        report = planner.validate_timetable(generation.sub_dfs, generation.sched_df)
+    try: planner.write_validation_report(report, data_version=generation.version)
+    except OSError: pass   # read-only deployments still get the admin panel copy
+    return report
+
+def build_student_index(generation):
+    """MIS-prefix / name typeahead for the search box."""
+    with timer("student_index"):
+        return planner.StudentIndex(generation.sub_dfs)
+
+@st.cache_resource
+def data_manager():
+    """
+    The current data generation. Changed workbooks are reloaded (with the
+    venue index, student index and validation report) in the background and swapped in,
+    so no request waits on a reload after the first one.
+    Secrets: shared_data_dir (e.g. /dev/shm/planner) lets every worker on
+    the host map one copy of the parsed workbooks.
+    """
+    return planner.DataManager(DATA_FOLDER, derive={"venue_index": build_venue_index, "students": build_student_index,
+                                                       "validation": build_validation_report},
+                               shared_dir=get_secret("shared_data_dir", None))
+
+@st.cache_data
+def load_link_map(links_version):
+    count("cache_miss", cache="link_map")
+    return planner.load_link_map(links_version, DATA_FOLDER)
+
+SCHEDULE_MEMO_SIZE = 2048        # students kept per process
+SESSION_SCHEDULE_MEMO_SIZE = 4   # students kept per browser session
+
+@st.cache_resource
+def get_schedule_memo():
+    return LRUMemo(SCHEDULE_MEMO_SIZE)
+
+REGISTRY.add_collector("schedule_memo", lambda: {f"schedule_memo_{k}": v for k, v in get_schedule_memo().stats().items()})
+REGISTRY.add_collector("attendance_store", lambda: {
+    f"attendance_store_{k}": v for k, v in attendance_store().metrics().items() if k != "sessions" and v is not None
+})
+REGISTRY.add_collector("storage_backend", lambda: {
+    f"storage_{k}": v for k, v in getattr(storage_backend(), "metrics", dict)().items() if isinstance(v, (int, float))
+})
+REGISTRY.add_collector("data", lambda: {f"data_{k}": v for k, v in data_manager().metrics().items() if v is not None})
+REGISTRY.add_collector("sheets_mirror", lambda: (lambda m: {
+    "sheets_mirror_pending": m.pending(), "sheets_mirror_pushed": m.pushed, "sheets_mirror_failed": m.failed,
+} if m else {})(getattr(storage_backend(), "mirror", None)))
+
+def get_schedule_cached(mis, sub_dfs, sched_df, data_version):
+    """
+    get_schedule memoized on (normalized MIS, data version).
+    Checks the session first, then the process-wide LRU; only a miss in both
+    runs the enrolment scan and timetable join.
+    """
+    key = (clean_mis(mis), data_version)
+    session_memo = st.session_state.setdefault("schedule_memo", OrderedDict())
+    if key in session_memo:
+        session_memo.move_to_end(key)
+        return session_memo[key]
 
-def render_grid(entries):
-    slots = ["8:30", "9:30", "10:30", "11:30", "12:30", "1:30", "2:30", "3:30", "4:30", "5:30"]
-    days = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday"]
-    grid = {s: {d: None for d in days} for s in slots}
-    
-    for e in entries:
-        if e['Day'] in days:
-            # New mapping logic
-            slot = map_to_slot(e['StartTime'], slots)
-            if slot:
-                grid[slot][e['Day']] = e
-                # Merge cells logic
-                if e['Duration'] > 1:
-                    idx = slots.index(slot)
-                    for i in range(1, e['Duration']):
-                        if idx + i < len(slots): grid[slots[idx+i]][e['Day']] = "MERGED"
-
-    html = '<div class="timetable-wrapper"><table class="custom-grid"><thead><tr><th>Time</th>' + ''.join([f'<th>{d}</th>' for d in days]) + '</tr></thead><tbody>'
-    for s in slots:
-        label = f"{s} - {str(int(s.split(':')[0])+1)}:{s.split(':')[1]}"
-        html += f'<tr><td class="time-label">{label}</td>'
-        for d in days:
-            cell = grid[s][d]
-            if cell == "MERGED": continue
-            if cell:
-                span = f'rowspan="{cell["Duration"]}"' if cell['Duration'] > 1 else ''
-                grad = get_subject_gradient(cell['Subject'])
-                
-                # --- OFFSET RENDER LOGIC ---
-                if cell.get('IsOffset', False) and cell.get('DurationFloat', 1) == 1.5:
-                     html += f'''
-                    <td {span} style="padding:0; vertical-align: top;">
-                        <div class="offset-wrapper">
-                            <div class="offset-spacer"></div>
-                            <div class="offset-card-container">
-                                <div class="class-card filled offset-style" style="background:{grad}">
-                                    <div class="batch-badge">{cell["Type"]} (1.5h)</div>
-                                    <div class="sub-title">{cell["Subject"]}</div>
-                                    <div class="sub-meta">📍 {cell["Venue"]} <br> ⏰ {cell["StartTime"]}</div>
-                                </div>
-                            </div>
-                        </div>
-                    </td>
-                    '''
-                else:
-                    # Normal Render
-                    html += f'<td {span}><div class="class-card filled" style="background:{grad}"><div class="batch-badge">{cell["Type"]}</div><div class="sub-title">{cell["Subject"]}</div><div class="sub-meta">📍 {cell["Venue"]}</div></div></td>'
-            else:
-                html += '<td><div class="class-card type-empty"></div></td>'
-        html += '</tr>'
-    return html + '</tbody></table></div>'
+    def compute():
+        count("cache_miss", cache="schedule")
+        with timer("get_schedule.compute"):
+            return get_schedule(mis, sub_dfs, sched_df)
+    result = get_schedule_memo().get_or_compute(key, compute)
+    session_memo[key] = result
+    while len(session_memo) > SESSION_SCHEDULE_MEMO_SIZE:
+        session_memo.popitem(last=False)
+    return result
 
-def render_subject_html(subjects, link_map):
-    html_parts = ["""
-    <style>
-    .sub-alloc-wrapper { font-family: 'Poppins', sans-serif; margin-top: 10px; border-radius: 12px; overflow-x: auto; border: none; box-shadow: 0 4px 20px var(--card-shadow); background: var(--card-bg); }
-    table.sub-alloc-table { width: 100%; min-width: 600px; border-collapse: collapse; background: var(--card-bg); }
-    .sub-alloc-table thead th { background: linear-gradient(90deg, #a18cd1 0%, #fbc2eb 100%); color: white; padding: 18px; font-size: 17px; font-weight: 700; text-align: left; white-space: nowrap; }
-    .sub-alloc-table tbody td { padding: 16px; font-size: 16px; color: var(--text-color); border-bottom: 1px solid rgba(128,128,128,0.1); background: var(--card-bg); vertical-align: middle; transition: all 0.2s; white-space: nowrap; }
-    .sub-alloc-table tbody tr:hover td { background-color: var(--table-row-hover); transform: scale(1.005); color: #6a11cb; cursor: default; }
-    .drive-btn { background: linear-gradient(135deg, #6a11cb 0%, #2575fc 100%); color: white !important; padding: 8px 16px; border-radius: 50px; text-decoration: none; font-size: 13px; font-weight: 600; display: inline-block; transition: 0.2s; }
-    .drive-btn:hover { transform: translateY(-2px); box-shadow: 0 6px 15px rgba(37, 117, 252, 0.3); }
-    </style>
-    <div class="sub-alloc-wrapper"><table class="sub-alloc-table"><thead><tr><th style="width:40%">Subject Name</th><th style="width:20%">Batch</th><th style="width:20%">Division</th><th style="width:20%">Material</th></tr></thead><tbody>
-    """]
-    for sub in subjects:
-        link = link_map.get(clean_text(sub.get('Subject')), "#")
-        link_html = f'<a href="{link}" target="_blank" class="drive-btn">📂 Open Drive</a>' if link != "#" else "<span style='color:#aaa'>No Link</span>"
-        html_parts.append(f"<tr><td>{sub.get('Subject')}</td><td>{sub.get('Batch')}</td><td>{sub.get('Division')}</td><td>{link_html}</td></tr>")
-    html_parts.append("</tbody></table></div>")
-    return "".join(html_parts)
-
-def calculate_semester_totals(timetable_entries):
-    totals = {}
-    weekly_map = {}
-    for entry in timetable_entries:
-        d = entry['Day']
-        if d not in weekly_map: weekly_map[d] = []
-        weekly_map[d].append(entry)
-        key = f"{entry['Subject']}|{entry['Type']}"
-        totals[key] = 0
-    
-    curr_date = SEMESTER_START
-    # CHANGE: Stop counting at today's date instead of SEMESTER_END
-    # to get "Total lectures taken place till now"
-    end_date = date.today() 
-    
-    while curr_date <= end_date:
-        # Don't count future dates if SEMESTER_START is in future
-        if curr_date > SEMESTER_END: break 
-        
-        day_name = curr_date.strftime("%A")
-        if day_name in weekly_map:
-            for cls in weekly_map[day_name]:
-                totals[f"{cls['Subject']}|{cls['Type']}"] += 1
-        curr_date += timedelta(days=1)
-    return totals
 
 
 # --------------------------------------------------
@@ -870,53 +481,14 @@ def calculate_semester_totals(timetable_entries):
 # --------------------------------------------------
 
 
-def get_leaderboard_data():
-    """Fetches live scores with debug error handling."""
-    try:
-        client = get_google_client()
-        sheet_url = st.secrets["game_sheet_url"]
-        sh = client.open_by_url(sheet_url)
 
+def refresh_leaderboard():
+    backend = storage_backend()
+    if hasattr(backend, "refresh_leaderboard"): backend.refresh_leaderboard()
+    st.cache_data.clear()
 
-        
-        # STRICT CHECK: Try to find 'Leaderboard'. 
-        # If not found, print error instead of silently loading wrong sheet.
-        try:
-            sheet = sh.worksheet("Leaderboard")
-        except gspread.exceptions.WorksheetNotFound:
-            st.error("⚠️ Error: Tab named 'Leaderboard' not found in Google Sheet.")
-            return pd.DataFrame()
-
-        # Get all data
-        data = sheet.get_all_values()
-        
-        # ERROR CHECK: Empty Data
-        if not data or len(data) < 2: 
-            return pd.DataFrame()
-            
-        # Parse Headers and Rows
-        header = data[0]
-        rows = data[1:]
-        
-        # create DataFrame
-        df = pd.DataFrame(rows, columns=header)
-        
-        # CLEANUP: Fix columns if they are missing
-        expected_cols = ["Score", "Branch", "Name", "MIS"]
-        for c in expected_cols:
-            if c not in df.columns: df[c] = ""
-
-        # CONVERT TYPES: Force Score to be an integer
-        # This fixes the "sorting by text" bug (where 9 > 1000)
-        df['Score'] = pd.to_numeric(df['Score'], errors='coerce').fillna(0).astype(int)
-        
-        return df
-
-    except Exception as e:
-        # If connection fails, show why
-        st.error(f"Connection Error: {e}")
-        return pd.DataFrame()
-
+@st.fragment
+@timed("leaderboard.render")
 def render_leaderboard_ui(user_branch):
     """Draws the Leaderboard UI (Title + Cards + Button)."""
     
@@ -925,12 +497,14 @@ def render_leaderboard_ui(user_branch):
     st.caption("Top champion from every branch.")
 
     # 2. Fetch Data
-    df = get_leaderboard_data()
+    backend = storage_backend()
+    df = backend.get_leaderboard()
 
     if df.empty:
+        if getattr(backend, "last_error", None): st.error(backend.last_error)
         st.info("No records yet. Play to claim the throne!")
         # Add refresh button even if empty, so user can retry
-        if st.button("🔄 Refresh"): st.rerun()
+        st.button("🔄 Refresh", on_click=refresh_leaderboard)  # Any click reruns just this fragment
         return
 
     # 3. LOGIC: Sort by Score -> Drop Duplicates on Branch
@@ -970,9 +544,7 @@ def render_leaderboard_ui(user_branch):
 
     # 5. Single Refresh Button
     st.write("")
-    if st.button("🔄 Check for Updates", use_container_width=True):
-        st.cache_data.clear()
-        st.rerun()
+    st.button("🔄 Check for Updates", use_container_width=True, on_click=refresh_leaderboard)
 
 # --------------------------------------------------
 # 6. GAME INTEGRATION
@@ -1092,15 +664,41 @@ def render_game_html():
     const GAME_W = 400; 
     const GAME_H = 600;
     
-    // --- FPS CONTROL VARIABLES ---
-    let lastTime = 0;
-    const targetFPS = 60;
-    const frameInterval = 1000 / targetFPS; 
+    // --- FIXED TIMESTEP ---
+    // The physics always advances in 60 Hz steps, however fast the device
+    // renders; draw() interpolates between the last two steps.
+    const STEP_MS = 1000 / 60;
+    const MAX_FRAME_MS = 250;        // longer gaps (tab hidden, GC pause) are clamped
+    const MAX_STEPS_PER_FRAME = 5;   // then the backlog is dropped instead of spiralling
+    let lastTime = 0, accumulator = 0;
+
+    // --- FRAME TIMING ---
+    const FRAME_SAMPLES = 600;
+    const frameTimes = new Float32Array(FRAME_SAMPLES);
+    let frameCount = 0, droppedFrames = 0, droppedSteps = 0;
+    function recordFrame(ms) {{
+        frameTimes[frameCount % FRAME_SAMPLES] = ms; frameCount++;
+        if (ms > STEP_MS * 1.5) droppedFrames += Math.round(ms / STEP_MS) - 1;
+    }}
+    function frameStats() {{
+        const n = Math.min(frameCount, FRAME_SAMPLES);
+        if (n === 0) return null;
+        const sorted = frameTimes.slice(0, n).sort();
+        const pct = q => Math.round(sorted[Math.min(n - 1, Math.round(q * (n - 1)))] * 10) / 10;
+        return {{ frames: frameCount, p50_ms: pct(0.5), p95_ms: pct(0.95), dropped: droppedFrames, dropped_steps: droppedSteps }};
+    }}
 
-    let platforms = [], brokenParts = [], score = 0;
+    // --- OBJECT POOLS ---
+    // Platforms and debris are recycled from fixed-size pools; the live ones are
+    // packed at the front (oldest first), so nothing is allocated mid-game.
+    const MAX_PLATFORMS = 64, MAX_PARTS = 16;
+    const PLATFORM_W = 60, PLATFORM_H = 15;
+    const platforms = Array.from({{ length: MAX_PLATFORMS }}, () => ({{ x: 0, y: 0, py: 0, w: PLATFORM_W, h: PLATFORM_H, type: 'standard', hasSpring: false, springAnim: 0, dead: false }}));
+    const brokenParts = Array.from({{ length: MAX_PARTS }}, () => ({{ x: 0, y: 0, py: 0, w: PLATFORM_W/2, h: PLATFORM_H, vy: 0, rot: 0, prot: 0, type: 'left', dead: false }}));
+    let platformCount = 0, partCount = 0, score = 0;
     let highScore = localStorage.getItem('doodleHighScore') || 0;
     let gameRunning = false, isGameOverAnimating = false;
-    const doodler = {{ x: GAME_W / 2 - 20, y: GAME_H - 150, w: 60, h: 60, vx: 0, vy: 0, dir: 1 }};
+    const doodler = {{ x: GAME_W / 2 - 20, y: GAME_H - 150, px: 0, py: 0, w: 60, h: 60, vx: 0, vy: 0, dir: 1 }};
     const keys = {{ left: false, right: false }};
     
     window.addEventListener('keydown', e => {{ if(e.key==="ArrowLeft") keys.left=true; if(e.key==="ArrowRight") keys.right=true; }});
@@ -1124,22 +722,44 @@ def render_game_html():
     canvas.addEventListener('touchend', e => {{ e.preventDefault(); keys.left = false; keys.right = false; }});
 
     function init() {{
-        platforms = []; brokenParts = []; score = 0;
-        doodler.x = GAME_W / 2 - 30; doodler.y = GAME_H - 150; doodler.vy = 0; doodler.dir = 1;
-        let startY = GAME_H - 50; platforms.push(createPlatform(GAME_W/2 - 30, startY, 'standard'));
+        platformCount = 0; partCount = 0; score = 0;
+        doodler.x = doodler.px = GAME_W / 2 - 30; doodler.y = doodler.py = GAME_H - 150; doodler.vy = 0; doodler.dir = 1;
+        let startY = GAME_H - 50; createPlatform(GAME_W/2 - 30, startY, 'standard');
         let currentY = startY;
         while (currentY > 0) {{ currentY -= 50; generatePlatform(currentY, true); }}
     }}
     function createPlatform(x, y, type) {{
-        return {{ x, y, w: 60, h: 15, type: type, hasSpring: (type==='standard' && Math.random()<0.05), springAnim: 0 }};
+        if (platformCount === MAX_PLATFORMS) return null;
+        const p = platforms[platformCount++];
+        p.x = x; p.y = p.py = y; p.type = type; p.hasSpring = (type==='standard' && Math.random()<0.05); p.springAnim = 0; p.dead = false;
+        return p;
     }}
     function generatePlatform(y, forceSafe=false) {{
         let type = 'standard';
-        if (platforms.length > 0 && platforms[platforms.length-1].type==='breakable') forceSafe=true;
+        if (platformCount > 0 && platforms[platformCount-1].type==='breakable') forceSafe=true;
         if (!forceSafe && Math.random()<0.15) type='breakable';
-        platforms.push(createPlatform(Math.random()*(GAME_W-60), y, type));
+        createPlatform(Math.random()*(GAME_W-PLATFORM_W), y, type);
+    }}
+    // Moves the live objects to the front of the pool, keeping their order; the
+    // dead ones are swapped to the back and reused by the next create call.
+    function compactPool(pool, count) {{
+        let n = 0;
+        for (let i = 0; i < count; i++) {{
+            const o = pool[i];
+            if (o.dead || o.y >= GAME_H) continue;
+            if (i !== n) {{ pool[i] = pool[n]; pool[n] = o; }}
+            n++;
+        }}
+        return n;
+    }}
+    // Remembers where everything was before this step, for interpolation.
+    function savePrevious() {{
+        doodler.px = doodler.x; doodler.py = doodler.y;
+        for (let i = 0; i < platformCount; i++) platforms[i].py = platforms[i].y;
+        for (let i = 0; i < partCount; i++) {{ const bp = brokenParts[i]; bp.py = bp.y; bp.prot = bp.rot; }}
     }}
     function update() {{
+        savePrevious();
         if (isGameOverAnimating) {{
             doodler.vy += 0.0575; if (doodler.vy > 4.6) doodler.vy = 4.6;
             doodler.y += doodler.vy; doodler.x += Math.sin(doodler.y * 0.02) * 1.5;
@@ -1153,27 +773,39 @@ def render_game_html():
         
         let centerX = doodler.x + doodler.w/2; let feetY = doodler.y + doodler.h;
         if (doodler.vy > 0) {{
-            platforms.forEach((p, index) => {{
-                if(p.broken) return;
+            let broke = false;
+            for (let i = 0; i < platformCount; i++) {{
+                const p = platforms[i];
+                if (p.dead) continue;
                 if (feetY >= p.y && feetY <= p.y + p.h + 10 && centerX >= p.x && centerX <= p.x + p.w) {{
-                    if (p.type === 'breakable') {{ createBrokenPlatform(p); platforms.splice(index, 1); }}
+                    if (p.type === 'breakable') {{ createBrokenPlatform(p); p.dead = true; broke = true; }}
                     else {{ if (p.hasSpring) {{ doodler.vy = -20; p.springAnim = 10; }} else {{ doodler.vy = JUMP_FORCE; }} }}
                 }}
-            }});
+            }}
+            if (broke) platformCount = compactPool(platforms, platformCount);
         }}
         if (doodler.y < GAME_H * 0.45) {{
             let diff = (GAME_H * 0.45) - doodler.y; doodler.y = GAME_H * 0.45;
-            score += Math.floor(diff); platforms.forEach(p => p.y += diff); brokenParts.forEach(bp => bp.y += diff);
-            platforms = platforms.filter(p => p.y < GAME_H); brokenParts = brokenParts.filter(bp => bp.y < GAME_H);
-            let topPlat = platforms[platforms.length - 1];
+            score += Math.floor(diff);
+            for (let i = 0; i < platformCount; i++) platforms[i].y += diff;
+            for (let i = 0; i < partCount; i++) brokenParts[i].y += diff;
+            platformCount = compactPool(platforms, platformCount); partCount = compactPool(brokenParts, partCount);
+            let topPlat = platformCount > 0 ? platforms[platformCount - 1] : null;
             if (topPlat && topPlat.y > 60) generatePlatform(topPlat.y - (30 + Math.random() * 30), false);
         }}
-        brokenParts.forEach(bp => {{ bp.vy += GRAVITY; bp.y += bp.vy; bp.rot += 0.15; }});
+        for (let i = 0; i < platformCount; i++) if (platforms[i].springAnim > 0) platforms[i].springAnim--;
+        for (let i = 0; i < partCount; i++) {{ const bp = brokenParts[i]; bp.vy += GRAVITY; bp.y += bp.vy; bp.rot += 0.15; }}
         if (doodler.y > GAME_H) triggerGameOverSequence();
     }}
+    function createBrokenPart(x, y, vy, type) {{
+        if (partCount === MAX_PARTS) partCount = compactPool(brokenParts, partCount);
+        if (partCount === MAX_PARTS) return;  // debris is cosmetic; drop it rather than allocate
+        const bp = brokenParts[partCount++];
+        bp.x = x; bp.y = bp.py = y; bp.vy = vy; bp.rot = bp.prot = 0; bp.type = type; bp.dead = false;
+    }}
     function createBrokenPlatform(p) {{
-        brokenParts.push({{ x: p.x, y: p.y, w: p.w/2, h: p.h, vy: -2, rot: 0, type: 'left' }});
-        brokenParts.push({{ x: p.x + p.w/2, y: p.y, w: p.w/2, h: p.h, vy: -1, rot: 0, type: 'right' }});
+        createBrokenPart(p.x, p.y, -2, 'left');
+        createBrokenPart(p.x + p.w/2, p.y, -1, 'right');
     }}
     
     function triggerGameOverSequence() {{
@@ -1185,58 +817,90 @@ def render_game_html():
         
         canvas.style.pointerEvents = 'none';
 
-        platforms = []; brokenParts = []; doodler.y = -70; doodler.vy = 0;
+        platformCount = 0; partCount = 0; doodler.y = doodler.py = -70; doodler.vy = 0;
         const goScreen = document.getElementById('game-over-screen');
         goScreen.classList.remove('hidden'); void goScreen.offsetWidth; goScreen.classList.add('slide-up');
         document.getElementById('score-display').classList.add('fade-out');
     }}
 
-    function drawScribbleFill(x, y, w, h, color) {{
-        ctx.strokeStyle = color; ctx.lineWidth = 2; ctx.beginPath();
-        for (let i = y + 4; i < y + h - 2; i += 3) {{ ctx.moveTo(x + 5, i); ctx.bezierCurveTo(x + w/3, i - 2, x + 2*w/3, i + 2, x + w - 5, i); }}
-        ctx.stroke();
+    // --- SPRITES ---
+    // The scribbled art is deterministic, so each piece is painted once on an
+    // offscreen canvas and every frame is just a handful of drawImage calls.
+    const SPRITE_PAD = 4;
+    const scoreDisplay = document.getElementById('score-display'); let shownScore = -1;
+    const DOODLER_SPRITE_W = 70, DOODLER_SPRITE_H = 60;
+    const GREEN_OUTLINE = '#3e611f', GREEN_FILL = '#67c22e', BROWN_OUTLINE = '#5c3a1f', BROWN_FILL = '#a5681c';
+
+    function drawScribbleFill(g, x, y, w, h, color) {{
+        g.strokeStyle = color; g.lineWidth = 2; g.beginPath();
+        for (let i = y + 4; i < y + h - 2; i += 3) {{ g.moveTo(x + 5, i); g.bezierCurveTo(x + w/3, i - 2, x + 2*w/3, i + 2, x + w - 5, i); }}
+        g.stroke();
     }}
-    function drawFlattenedRoughOval(x, y, w, h, outlineColor, fillColor) {{
-        drawScribbleFill(x, y, w, h, fillColor); ctx.strokeStyle = outlineColor; ctx.lineWidth = 2;
+    function drawFlattenedRoughOval(g, x, y, w, h, outlineColor, fillColor) {{
+        drawScribbleFill(g, x, y, w, h, fillColor); g.strokeStyle = outlineColor; g.lineWidth = 2;
         for(let i=0; i<2; i++) {{
-            let offset = i === 0 ? 0 : 1.5; ctx.beginPath();
-            ctx.moveTo(x + 5, y + offset); ctx.quadraticCurveTo(x + w/2, y - 2 + offset, x + w - 5, y + offset);
-            ctx.quadraticCurveTo(x + w + 2, y + h/2 + offset, x + w - 5, y + h + offset);
-            ctx.quadraticCurveTo(x + w/2, y + h + 2 + offset, x + 5, y + h + offset);
-            ctx.quadraticCurveTo(x - 2, y + h/2 + offset, x + 5, y + offset); ctx.stroke();
+            let offset = i === 0 ? 0 : 1.5; g.beginPath();
+            g.moveTo(x + 5, y + offset); g.quadraticCurveTo(x + w/2, y - 2 + offset, x + w - 5, y + offset);
+            g.quadraticCurveTo(x + w + 2, y + h/2 + offset, x + w - 5, y + h + offset);
+            g.quadraticCurveTo(x + w/2, y + h + 2 + offset, x + 5, y + h + offset);
+            g.quadraticCurveTo(x - 2, y + h/2 + offset, x + 5, y + offset); g.stroke();
         }}
     }}
-    function draw() {{
-        ctx.clearRect(0, 0, GAME_W, GAME_H); ctx.lineCap = 'round'; ctx.lineJoin = 'round';
-        platforms.forEach(p => {{
-            const greenOutline = '#3e611f'; const greenFill = '#67c22e'; const brownOutline = '#5c3a1f'; const brownFill = '#a5681c';
-            if (p.type === 'standard') {{
-                drawFlattenedRoughOval(p.x, p.y, p.w, p.h, greenOutline, greenFill);
-                if (p.hasSpring) {{ drawSpring(p.x + p.w - 25, p.y - 10, p.springAnim > 0); if(p.springAnim > 0) p.springAnim--; }}
-            }} else if (p.type === 'breakable') {{
-                drawFlattenedRoughOval(p.x, p.y, p.w, p.h, brownOutline, brownFill);
-                ctx.strokeStyle = brownOutline; ctx.lineWidth = 2; ctx.beginPath(); ctx.moveTo(p.x + p.w/2, p.y); ctx.lineTo(p.x + p.w/2, p.y + p.h); ctx.stroke();
-            }}
-        }});
-        brokenParts.forEach(bp => {{ ctx.save(); ctx.translate(bp.x + bp.w/2, bp.y + bp.h/2); ctx.rotate(bp.type === 'left' ? -bp.rot : bp.rot); drawFlattenedRoughOval(-bp.w/2, -bp.h/2, bp.w, bp.h, '#5c3a1f', '#a5681c'); ctx.restore(); }});
-        drawDoodler(); if(!isGameOverAnimating) document.getElementById('score-display').innerText = score;
-    }}
-    function drawSpring(x, y, compressed) {{
-        ctx.fillStyle = '#ccc'; ctx.strokeStyle = '#000'; ctx.lineWidth = 1; let h = compressed ? 5 : 10; let yOff = compressed ? 5 : 0;
-        ctx.beginPath(); ctx.rect(x, y + yOff, 14, h); ctx.fill(); ctx.stroke(); ctx.beginPath(); ctx.moveTo(x, y+yOff+3); ctx.lineTo(x+14, y+yOff+3); ctx.stroke();
+    function drawSpring(g, x, y, compressed) {{
+        g.fillStyle = '#ccc'; g.strokeStyle = '#000'; g.lineWidth = 1; let h = compressed ? 5 : 10; let yOff = compressed ? 5 : 0;
+        g.beginPath(); g.rect(x, y + yOff, 14, h); g.fill(); g.stroke(); g.beginPath(); g.moveTo(x, y+yOff+3); g.lineTo(x+14, y+yOff+3); g.stroke();
     }}
-    function drawDoodler() {{
-        ctx.save(); let cx = doodler.x + doodler.w/2; let cy = doodler.y + doodler.h/2;
-        ctx.translate(cx, cy); if (doodler.dir === -1) ctx.scale(-1, 1);
+    function drawDoodler(g, dir) {{
+        if (dir === -1) g.scale(-1, 1);
         const bodyColor = '#d0e148'; const stripeColor = '#5e8c31'; const outlineColor = '#000';
-        ctx.lineWidth = 3; ctx.fillStyle = bodyColor; ctx.strokeStyle = outlineColor;
-        ctx.beginPath(); ctx.moveTo(-10, 15); ctx.lineTo(-10, 22); ctx.moveTo(0, 15); ctx.lineTo(0, 22); ctx.moveTo(10, 15); ctx.lineTo(10, 22); ctx.stroke();
-        ctx.beginPath(); ctx.moveTo(-18, 15); ctx.bezierCurveTo(-18, -15, -10, -25, 5, -20); ctx.bezierCurveTo(15, -20, 18, -10, 18, 15); ctx.lineTo(-18, 15); ctx.fill();
-        ctx.save(); ctx.clip(); ctx.fillStyle = stripeColor; ctx.fillRect(-20, 10, 40, 3); ctx.fillRect(-20, 5, 40, 3); ctx.fillRect(-20, 0, 40, 3); ctx.restore(); ctx.stroke();
-        ctx.fillStyle = bodyColor; ctx.beginPath(); ctx.moveTo(15, -12); ctx.lineTo(28, -15); ctx.bezierCurveTo(32, -14, 32, -6, 28, -5); ctx.lineTo(15, -5); ctx.fill(); ctx.stroke();
-        ctx.fillStyle = outlineColor; ctx.beginPath(); ctx.ellipse(28, -10, 2, 4, 0, 0, Math.PI*2); ctx.fill();
-        ctx.fillStyle = outlineColor; ctx.beginPath(); ctx.arc(0, -12, 2, 0, Math.PI*2); ctx.arc(8, -12, 2, 0, Math.PI*2); ctx.fill();
-        ctx.restore();
+        g.lineWidth = 3; g.fillStyle = bodyColor; g.strokeStyle = outlineColor;
+        g.beginPath(); g.moveTo(-10, 15); g.lineTo(-10, 22); g.moveTo(0, 15); g.lineTo(0, 22); g.moveTo(10, 15); g.lineTo(10, 22); g.stroke();
+        g.beginPath(); g.moveTo(-18, 15); g.bezierCurveTo(-18, -15, -10, -25, 5, -20); g.bezierCurveTo(15, -20, 18, -10, 18, 15); g.lineTo(-18, 15); g.fill();
+        g.save(); g.clip(); g.fillStyle = stripeColor; g.fillRect(-20, 10, 40, 3); g.fillRect(-20, 5, 40, 3); g.fillRect(-20, 0, 40, 3); g.restore(); g.stroke();
+        g.fillStyle = bodyColor; g.beginPath(); g.moveTo(15, -12); g.lineTo(28, -15); g.bezierCurveTo(32, -14, 32, -6, 28, -5); g.lineTo(15, -5); g.fill(); g.stroke();
+        g.fillStyle = outlineColor; g.beginPath(); g.ellipse(28, -10, 2, 4, 0, 0, Math.PI*2); g.fill();
+        g.fillStyle = outlineColor; g.beginPath(); g.arc(0, -12, 2, 0, Math.PI*2); g.arc(8, -12, 2, 0, Math.PI*2); g.fill();
+    }}
+    function makeSprite(w, h, paint) {{
+        const c = document.createElement('canvas'); c.width = w; c.height = h;
+        const g = c.getContext('2d'); g.lineCap = 'round'; g.lineJoin = 'round'; paint(g);
+        return c;
+    }}
+    const platformSprite = (w, outline, fill, crack) => makeSprite(w + 2*SPRITE_PAD, PLATFORM_H + 2*SPRITE_PAD + 2, g => {{
+        drawFlattenedRoughOval(g, SPRITE_PAD, SPRITE_PAD, w, PLATFORM_H, outline, fill);
+        if (crack) {{ g.beginPath(); g.moveTo(SPRITE_PAD + w/2, SPRITE_PAD); g.lineTo(SPRITE_PAD + w/2, SPRITE_PAD + PLATFORM_H); g.stroke(); }}
+    }});
+    const doodlerSprite = dir => makeSprite(DOODLER_SPRITE_W, DOODLER_SPRITE_H, g => {{ g.translate(DOODLER_SPRITE_W/2, DOODLER_SPRITE_H/2); drawDoodler(g, dir); }});
+    const SPRITES = {{
+        standard: platformSprite(PLATFORM_W, GREEN_OUTLINE, GREEN_FILL, false),
+        breakable: platformSprite(PLATFORM_W, BROWN_OUTLINE, BROWN_FILL, true),
+        half: platformSprite(PLATFORM_W/2, BROWN_OUTLINE, BROWN_FILL, false),
+        spring: makeSprite(16, 12, g => drawSpring(g, 1, 1, false)),
+        springCompressed: makeSprite(16, 12, g => drawSpring(g, 1, 1, true)),
+        doodlerRight: doodlerSprite(1),
+        doodlerLeft: doodlerSprite(-1),
+    }};
+
+    // alpha: how far (0..1) the render time is between the previous step and the current one.
+    function draw(alpha) {{
+        ctx.clearRect(0, 0, GAME_W, GAME_H);
+        for (let i = 0; i < platformCount; i++) {{
+            const p = platforms[i]; const y = p.py + (p.y - p.py) * alpha;
+            ctx.drawImage(SPRITES[p.type], p.x - SPRITE_PAD, y - SPRITE_PAD);
+            if (p.hasSpring) ctx.drawImage(p.springAnim > 0 ? SPRITES.springCompressed : SPRITES.spring, p.x + p.w - 26, y - 11);
+        }}
+        for (let i = 0; i < partCount; i++) {{
+            const bp = brokenParts[i]; const rot = bp.prot + (bp.rot - bp.prot) * alpha;
+            ctx.save(); ctx.translate(bp.x + bp.w/2, bp.py + (bp.y - bp.py) * alpha + bp.h/2); ctx.rotate(bp.type === 'left' ? -rot : rot);
+            ctx.drawImage(SPRITES.half, -bp.w/2 - SPRITE_PAD, -bp.h/2 - SPRITE_PAD); ctx.restore();
+        }}
+        // no interpolation across the screen-edge wrap
+        const dx = doodler.x - doodler.px;
+        const x = Math.abs(dx) > GAME_W / 2 ? doodler.x : doodler.px + dx * alpha;
+        const y = doodler.py + (doodler.y - doodler.py) * alpha;
+        ctx.drawImage(doodler.dir === -1 ? SPRITES.doodlerLeft : SPRITES.doodlerRight,
+                      x + doodler.w/2 - DOODLER_SPRITE_W/2, y + doodler.h/2 - DOODLER_SPRITE_H/2);
+        if(!isGameOverAnimating && score !== shownScore) {{ scoreDisplay.innerText = score; shownScore = score; }}
     }}
     function startGame() {{
         document.getElementById('start-screen').classList.add('hidden');
@@ -1246,25 +910,28 @@ def render_game_html():
         canvas.style.pointerEvents = 'auto';
         
         isGameOverAnimating = false; init();
+        frameCount = 0; droppedFrames = 0; droppedSteps = 0;
         if (!gameRunning) {{ 
             gameRunning = true; 
-            lastTime = performance.now();
+            lastTime = performance.now(); accumulator = 0;
             requestAnimationFrame(loop); 
         }}
     }}
     
-    // --- UPDATED LOOP WITH FPS THROTTLING ---
+    // --- FIXED-TIMESTEP LOOP ---
     function loop(currentTime) {{
         if (!gameRunning) return;
         requestAnimationFrame(loop);
 
-        const elapsed = currentTime - lastTime;
+        const elapsed = currentTime - lastTime; lastTime = currentTime;
+        if (elapsed <= 0) return;
+        if (elapsed < MAX_FRAME_MS) recordFrame(elapsed);
+        accumulator += Math.min(elapsed, MAX_FRAME_MS);
 
-        if (elapsed > frameInterval) {{
-            lastTime = currentTime - (elapsed % frameInterval);
-            update();
-            draw();
-        }}
+        let steps = 0;
+        while (accumulator >= STEP_MS && steps < MAX_STEPS_PER_FRAME) {{ update(); accumulator -= STEP_MS; steps++; }}
+        if (accumulator >= STEP_MS) {{ droppedSteps += Math.floor(accumulator / STEP_MS); accumulator %= STEP_MS; }}
+        draw(accumulator / STEP_MS);
     }}
 </script>
 </body>
@@ -1275,7 +942,8 @@ def render_game_html():
 def render_connected_game(mis, branch, user_name):
     """Injects USER DATA + BRIDGE into the game."""
     html_content = render_game_html()
-    script_url = st.secrets.get("google_script_url", "")
+    script_url = get_secret("google_script_url", "")
+    send_frame_stats = "true" if get_secret("game_frame_stats", False) else "false"
     
     if not script_url: return html_content
 
@@ -1287,6 +955,7 @@ def render_connected_game(mis, branch, user_name):
         const USER_BRANCH = "{branch}";
         const USER_NAME = "{user_name}"; // <--- NEW: Name Variable
         const GOOGLE_URL = "{script_url}";
+        const SEND_FRAME_STATS = {send_frame_stats}; // secrets: game_frame_stats = true
 
         function sendScoreToBackend(finalScore) {{
             if (!GOOGLE_URL || finalScore === 0) return;
@@ -1300,6 +969,8 @@ def render_connected_game(mis, branch, user_name):
                 name: USER_NAME,  // <--- NEW: Sending Name
                 score: finalScore
             }};
+            // Optional device telemetry: p50/p95 frame time and dropped frames for this run
+            if (SEND_FRAME_STATS) payload.frame_stats = frameStats();
             
             fetch(GOOGLE_URL, {{
                 method: "POST",
@@ -1322,6 +993,289 @@ def render_connected_game(mis, branch, user_name):
     return html_content
 
 
+# --------------------------------------------------
+# 9. PAGE FRAGMENTS
+# --------------------------------------------------
+# Each section re-executes on its own when one of its widgets is used, instead
+# of rerunning the whole script (CSS, load_data, get_schedule, ICS, game...).
+# Inputs are passed in explicitly; a section never reads another one's locals.
+#
+#   schedule_section(table, subs, link_map)  <- get_schedule, load_data
+#   finder_section(venues)                   <- load_data (venue index)
+#   attendance_section(mis, table)           <- get_schedule, session attendance
+#       (the calculator lives here: it is the only other reader of attendance)
+#   game_section(mis, branch, name)          <- get_schedule
+#   render_leaderboard_ui(branch)            <- Google Sheets (see section 8)
+
+def pick_student(mis):
+    st.session_state.mis_no = mis
+    st.session_state.student_query = ""
+
+def on_student_query(students):
+    query = st.session_state.student_query
+    if query in students: pick_student(clean_mis(query))
+
+@st.fragment
+def student_search_section(students):
+    """
+    Search box with suggestions from the student index. Typing reruns only
+    this fragment, and an unknown MIS is answered here instead of costing a
+    get_schedule scan. Secrets: search_by_name (default false; names are
+    looked up from planner.NAME_QUERY_MIN letters, at most SEARCH_LIMIT hits).
+    """
+    by_name_allowed = bool(get_secret("search_by_name", False))
+    st.text_input("Enter MIS No:", placeholder="e.g. 612572034" + (" or your name" if by_name_allowed else ""),
+                  key="student_query", on_change=on_student_query, args=(students,))
+    if st.session_state.mis_no: st.rerun()   # picked in a callback; switch the whole page over
+    query = st.session_state.student_query
+    if not query: return
+    by_name = not clean_mis(query).isdigit()
+    if by_name and not by_name_allowed:
+        st.warning("Search by MIS number.")
+        return
+    if by_name and sum(map(len, planner.name_tokens(query))) < planner.NAME_QUERY_MIN:
+        st.caption(f"Type at least {planner.NAME_QUERY_MIN} letters of the name.")
+        return
+    with timer("student_search"):
+        hits = students.search(query)
+    if not hits:
+        st.warning("No student matches that name." if by_name else "No student matches that MIS.")
+        return
+    st.caption("Did you mean:")
+    for mis, name, branch in hits:
+        st.button(f"{mis} · {name or 'Unknown'} · {branch or 'General'}", key=f"pick_{mis}", on_click=pick_student, args=(mis,))
+
+@st.fragment
+def schedule_section(table, subs, link_map):
+    # --- 1. WEEKLY SCHEDULE ---
+    st.markdown("""<h3 style="font-size: 28px; font-weight: 700; margin: 20px 0; background: linear-gradient(to right, #6a11cb, #fbc2eb); -webkit-background-clip: text; -webkit-text-fill-color: transparent;">🗓️ Weekly Schedule</h3>""", unsafe_allow_html=True)
+    if table:
+        st.markdown(render_grid(table), unsafe_allow_html=True)
+    else:
+        st.warning("No schedule found.")
+
+    # --- ALLOCATED SUBJECTS ---
+    with st.expander("Subject Allocation List", expanded=False):
+        st.markdown(render_subject_html(subs, link_map), unsafe_allow_html=True)
+
+@st.fragment
+def finder_section(venues):
+    # --- NEW: SMART VACANT ROOM FINDER ---
+    st.markdown("""<hr style="border:1px solid rgba(128,128,128,0.2); margin: 40px 0;">""", unsafe_allow_html=True)
+
+    # Container for the tool
+    st.markdown("""
+    <div class="finder-container">
+        <h3 style="background: linear-gradient(to right, #4ade80, #2575fc); -webkit-background-clip: text; -webkit-text-fill-color: transparent; font-weight: 800; margin-bottom: 5px;">
+            🔍 Empty Classroom Finder
+        </h3>
+        <p style="font-size: 14px; opacity: 0.7; margin-bottom: 20px;">
+            Find a quiet place to study or chill right now.
+        </p>
+    """, unsafe_allow_html=True)
+
+    # --- Logic for Defaults (Smart Auto-Select) ---
+    now = datetime.now()
+    current_day = now.strftime("%A")
+
+    days_list = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday"]
+    slots = ["8:30", "9:30", "10:30", "11:30", "12:30", "13:30", "14:30", "15:30", "16:30", "17:30"]
+
+    # Initialize defaults to Monday 8:30 (Index 0, 0)
+    def_day_idx = 0 
+    def_time_idx = 0
+
+    # SMART CHECK: Only auto-select if today is Mon-Sat...
+    if current_day in days_list:
+        curr_mins = now.hour * 60 + now.minute
+
+        # ...AND current time is within the valid schedule range (8:30 to 18:30)
+        # We iterate to find which slot the student is currently sitting in.
+        for i, s in enumerate(slots):
+            h, m = map(int, s.split(':'))
+            slot_mins = h * 60 + m
+
+            # If current time is within a slot (e.g., 10:45 falls in 10:30-11:30)
+            if slot_mins <= curr_mins < (slot_mins + 60):
+                def_day_idx = days_list.index(current_day)
+                def_time_idx = i
+                break
+
+    # --- Controls UI ---
+    c_find_1, c_find_2, c_find_floor, c_find_3 = st.columns([2, 2, 2, 1])
+
+    with c_find_1:
+        selected_day = st.selectbox("Select Day", days_list, index=def_day_idx)
+
+    with c_find_2:
+        selected_time = st.selectbox("Select Time", slots, index=def_time_idx)
+
+    with c_find_floor:
+        floor_options = [None] + venues.floors()
+        selected_floor = st.selectbox("Floor", floor_options, format_func=lambda f: "Any Floor" if f is None else planner.FLOOR_NAMES.get(f, f"Floor {f}"))
+
+    with c_find_3:
+        st.write("") # Spacer
+        st.write("") # Spacer
+        st.button("Search 🔎", type="primary", key="btn_find_room")
+
+    # --- Calculation & Render ---
+    with timer("finder.vacancy"):
+        h, m = map(int, selected_time.split(':'))
+        vacant_rooms = venues.vacant_until(selected_day, h * 60 + m, floor=selected_floor)
+
+    st.markdown(f"**Found {len(vacant_rooms)} vacant rooms for {selected_day} at {selected_time}:**")
+
+    if vacant_rooms:
+        # We build the string in a single line to avoid Markdown indentation errors
+        cards_html = '<div class="vacant-grid">'
+        for room, free_until in vacant_rooms:
+            # Floor comes from data/venues.xlsx; rooms it doesn't list just say "Available"
+            floor_msg = f"{venues.floor_label(room)} · free till {planner.format_minutes(free_until)}"
+
+            # Inject the floor_msg variable into the HTML string
+            cards_html += f'<div class="vacant-card"><h4>{room}</h4><p>{floor_msg}</p></div>'
+
+        cards_html += "</div>"
+        st.markdown(cards_html, unsafe_allow_html=True)
+    else:
+        st.warning("😕 It seems every known classroom is occupied at this time!")
+
+    # --- Next free window for one room (answers what used to take a search per slot) ---
+    c_room, c_next = st.columns([2, 5])
+    with c_room:
+        room = st.selectbox("When is this room free next?", venues.bookable, index=None, placeholder="Pick a room")
+    with c_next:
+        if room:
+            hit = venues.next_free(room, selected_day, h * 60 + m)
+            st.write("") # Spacer
+            if hit:
+                day, start, end = hit
+                st.markdown(f"**{room}** is free on **{day}** from **{planner.format_minutes(start)}** to **{planner.format_minutes(end)}**.")
+            else:
+                st.markdown(f"**{room}** has no free window in teaching hours this week.")
+
+    st.markdown("</div>", unsafe_allow_html=True) # Close Container
+
+def toggle_attendance(mis, code, is_present):
+    attendance_store().mark(get_session_id(), mis, code, not is_present)
+
+@st.fragment
+def attendance_section(mis, table):
+    # --- 2. ATTENDANCE TRACKER ---
+    st.markdown("""<hr style="border:1px solid rgba(128,128,128,0.2); margin: 40px 0;">""", unsafe_allow_html=True)
+    st.markdown("""<h3 style="font-size: 28px; font-weight: 700; margin-bottom: 20px; background: linear-gradient(to right, #6a11cb, #fbc2eb); -webkit-background-clip: text; -webkit-text-fill-color: transparent;">✅ Attendance Tracker</h3>""", unsafe_allow_html=True)
+
+    marks = attendance_store().marks(get_session_id(), mis)
+
+    col_date, col_daily_list = st.columns([1, 3])
+    with col_date:
+        st.markdown("##### Select Date")
+        selected_date = st.date_input("Pick a day", value=date.today(), min_value=SEMESTER_START, max_value=SEMESTER_END)
+        day_name = selected_date.strftime("%A")
+        st.caption(f"Schedule for **{day_name}**")
+
+    with col_daily_list:
+        st.markdown(f"##### Schedule for {selected_date.strftime('%d %B, %Y')}")
+        daily_classes = [t for t in table if t['Day'] == day_name]
+
+        if not daily_classes:
+            st.info("😴 No classes scheduled for this day.")
+        else:
+            daily_classes.sort(key=lambda x: datetime.strptime(x['StartTime'], "%H:%M"))
+            for i, cls in enumerate(daily_classes):
+                code = planner.attendance_code(mis, selected_date, cls['Subject'], cls['Type'], cls['StartTime'])
+                is_present = code in marks
+                border_color = "#6a11cb" if is_present else "rgba(128,128,128,0.2)"
+                c_info, c_action = st.columns([4, 1])
+                with c_info:
+                    st.markdown(f"""<div class="daily-card" style="border-left: 5px solid {border_color};"><div class="daily-info"><h4>{cls['Subject']}</h4><p>⏰ {cls['StartTime']} • {cls['Type']} • 📍 {cls['Venue']}</p></div></div>""", unsafe_allow_html=True)
+                with c_action:
+                    btn_label = "Mark ✓" if not is_present else "Undo ✕"
+                    btn_type = "primary" if not is_present else "secondary"
+                    # The click reruns only this fragment; the callback applies the change first.
+                    st.button(btn_label, key=f"att_{code}", type=btn_type, use_container_width=True, on_click=toggle_attendance, args=(mis, code, is_present))
+
+    # --- 3. CALCULATOR ---
+    st.markdown("""<hr style="border:1px solid rgba(128,128,128,0.2); margin: 40px 0;">""", unsafe_allow_html=True)
+    # ... existing code above ...
+    st.markdown("""<h3 style="font-size: 28px; font-weight: 700; margin-bottom: 20px; background: linear-gradient(to right, #6a11cb, #fbc2eb); -webkit-background-clip: text; -webkit-text-fill-color: transparent;">📊 Attendance Calculator</h3>""", unsafe_allow_html=True)
+
+    total_possible = calculate_semester_totals(table)
+    row_cols = st.columns(3)
+    col_idx = 0
+
+    # Marks carry their subject and type codes, so one pass tallies every subject.
+    attended_by = Counter(planner.attendance_subject_type(code) for code in marks)
+
+    for sub_key, total_count in total_possible.items():
+        subject_name, subject_type = sub_key.split('|')
+        attended = attended_by[(planner.subject_code(subject_name), planner.type_code(subject_type))]
+
+        # 1. Calculate Current Percentage
+        percentage = (attended / total_count * 100) if total_count > 0 else 100.0
+
+        # 2. Define Styles based on Percentage
+        border_grad = "linear-gradient(135deg, #6a11cb, #2575fc)"
+        is_dark = st.session_state.theme == 'dark'
+        bg_color = "rgba(106, 17, 203, 0.05)" if is_dark else "#f0f0f0"
+        msg_color = "#2ecc71" # Green by default
+
+        if percentage < 60:
+            border_grad = "linear-gradient(135deg, #ff9a9e, #fecfef)" 
+            bg_color = "rgba(255, 0, 0, 0.05)" if is_dark else "#fff5f5"
+            msg_color = "#e74c3c"
+        elif percentage < 75:
+            border_grad = "linear-gradient(135deg, #f6d365, #fda085)"
+            bg_color = "rgba(255, 165, 0, 0.05)" if is_dark else "#fffdf5"
+            msg_color = "#e67e22"
+
+        # 3. Calculate "Need to Attend" or "Safe to Bunk"
+        # Formula derived from: (Attended + X) / (Total + X) >= 0.75
+        # Result: X >= 3*Total - 4*Attended
+
+        shortfall_x = (3 * total_count) - (4 * attended)
+
+        status_msg = ""
+
+        if shortfall_x > 0:
+            # Need to attend more
+            status_msg = f"Attend next <b>{shortfall_x}</b> lectures to hit 75%"
+            msg_color = "#e74c3c" if percentage < 75 else "#e67e22"
+        else:
+            # Already above 75%, calculate how many they can miss
+            # Formula: A / (T + Y) >= 0.75  =>  Y <= (4A - 3T) / 3
+            bunkable = int((4 * attended - 3 * total_count) / 3)
+            if bunkable > 0:
+                status_msg = f"On Track! You can miss <b>{bunkable}</b> lectures."
+                msg_color = "#2ecc71"
+            else:
+                status_msg = "On Track! Don't miss the next one."
+                msg_color = "#2ecc71"
+
+        with row_cols[col_idx % 3]:
+            st.markdown(f"""
+            <div class="metric-card" style="border-top: 5px solid transparent; border-image: {border_grad} 1; background-color: {bg_color};">
+                <div class="metric-title">{subject_name} <br> <span style="font-size:10px; opacity:0.7">({subject_type})</span></div>
+                <div class="metric-value">{percentage:.1f}%</div>
+                <div class="metric-sub">{attended} / {total_count} Conducted</div>
+            </div>
+            """, unsafe_allow_html=True)
+
+            st.markdown(f"<div style='text-align:center; margin-top:10px; color:{msg_color}; font-weight:600; font-size:14px;'>{status_msg}</div>", unsafe_allow_html=True)
+            st.write("") 
+        col_idx += 1
+
+@st.fragment
+def game_section(mis, branch, name):
+    st.markdown("""<h3 style="font-size: 28px; font-weight: 700; margin-bottom: 20px; background: linear-gradient(to right, #6a11cb, #fbc2eb); -webkit-background-clip: text; -webkit-text-fill-color: transparent;">🎮 Stress Buster</h3>""", unsafe_allow_html=True)
+
+    # Render Game
+    with timer("game.render"):
+        game_html = render_connected_game(mis, branch, name)
+    components.html(game_html, height=650, scrolling=False)
+
+
 # --------------------------------------------------
 # 7. MAIN APPLICATION
 # --------------------------------------------------
@@ -1329,10 +1283,22 @@ def render_connected_game(mis, branch, user_name):
 # Ensure score processing happens FIRST
 if 'mis_no' not in st.session_state:
     st.session_state.mis_no = ""
-if 'attendance' not in st.session_state:
-    st.session_state.attendance = load_attendance()
 
-sub_dfs, sched_df, link_map = load_data()
+# ADMIN VIEWS (?admin=<token>&view=metrics|prometheus)
+admin_view = st.query_params.get("view")
+if admin_view in ("metrics", "prometheus") and is_admin():
+    if admin_view == "metrics":
+        st.json(attendance_store().metrics())
+    else:
+        st.code(REGISTRY.prometheus(), language="text")
+    st.stop()
+
+with timer("load_data"):
+    # Held for the whole run: a reload swapping in meanwhile does not change what this page sees
+    data = data_manager().current()
+    sub_dfs, sched_df, data_version = data.sub_dfs, data.sched_df, data.version
+    link_map = load_link_map(get_links_version())
+    validation = data.derived["validation"]
 
 # HEADER with Theme Toggle
 h1_col, toggle_col = st.columns([8, 1])
@@ -1355,27 +1321,23 @@ if not sub_dfs or sched_df is None:
 else:
     # INPUT SECTION
     if not st.session_state.mis_no:
-        mis_input = st.text_input("Enter MIS No:", placeholder="e.g. 612572034")
-        if mis_input:
-            st.session_state.mis_no = mis_input
-            st.rerun()
+        student_search_section(data.derived["students"])
     else:
         mis = st.session_state.mis_no
         c1, c2 = st.columns([9, 1])
         with c2: 
             if st.button("Change User", type="secondary"):
+                attendance_store().detach(get_session_id())
                 st.session_state.mis_no = ""
                 st.rerun()
 
-        subs, table, name, branch = get_schedule(mis, sub_dfs, sched_df)
+        with timer("get_schedule"):
+            subs, table, name, branch = get_schedule_cached(mis, sub_dfs, sched_df, data_version)
 
         if subs:
             # --- PROFILE ---
             st.markdown(f"""<div class="student-card"><div class="student-name">{name}</div><div class="student-meta">{branch} • MIS: {mis}</div></div>""", unsafe_allow_html=True)
 
-            # --- 1. WEEKLY SCHEDULE ---
-            st.markdown("""<h3 style="font-size: 28px; font-weight: 700; margin: 20px 0; background: linear-gradient(to right, #6a11cb, #fbc2eb); -webkit-background-clip: text; -webkit-text-fill-color: transparent;">🗓️ Weekly Schedule</h3>""", unsafe_allow_html=True)
-            
             if table:
                 st.sidebar.markdown("---")
                 st.sidebar.markdown(f"""
@@ -1383,245 +1345,66 @@ else:
                 <p style='font-size: 11px; margin-bottom: 10px; background: linear-gradient(90deg, #E0C3FC, #8EC5FC); -webkit-background-clip: text; -webkit-text-fill-color: transparent; font-weight: 600;'>One click to add your entire semester schedule to your phone.</p>
                 """, unsafe_allow_html=True)
                 
-                master_ics_data = generate_master_ics(table, SEMESTER_END)
+                with timer("ics.build"):
+                    master_ics_data = generate_master_ics(table, SEMESTER_END)
                 st.sidebar.download_button(label="📥 Sync Full Semester", data=master_ics_data, file_name=f"My_Semester_Timetable_{mis}.ics", mime="text/calendar")
+                # Subscribed calendars pick up timetable changes on their own (served by api.py)
+                feed_base = get_secret("calendar_feed_url", "")
+                if feed_base:
+                    feed_url = f"{feed_base.rstrip('/')}/v1/feed/{clean_mis(mis)}.ics"
+                    st.sidebar.link_button("🔄 Subscribe (auto-updates)", "webcal://" + feed_url.split("://", 1)[-1])
+                    st.sidebar.caption(f"Or add this URL to your calendar app: {feed_url}")
                 
                 if st.sidebar.button("Refresh Data / Clear Cache"):
+                    data_manager().reload()   # swapped in once built; this page keeps the current data
                     st.cache_data.clear()
                     st.rerun()
-                
-                st.markdown(render_grid(table), unsafe_allow_html=True)
-            else:
-                st.warning("No schedule found.")
-
-            # --- ALLOCATED SUBJECTS ---
-            with st.expander("Subject Allocation List", expanded=False):
-                st.markdown(render_subject_html(subs, link_map), unsafe_allow_html=True)
-
-            # ... existing code for displaying timetable grid ...
-            
-            # --- NEW: SMART VACANT ROOM FINDER ---
-            st.markdown("""<hr style="border:1px solid rgba(128,128,128,0.2); margin: 40px 0;">""", unsafe_allow_html=True)
-            
-            # Container for the tool
-            st.markdown("""
-            <div class="finder-container">
-                <h3 style="background: linear-gradient(to right, #4ade80, #2575fc); -webkit-background-clip: text; -webkit-text-fill-color: transparent; font-weight: 800; margin-bottom: 5px;">
-                    🔍 Empty Classroom Finder
-                </h3>
-                <p style="font-size: 14px; opacity: 0.7; margin-bottom: 20px;">
-                    Find a quiet place to study or chill right now.
-                </p>
-            """, unsafe_allow_html=True)
 
-            # --- Logic for Defaults (Smart Auto-Select) ---
-            now = datetime.now()
-            current_day = now.strftime("%A")
-            
-            days_list = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday"]
-            slots = ["8:30", "9:30", "10:30", "11:30", "12:30", "13:30", "14:30", "15:30", "16:30", "17:30"]
-            
-            # Initialize defaults to Monday 8:30 (Index 0, 0)
-            def_day_idx = 0 
-            def_time_idx = 0
-            
-            # SMART CHECK: Only auto-select if today is Mon-Sat...
-            if current_day in days_list:
-                curr_mins = now.hour * 60 + now.minute
-                
-                # ...AND current time is within the valid schedule range (8:30 to 18:30)
-                # We iterate to find which slot the student is currently sitting in.
-                for i, s in enumerate(slots):
-                    h, m = map(int, s.split(':'))
-                    slot_mins = h * 60 + m
-                    
-                    # If current time is within a slot (e.g., 10:45 falls in 10:30-11:30)
-                    if slot_mins <= curr_mins < (slot_mins + 60):
-                        def_day_idx = days_list.index(current_day)
-                        def_time_idx = i
-                        break
-
-            # --- Controls UI ---
-            c_find_1, c_find_2, c_find_3 = st.columns([2, 2, 1])
-            
-            with c_find_1:
-                selected_day = st.selectbox("Select Day", days_list, index=def_day_idx)
-                
-            with c_find_2:
-                selected_time = st.selectbox("Select Time", slots, index=def_time_idx)
-                
-            with c_find_3:
-                st.write("") # Spacer
-                st.write("") # Spacer
-                st.button("Search 🔎", type="primary", key="btn_find_room")
-
-            # --- Calculation & Render ---
-            # --- Calculation & Render ---
-            vacant_rooms = get_vacant_venues(sched_df, selected_day, selected_time)
-            
-            st.markdown(f"**Found {len(vacant_rooms)} vacant rooms for {selected_day} at {selected_time}:**")
-            
-            if vacant_rooms:
-                # We build the string in a single line to avoid Markdown indentation errors
-                cards_html = '<div class="vacant-grid">'
-                for room in vacant_rooms:
-                    # --- FLOOR MAPPING LOGIC START ---
-                    r_clean = str(room).upper().strip()
-                    floor_msg = "Available" # Default fallback
-
-                    if r_clean in ["NC01", "NC02", "NC03", "NC04"]:
-                        floor_msg = "First Floor"
-                    elif r_clean in ["NC05", "NC06", "NC07", "NC08"]:
-                        floor_msg = "Second Floor"
-                    elif r_clean in ["NC09", "NC10"]:
-                        floor_msg = "Third Floor"
-                    elif r_clean in ["NC11", "NC12", "NC13", "NC14"]:
-                        floor_msg = "Fourth Floor"
-                    # --- FLOOR MAPPING LOGIC END ---
-
-                    # Inject the floor_msg variable into the HTML string
-                    cards_html += f'<div class="vacant-card"><h4>{room}</h4><p>{floor_msg}</p></div>'
-                
-                cards_html += "</div>"
-                st.markdown(cards_html, unsafe_allow_html=True)
-            else:
-                st.warning("😕 It seems every known classroom is occupied at this time!")
-            
-            st.markdown("</div>", unsafe_allow_html=True) # Close Container
-            
-            # ... continue to Attendance Tracker ...
-            
-            # --- 2. ATTENDANCE TRACKER ---
-            st.markdown("""<hr style="border:1px solid rgba(128,128,128,0.2); margin: 40px 0;">""", unsafe_allow_html=True)
-            st.markdown("""<h3 style="font-size: 28px; font-weight: 700; margin-bottom: 20px; background: linear-gradient(to right, #6a11cb, #fbc2eb); -webkit-background-clip: text; -webkit-text-fill-color: transparent;">✅ Attendance Tracker</h3>""", unsafe_allow_html=True)
-
-            col_date, col_daily_list = st.columns([1, 3])
-            with col_date:
-                st.markdown("##### Select Date")
-                selected_date = st.date_input("Pick a day", value=date.today(), min_value=SEMESTER_START, max_value=SEMESTER_END)
-                day_name = selected_date.strftime("%A")
-                st.caption(f"Schedule for **{day_name}**")
-
-            with col_daily_list:
-                st.markdown(f"##### Schedule for {selected_date.strftime('%d %B, %Y')}")
-                daily_classes = [t for t in table if t['Day'] == day_name]
-                
-                if not daily_classes:
-                    st.info("😴 No classes scheduled for this day.")
-                else:
-                    daily_classes.sort(key=lambda x: datetime.strptime(x['StartTime'], "%H:%M"))
-                    for i, cls in enumerate(daily_classes):
-                        cls_id = f"{mis}_{selected_date}_{cls['Subject']}_{cls['Type']}_{cls['StartTime']}"
-                        is_present = st.session_state.attendance.get(cls_id, False)
-                        border_color = "#6a11cb" if is_present else "rgba(128,128,128,0.2)"
-                        c_info, c_action = st.columns([4, 1])
-                        with c_info:
-                            st.markdown(f"""<div class="daily-card" style="border-left: 5px solid {border_color};"><div class="daily-info"><h4>{cls['Subject']}</h4><p>⏰ {cls['StartTime']} • {cls['Type']} • 📍 {cls['Venue']}</p></div></div>""", unsafe_allow_html=True)
-                        with c_action:
-                            btn_label = "Mark ✓" if not is_present else "Undo ✕"
-                            btn_type = "primary" if not is_present else "secondary"
-                            if st.button(btn_label, key=cls_id, type=btn_type, use_container_width=True):
-                                if is_present:
-                                    del st.session_state.attendance[cls_id]
-                                    update_attendance_in_sheet(cls_id, "remove")
-                                else:
-                                    st.session_state.attendance[cls_id] = True
-                                    update_attendance_in_sheet(cls_id, "add")
-                                st.rerun()
-
-            # --- 3. CALCULATOR ---
-            st.markdown("""<hr style="border:1px solid rgba(128,128,128,0.2); margin: 40px 0;">""", unsafe_allow_html=True)
-            # ... existing code above ...
-            st.markdown("""<h3 style="font-size: 28px; font-weight: 700; margin-bottom: 20px; background: linear-gradient(to right, #6a11cb, #fbc2eb); -webkit-background-clip: text; -webkit-text-fill-color: transparent;">📊 Attendance Calculator</h3>""", unsafe_allow_html=True)
-            
-            total_possible = calculate_semester_totals(table)
-            row_cols = st.columns(3)
-            col_idx = 0
-            
-            for sub_key, total_count in total_possible.items():
-                subject_name, subject_type = sub_key.split('|')
-                attended = 0
-                for att_id in st.session_state.attendance:
-                    parts = att_id.split('_')
-                    if len(parts) >= 5 and parts[0] == mis and parts[2] == subject_name and parts[3] == subject_type:
-                        attended += 1
-                
-                # 1. Calculate Current Percentage
-                percentage = (attended / total_count * 100) if total_count > 0 else 100.0
-                
-                # 2. Define Styles based on Percentage
-                border_grad = "linear-gradient(135deg, #6a11cb, #2575fc)"
-                is_dark = st.session_state.theme == 'dark'
-                bg_color = "rgba(106, 17, 203, 0.05)" if is_dark else "#f0f0f0"
-                msg_color = "#2ecc71" # Green by default
-
-                if percentage < 60:
-                    border_grad = "linear-gradient(135deg, #ff9a9e, #fecfef)" 
-                    bg_color = "rgba(255, 0, 0, 0.05)" if is_dark else "#fff5f5"
-                    msg_color = "#e74c3c"
-                elif percentage < 75:
-                    border_grad = "linear-gradient(135deg, #f6d365, #fda085)"
-                    bg_color = "rgba(255, 165, 0, 0.05)" if is_dark else "#fffdf5"
-                    msg_color = "#e67e22"
-
-                # 3. Calculate "Need to Attend" or "Safe to Bunk"
-                # Formula derived from: (Attended + X) / (Total + X) >= 0.75
-                # Result: X >= 3*Total - 4*Attended
-                
-                shortfall_x = (3 * total_count) - (4 * attended)
-                
-                status_msg = ""
-                
-                if shortfall_x > 0:
-                    # Need to attend more
-                    status_msg = f"Attend next <b>{shortfall_x}</b> lectures to hit 75%"
-                    msg_color = "#e74c3c" if percentage < 75 else "#e67e22"
-                else:
-                    # Already above 75%, calculate how many they can miss
-                    # Formula: A / (T + Y) >= 0.75  =>  Y <= (4A - 3T) / 3
-                    bunkable = int((4 * attended - 3 * total_count) / 3)
-                    if bunkable > 0:
-                        status_msg = f"On Track! You can miss <b>{bunkable}</b> lectures."
-                        msg_color = "#2ecc71"
-                    else:
-                        status_msg = "On Track! Don't miss the next one."
-                        msg_color = "#2ecc71"
-
-                with row_cols[col_idx % 3]:
-                    st.markdown(f"""
-                    <div class="metric-card" style="border-top: 5px solid transparent; border-image: {border_grad} 1; background-color: {bg_color};">
-                        <div class="metric-title">{subject_name} <br> <span style="font-size:10px; opacity:0.7">({subject_type})</span></div>
-                        <div class="metric-value">{percentage:.1f}%</div>
-                        <div class="metric-sub">{attended} / {total_count} Conducted</div>
-                    </div>
-                    """, unsafe_allow_html=True)
-                    
-                    st.markdown(f"<div style='text-align:center; margin-top:10px; color:{msg_color}; font-weight:600; font-size:14px;'>{status_msg}</div>", unsafe_allow_html=True)
-                    st.write("") 
-                col_idx += 1
+            schedule_section(table, subs, link_map)
+            finder_section(data.derived["venue_index"])
+            attendance_section(mis, table)
 
             # --- 4. GAME SECTION ---
             st.markdown("""<hr style="border:1px solid rgba(128,128,128,0.2); margin: 40px 0;">""", unsafe_allow_html=True)
-            
+
             c_game, c_leaderboard = st.columns([2, 1])
 
             with c_game:
-                st.markdown("""<h3 style="font-size: 28px; font-weight: 700; margin-bottom: 20px; background: linear-gradient(to right, #6a11cb, #fbc2eb); -webkit-background-clip: text; -webkit-text-fill-color: transparent;">🎮 Stress Buster</h3>""", unsafe_allow_html=True)
-                
-                # Render Game
-                game_html = render_connected_game(mis, branch, name)
-                components.html(game_html, height=650, scrolling=False)
-            
+                game_section(mis, branch, name)
+
             with c_leaderboard:
                 # ONLY call the function. Do not add extra st.markdown headers here.
                 render_leaderboard_ui(branch)
-
         else:
             st.error("MIS not found.")
             if st.button("Try Again"):
                 st.session_state.mis_no = ""
                 st.rerun()
 
+# ADMIN: PROFILING PANEL (?admin=<token>)
+REGISTRY.observe("rerun", (time.perf_counter() - _run_started) * 1000)
+if is_admin():
+    with st.sidebar.expander("⏱️ Profiling", expanded=False):
+        st.caption("Recent timings per operation (ring buffer), slowest p95 first.")
+        st.dataframe(pd.DataFrame(REGISTRY.snapshot()), hide_index=True)
+        st.json(REGISTRY.counters())
+        st.download_button("Download metrics (Prometheus)", REGISTRY.prometheus(), file_name="planner_metrics.prom", mime="text/plain")
+    with st.sidebar.expander("🧪 Timetable Check", expanded=False):
+        st.caption(f"{validation['students']} students checked in {validation.get('elapsed_ms', 0)} ms")
+        st.write(f"Student clashes: **{len(validation['student_clashes'])}** · Room double-bookings: **{len(validation['venue_conflicts'])}** · Unreadable cells: **{len(validation['unparseable'])}**")
+        st.download_button("Download report", planner.format_validation_report(validation, data_version), file_name="timetable_validation.txt", mime="text/plain")
+    if hasattr(storage_backend(), "compact_attendance"):
+        with st.sidebar.expander("🧹 Attendance Sheet", expanded=False):
+            sheet_stats = attendance_sheet_stats()
+            st.caption("Undo leaves blank rows behind. Compacting rewrites the column without them; run it from one place at a quiet time.")
+            st.write(f"Rows: **{sheet_stats['rows']}** · Blank or long-form: **{sheet_stats['tombstones']}**" + (" · worth compacting" if sheet_stats["needs_compaction"] else ""))
+            if st.button("Compact now", key="compact_attendance"):
+                try:
+                    result = storage_backend().compact_attendance()
+                    st.success(f"{result['rows']} rows -> {result['live']}")
+                except Exception as e:
+                    st.error(f"Compaction failed; no marks were removed: {e}")
+
 # FOOTER
 footer_color = "var(--footer-color)"
 st.markdown(f"""
@@ -0,0 +1 @@
+"""Benchmarks and synthetic data for the planner core (see bench.run)."""
@@ -0,0 +1,345 @@
+"""
+Load test: N concurrent virtual students against the planner core.
+
+    python -m bench.loadtest                                   # 1..64 students, 15 s per level
+    python -m bench.loadtest --levels 8 32 128 --duration 30 --sheets-latency 400
+    python -m bench.loadtest --data bench/.data/x10 --quota-per-min 300
+    python -m bench.loadtest --backend sqlite --mirror           # local SQLite, Sheets mirrored in the background
+
+Each virtual student runs the start-of-semester flow in a loop: MIS lookup,
+attendance load and a few marks, classroom-finder queries, a leaderboard
+refresh and now and then a game score post. Students share one process the
+way Streamlit sessions do: one dataset, one schedule memo, one attendance
+store.
+
+Google Sheets and the Apps Script score endpoint are replaced by in-memory
+stand-ins (FakeClient, FakeScriptEndpoint) with configurable latency and an
+optional per-minute quota, wired in through storage.use_client().
+
+For every concurrency level the report shows session throughput, tail
+latency and errors. The saturation point is the first level whose throughput
+is less than --knee (default 10%) above the previous level.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import planner  # noqa: E402
+import storage  # noqa: E402
+from metrics import Registry  # noqa: E402
+
+FINDER_DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday"]
+FINDER_SLOTS = ["8:30", "9:30", "10:30", "11:30", "12:30", "13:30", "14:30", "15:30", "16:30", "17:30"]
+
+# --------------------------------------------------
+# STAND-INS FOR GOOGLE SHEETS / APPS SCRIPT
+# --------------------------------------------------
+class QuotaExceeded(Exception):
+    pass
+
+class FakeBackend:
+    """Shared latency model, quota and call counters for every stand-in."""
+
+    def __init__(self, latency_ms, jitter=0.5, quota_per_min=0):
+        self.latency_ms = latency_ms
+        self.jitter = jitter
+        self.quota_per_min = quota_per_min
+        self._lock = threading.Lock()
+        self._window = []
+        self.calls = 0
+        self.quota_errors = 0
+
+    def call(self):
+        with self._lock:
+            self.calls += 1
+            if self.quota_per_min:
+                now = time.time()
+                self._window = [t for t in self._window if now - t < 60]
+                if len(self._window) >= self.quota_per_min:
+                    self.quota_errors += 1
+                    raise QuotaExceeded("429: Quota exceeded for quota metric 'Read requests'")
+                self._window.append(now)
+        spread = self.latency_ms * self.jitter
+        time.sleep(max(0.0, random.uniform(self.latency_ms - spread, self.latency_ms + spread)) / 1000)
+
+class FakeCell:
+    def __init__(self, row, value):
+        self.row, self.col, self.value = row, 1, value
+
+class FakeWorksheet:
+    def __init__(self, backend, title, rows=None):
+        self.backend = backend
+        self.title = title
+        self._rows = rows or []
+        self._lock = threading.Lock()
+
+    def col_values(self, col):
+        self.backend.call()
+        with self._lock:
+            values = [r[col - 1] if len(r) >= col else "" for r in self._rows]
+        while values and not values[-1]: values.pop()   # gspread drops trailing blanks
+        return values
+
+    def get_all_values(self):
+        self.backend.call()
+        with self._lock:
+            return [list(r) for r in self._rows]
+
+    def append_row(self, values, **kwargs):
+        self.backend.call()
+        with self._lock:
+            self._rows.append([str(v) for v in values])
+            return {"updates": {"updatedRange": f"{self.title}!A{len(self._rows)}"}}
+
+    def find(self, query, **kwargs):
+        self.backend.call()
+        with self._lock:
+            for i, r in enumerate(self._rows, start=1):
+                if query in r: return FakeCell(i, query)
+        return None
+
+    def cell(self, row, col):
+        self.backend.call()
+        with self._lock:
+            r = self._rows[row - 1] if row <= len(self._rows) else []
+            return FakeCell(row, r[col - 1] if len(r) >= col else "")
+
+    def delete_rows(self, start, end=None):
+        self.backend.call()
+        with self._lock:
+            del self._rows[start - 1:(end or start)]
+
+    def update_cell(self, row, col, value):
+        self.backend.call()
+        with self._lock:
+            while len(self._rows) < row: self._rows.append([])
+            r = self._rows[row - 1]
+            while len(r) < col: r.append("")
+            r[col - 1] = str(value)
+
+    def clear(self):
+        self.backend.call()
+        with self._lock:
+            self._rows = []
+
+    def update(self, range_name=None, values=None, **kwargs):
+        # Single-column ranges ("A1:A9") only, which is all storage writes
+        self.backend.call()
+        with self._lock:
+            first = int(re.match(r"[A-Z]+(\d+)", range_name).group(1)) if range_name else 1
+            for i, row in enumerate(values or [], start=first):
+                while len(self._rows) < i: self._rows.append([])
+                self._rows[i - 1] = [str(v) for v in row] + self._rows[i - 1][len(row):]
+
+    def batch_clear(self, ranges):
+        self.backend.call()
+        with self._lock:
+            for r in ranges:
+                first, last = (int(n) for n in re.findall(r"\d+", r))
+                for i in range(first - 1, min(last, len(self._rows))):
+                    if self._rows[i]: self._rows[i][0] = ""
+
+class FakeSpreadsheet:
+    def __init__(self, backend, sheets):
+        self.backend = backend
+        self._sheets = sheets
+
+    def worksheets(self):
+        self.backend.call()
+        return list(self._sheets)
+
+    def get_worksheet(self, index):
+        return self._sheets[index] if index < len(self._sheets) else None
+
+    def worksheet(self, title):
+        for ws in self._sheets:
+            if ws.title == title: return ws
+        raise storage.gspread.exceptions.WorksheetNotFound(title)
+
+    def add_worksheet(self, title, rows, cols):
+        ws = FakeWorksheet(self.backend, title)
+        self._sheets.append(ws)
+        return ws
+
+class FakeClient:
+    """gspread.Client look-alike; storage.sheet_url() addresses books by secret name."""
+
+    def __init__(self, backend, existing_marks=0):
+        self.backend = backend
+        marks = [[f"{600000000 + i % 5000}_2026-02-{1 + i % 28:02d}_Seed Subject_THEORY_{8 + i % 9}:30"] for i in range(existing_marks)]
+        self.attendance = FakeWorksheet(backend, "Sheet1", marks)
+        self.leaderboard = FakeWorksheet(backend, "Leaderboard", [["MIS", "Branch", "Name", "Score"]])
+        self._books = {
+            "private_sheet_url": FakeSpreadsheet(backend, [self.attendance]),
+            "game_sheet_url": FakeSpreadsheet(backend, [self.leaderboard]),
+        }
+
+    def open_by_url(self, url):
+        self.backend.call()
+        return self._books[url]
+
+class FakeScriptEndpoint:
+    """Stands in for the Apps Script web app that sendScoreToBackend posts to."""
+
+    def __init__(self, backend, client):
+        self.backend = backend
+        self.client = client
+
+    def post_score(self, mis, branch, name, score):
+        self.backend.call()
+        self.client.leaderboard.append_row([mis, branch, name, score])
+
+# --------------------------------------------------
+# VIRTUAL STUDENTS
+# --------------------------------------------------
+class Planner:
+    """The process-wide state a Streamlit server holds, minus the UI."""
+
+    def __init__(self, folder, backend):
+        self.backend = backend
+        self.sub_dfs, self.sched_df, self.version = planner.load_data(folder)
+        self.venues = planner.VenueIndex(self.sched_df, planner.load_venues(folder))
+        self.memo = planner.LRUMemo(2048)
+        self.store = storage.AttendanceStore(backend)
+        self.students = planner.student_ids(self.sub_dfs)
+
+    def schedule(self, mis):
+        key = (planner.clean_mis(mis), self.version)
+        return self.memo.get_or_compute(key, lambda: planner.get_schedule(mis, self.sub_dfs, self.sched_df))
+
+def random_class_date(rng, day_name):
+    start = planner.SEMESTER_START
+    days = (planner.SEMESTER_END - start).days
+    for _ in range(20):
+        d = start + timedelta(days=rng.randrange(days + 1))
+        if d.strftime("%A") == day_name: return d
+    return start
+
+def student_session(p, endpoint, reg, rng, pool, think_s):
+    def think():
+        if think_s: time.sleep(rng.uniform(0, 2 * think_s))
+
+    mis = rng.choice(pool)
+    session_id = uuid.uuid4().hex
+    with reg.timer("session"):
+        with reg.timer("mis_lookup"):
+            subs, table, name, branch = p.schedule(mis)
+        think()
+        with reg.timer("attendance.load"):
+            marks = p.store.marks(session_id, mis)
+        for cls in rng.sample(table, min(len(table), rng.randint(1, 3))):
+            think()
+            code = planner.attendance_code(mis, random_class_date(rng, cls['Day']), cls['Subject'], cls['Type'], cls['StartTime'])
+            with reg.timer("attendance.mark"):
+                p.store.mark(session_id, mis, code, code not in marks)
+        for _ in range(rng.randint(1, 3)):
+            think()
+            with reg.timer("finder"):
+                planner.get_vacant_venues(p.venues, rng.choice(FINDER_DAYS), rng.choice(FINDER_SLOTS))
+        think()
+        with reg.timer("leaderboard"):
+            p.backend.get_leaderboard()
+        if rng.random() < 0.2:
+            with reg.timer("score.post"):
+                endpoint.post_score(mis, branch, name, rng.randint(100, 5000))
+    p.store.detach(session_id)
+
+def run_level(p, endpoint, students, duration, pool, think_s, seed):
+    reg = Registry()
+    stop = time.time() + duration
+    errors = []
+
+    def worker(i):
+        rng = random.Random(seed * 10007 + i)
+        while time.time() < stop:
+            try:
+                student_session(p, endpoint, reg, rng, pool, think_s)
+            except Exception as e:
+                errors.append(repr(e))
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(students)]
+    t0 = time.time()
+    for t in threads: t.start()
+    for t in threads: t.join()
+    elapsed = time.time() - t0
+
+    ops = {s["op"]: s for s in reg.snapshot()}
+    sessions = ops.get("session", {"count": 0, "p50_ms": 0, "p95_ms": 0, "p99_ms": 0})
+    return {
+        "students": students,
+        "sessions_per_s": round(sessions["count"] / elapsed, 2),
+        "ops_per_s": round(sum(s["count"] for name, s in ops.items() if name != "session") / elapsed, 2),
+        "session_p50_ms": sessions["p50_ms"], "session_p95_ms": sessions["p95_ms"], "session_p99_ms": sessions["p99_ms"],
+        "errors": len(errors),
+        "ops": ops,
+    }
+
+def find_knee(levels, knee):
+    for prev, cur in zip(levels, levels[1:]):
+        if cur["sessions_per_s"] < prev["sessions_per_s"] * (1 + knee):
+            return prev
+    return None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", default=planner.DATA_FOLDER, help="data/-shaped folder (see bench.synth)")
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument("--duration", type=float, default=15, help="seconds per level")
+    parser.add_argument("--students", type=int, default=2000, help="distinct MIS numbers to draw from")
+    parser.add_argument("--think-ms", type=float, default=0, help="mean pause between a student's actions")
+    parser.add_argument("--sheets-latency", type=float, default=250, help="mean Sheets / Apps Script round trip, ms")
+    parser.add_argument("--jitter", type=float, default=0.5, help="latency spread as a fraction of the mean")
+    parser.add_argument("--quota-per-min", type=int, default=0, help="Sheets requests allowed per minute (0 = unlimited)")
+    parser.add_argument("--existing-marks", type=int, default=20000, help="rows already in the attendance sheet")
+    parser.add_argument("--backend", choices=["sheets", "sqlite"], default="sheets")
+    parser.add_argument("--sqlite-path", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), ".data", "loadtest.db"))
+    parser.add_argument("--mirror", action="store_true", help="with --backend sqlite, mirror writes to the Sheets stand-in")
+    parser.add_argument("--sync-sheets", action="store_true", help="block on every Sheets call (no background executor)")
+    parser.add_argument("--knee", type=float, default=0.10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    fake = FakeBackend(args.sheets_latency, args.jitter, args.quota_per_min)
+    client = FakeClient(fake, args.existing_marks)
+    storage.use_client(client)
+    endpoint = FakeScriptEndpoint(fake, client)
+
+    print(f"loading {args.data} ...")
+    backend = storage.make_backend(args.backend, args.sqlite_path, args.mirror, not args.sync_sheets)
+    p = Planner(args.data, backend)
+    pool = random.Random(args.seed).sample(p.students, min(args.students, len(p.students)))
+
+    levels = []
+    print(f"{'students':>8} {'sessions/s':>11} {'ops/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for n in args.levels:
+        r = run_level(p, endpoint, n, args.duration, pool, args.think_ms / 1000, args.seed)
+        levels.append(r)
+        print(f"{n:>8} {r['sessions_per_s']:>11} {r['ops_per_s']:>9} {r['session_p50_ms']:>9} {r['session_p95_ms']:>9} {r['session_p99_ms']:>9} {r['errors']:>7}")
+
+    print(f"\nper-operation latency at {levels[-1]['students']} students:")
+    for op in levels[-1]["ops"].values():
+        print(f"  {op['op']:<18} n={op['count']:<6} p50={op['p50_ms']:<9} p95={op['p95_ms']:<9} p99={op['p99_ms']}")
+    print(f"\nsheets calls: {fake.calls}, quota errors: {fake.quota_errors}")
+
+    knee = find_knee(levels, args.knee)
+    if knee:
+        print(f"saturates at ~{knee['students']} concurrent students ({knee['sessions_per_s']} sessions/s, p95 {knee['session_p95_ms']} ms)")
+    else:
+        print("no saturation within the tested levels")
+
+    if args.json:
+        with open(args.json, "w") as fh:
+            json.dump({"levels": levels, "saturation": knee, "sheets_calls": fake.calls, "quota_errors": fake.quota_errors}, fh, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
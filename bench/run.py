@@ -0,0 +1,166 @@
+"""
+Benchmarks for the planner hot paths on 1x / 10x / 100x synthetic data.
+
+    python -m bench.run                          # 1x and 10x, compared with bench/baseline.json
+    python -m bench.run --scales 1 10 100 --samples 5
+    python -m bench.run --save-baseline          # record these numbers as the new baseline
+
+Each function is timed over a sample of students (or finder queries) and
+reported as p50/p95/max latency plus the tracemalloc peak of one extra,
+traced call. The sample is timed --rounds times and the round with the
+lowest p50 is kept, so a busy moment on the machine does not read as a
+regression. A function regresses when its p50 exceeds the baseline p50 by
+more than --tolerance (and by more than NOISE_FLOOR_MS); the exit code is 1
+if anything regressed, 2 if a scale has no baseline to compare against.
+The baseline records the machine and settings it was taken with ("_meta");
+numbers from a different machine are only roughly comparable.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import planner  # noqa: E402
+from bench import synth  # noqa: E402
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+NOISE_FLOOR_MS = 1.0
+FINDER_DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday"]
+FINDER_SLOTS = ["8:30", "9:30", "10:30", "11:30", "12:30", "13:30", "14:30", "15:30", "16:30", "17:30"]
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+def measure(fn, calls):
+    """Times fn(*args) for each args tuple in calls; one more call is traced for peak memory."""
+    times = []
+    for args in calls:
+        t0 = time.perf_counter()
+        fn(*args)
+        times.append((time.perf_counter() - t0) * 1000)
+    tracemalloc.start()
+    fn(*calls[0])
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        "n": len(times),
+        "p50_ms": round(percentile(times, 50), 3),
+        "p95_ms": round(percentile(times, 95), 3),
+        "max_ms": round(max(times), 3),
+        "peak_kb": round(peak / 1024, 1),
+    }
+
+def measure_best(fn, calls, rounds):
+    return min((measure(fn, calls) for _ in range(rounds)), key=lambda r: r["p50_ms"])
+
+def sample_students(sub_dfs, count, seed=0):
+    mis = planner.student_ids(sub_dfs)
+    return random.Random(seed).sample(mis, min(count, len(mis)))
+
+def render_grid_cold(table):
+    planner._grid_cache.clear()
+    return planner.render_grid(table)
+
+def workbooks(folder):
+    return {f for f in os.listdir(folder) if f.endswith(".xlsx")}
+
+def bench_scale(scale, samples, load_repeat, rounds=1):
+    folder = synth.default_out(scale)
+    # Regenerated when a workbook the source has is missing (e.g. data made before venues.xlsx was scaled)
+    if not os.path.isdir(folder) or not workbooks(planner.DATA_FOLDER) <= workbooks(folder):
+        print(f"  generating {scale}x data in {folder} ...")
+        synth.generate(scale, folder)
+
+    results = {"load_data": measure(planner.load_data, [(folder,)] * load_repeat)}
+    sub_dfs, sched_df, _ = planner.load_data(folder)
+    students = sample_students(sub_dfs, samples)
+    results["get_schedule"] = measure_best(planner.get_schedule, [(m, sub_dfs, sched_df) for m in students], rounds)
+
+    tables = [planner.get_schedule(m, sub_dfs, sched_df)[1] for m in students]
+    tables = [t for t in tables if t] or [[]]
+    rng = random.Random(1)
+    venues = planner.VenueIndex(sched_df, planner.load_venues(folder))
+    queries = [(venues, rng.choice(FINDER_DAYS), rng.choice(FINDER_SLOTS)) for _ in range(samples)]
+    results["get_vacant_venues"] = measure_best(planner.get_vacant_venues, queries, rounds)
+    results["get_free_until"] = measure_best(planner.get_free_until, queries, rounds)
+    results["render_grid"] = measure_best(render_grid_cold, [(t,) for t in tables], rounds)
+    results["generate_master_ics"] = measure_best(planner.generate_master_ics, [(t, planner.SEMESTER_END) for t in tables], rounds)
+    results["calculate_semester_totals"] = measure_best(planner.calculate_semester_totals, [(t,) for t in tables], rounds)
+    return results
+
+def machine_info(args):
+    return {
+        "python": platform.python_version(), "platform": platform.platform(terse=True),
+        "processor": platform.processor() or platform.machine(), "cpus": os.cpu_count(),
+        "samples": args.samples, "load_repeat": args.load_repeat, "rounds": args.rounds, "saved": time.strftime("%Y-%m-%d"),
+    }
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for scale, funcs in results.items():
+        for name, stats in funcs.items():
+            base = baseline.get(scale, {}).get(name)
+            if not base: continue
+            delta = stats["p50_ms"] - base["p50_ms"]
+            if delta > NOISE_FLOOR_MS and stats["p50_ms"] > base["p50_ms"] * (1 + tolerance):
+                regressions.append((scale, name, base["p50_ms"], stats["p50_ms"]))
+    return regressions
+
+def print_report(results, baseline):
+    print(f"{'scale':>6} {'function':<26} {'n':>4} {'p50 ms':>10} {'p95 ms':>10} {'max ms':>10} {'peak KB':>10} {'base p50':>10}")
+    for scale, funcs in results.items():
+        for name, s in funcs.items():
+            base = baseline.get(scale, {}).get(name, {}).get("p50_ms", "")
+            print(f"{scale:>6} {name:<26} {s['n']:>4} {s['p50_ms']:>10} {s['p95_ms']:>10} {s['max_ms']:>10} {s['peak_kb']:>10} {base:>10}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10])
+    parser.add_argument("--samples", type=int, default=20, help="students / finder queries per function")
+    parser.add_argument("--load-repeat", type=int, default=3)
+    parser.add_argument("--rounds", type=int, default=3, help="timed rounds per function; the fastest p50 is kept")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed p50 slowdown (0.25 = 25%%)")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for scale in args.scales:
+        print(f"benchmarking {scale}x ...")
+        results[f"{scale}x"] = bench_scale(scale, args.samples, args.load_repeat, args.rounds)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as fh: baseline = json.load(fh)
+    print_report(results, baseline)
+
+    if args.json:
+        with open(args.json, "w") as fh: json.dump(results, fh, indent=2)
+    if args.save_baseline:
+        baseline.update(results, _meta=machine_info(args))
+        with open(args.baseline, "w") as fh: json.dump(baseline, fh, indent=2)
+        print(f"baseline saved to {args.baseline}")
+        return 0
+
+    missing = [scale for scale in results if scale not in baseline]
+    if missing:
+        print(f"NO BASELINE for {', '.join(missing)} in {args.baseline}; record one with --save-baseline")
+        return 2
+    meta = baseline.get("_meta", {})
+    if meta: print(f"baseline: {meta.get('processor')} x{meta.get('cpus')}, Python {meta.get('python')}, saved {meta.get('saved')}")
+
+    regressions = compare(results, baseline, args.tolerance)
+    for scale, name, before, after in regressions:
+        print(f"REGRESSION {scale} {name}: p50 {before} ms -> {after} ms")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
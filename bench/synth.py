@@ -0,0 +1,104 @@
+"""
+Synthetic, data/-shaped workbooks for benchmarking.
+
+    python -m bench.synth --scale 10            # -> bench/.data/x10
+    python -m bench.synth --scale 100 --out /tmp/x100
+
+Scale k copies the real enrolment sheets, the timetable and the venue
+registry k times. Copy j gets its own MIS numbers, division numbers and venues, so a 10x dataset
+behaves like ten colleges' worth of students sharing one planner.
+"""
+import argparse
+import os
+import re
+import shutil
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from planner import DATA_FOLDER, TIMETABLE_FILE, VENUES_FILE  # noqa: E402
+
+SYNTH_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".data")
+MIS_STRIDE = 10 ** 9
+DIV_STRIDE = 100
+
+def default_out(scale):
+    return os.path.join(SYNTH_ROOT, f"x{scale}")
+
+def _find_col(df, *needles):
+    return next((c for c in df.columns if any(n in str(c).upper() for n in needles)), None)
+
+def _shift_number(text, offset):
+    """'Division 3' -> 'Division 103' for offset 100; non-numeric values are kept."""
+    if pd.isna(text) or not offset: return text
+    return re.sub(r"\d+", lambda m: str(int(m.group()) + offset), str(text), count=1)
+
+def _shift_mis(value, copy):
+    if pd.isna(value) or not copy: return value
+    digits = re.sub(r"\D", "", str(value)[:-2] if str(value).endswith(".0") else str(value))
+    return int(digits) + copy * MIS_STRIDE if digits else value
+
+def _shift_venue(value, copy):
+    if pd.isna(value) or not copy or str(value).strip() in ["-", "", "nan"]: return value
+    return f"{str(value).strip()}/{copy}"
+
+def scale_enrolment(df, scale):
+    mis_col = _find_col(df, "MIS")
+    div_col = _find_col(df, "DIVISION")
+    copies = []
+    for j in range(scale):
+        part = df.copy()
+        if mis_col: part[mis_col] = part[mis_col].map(lambda v: _shift_mis(v, j))
+        if div_col: part[div_col] = part[div_col].map(lambda v: _shift_number(v, j * DIV_STRIDE))
+        copies.append(part)
+    return pd.concat(copies, ignore_index=True)
+
+def scale_timetable(df, scale):
+    div_col = _find_col(df, "DIVISION")
+    venue_col = _find_col(df, "VENUE")
+    copies = []
+    for j in range(scale):
+        part = df.copy()
+        if div_col: part[div_col] = part[div_col].map(lambda v: _shift_number(v, j * DIV_STRIDE))
+        if venue_col: part[venue_col] = part[venue_col].map(lambda v: _shift_venue(v, j))
+        copies.append(part)
+    return pd.concat(copies, ignore_index=True)
+
+def scale_venues(df, scale):
+    venue_col = _find_col(df, "VENUE")
+    copies = []
+    for j in range(scale):
+        part = df.copy()
+        if venue_col: part[venue_col] = part[venue_col].map(lambda v: _shift_venue(v, j))
+        copies.append(part)
+    return pd.concat(copies, ignore_index=True)
+
+def generate(scale, out=None, source=DATA_FOLDER):
+    """Writes a scale-k copy of `source` into `out` and returns the folder."""
+    out = out or default_out(scale)
+    os.makedirs(out, exist_ok=True)
+    for f in sorted(os.listdir(source)):
+        if not f.endswith(".xlsx"): continue
+        src, dst = os.path.join(source, f), os.path.join(out, f)
+        if "link" in f.lower() or scale == 1:
+            shutil.copyfile(src, dst)
+            continue
+        df = pd.read_excel(src)
+        df.columns = df.columns.astype(str).str.strip()
+        if f.lower() == TIMETABLE_FILE.lower(): scaled = scale_timetable(df, scale)
+        elif f.lower() == VENUES_FILE.lower(): scaled = scale_venues(df, scale)
+        else: scaled = scale_enrolment(df, scale)
+        scaled.to_excel(dst, index=False)
+    return out
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=int, default=10)
+    parser.add_argument("--out", default=None)
+    parser.add_argument("--source", default=DATA_FOLDER)
+    args = parser.parse_args(argv)
+    print(generate(args.scale, args.out, args.source))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Hot-path timers for the planner.
+
+Every timed operation keeps a ring buffer of its most recent durations (for
+percentiles) plus cumulative histogram buckets (for Prometheus). Recording a
+sample is a perf_counter call, a deque append and a bisect, so the timers can
+stay on in production.
+
+    from metrics import timer, timed, count
+
+    with timer("load_data"): ...
+    @timed("sheets.load_attendance")
+    def load_attendance(): ...
+    count("cache_miss", cache="load_data")
+"""
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+
+RING_SIZE = 1024
+BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+def _percentile(ordered, pct):
+    if not ordered: return 0.0
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def _labels(labels):
+    return ",".join(f'{k}="{v}"' for k, v in sorted(labels.items()))
+
+class Histogram:
+    def __init__(self):
+        self.recent = deque(maxlen=RING_SIZE)
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)  # last one is +Inf
+        self.count = 0
+        self.total_ms = 0.0
+
+    def observe(self, ms):
+        self.recent.append(ms)
+        self.buckets[bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._collectors = {}
+
+    # --- recording ---
+    def observe(self, name, ms):
+        with self._lock:
+            hist = self._histograms.get(name)
+            if hist is None: hist = self._histograms[name] = Histogram()
+            hist.observe(ms)
+
+    @contextmanager
+    def timer(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, (time.perf_counter() - t0) * 1000)
+
+    def timed(self, name):
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.timer(name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def count(self, name, n=1, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + n
+
+    def add_collector(self, name, fn):
+        """fn() -> {gauge_name: value}, evaluated whenever metrics are read. Re-adding a name replaces it."""
+        self._collectors[name] = fn
+
+    # --- reading ---
+    def _gauges(self):
+        gauges = {}
+        for fn in list(self._collectors.values()):
+            try: gauges.update(fn())
+            except Exception: continue
+        return gauges
+
+    def snapshot(self):
+        """Per-operation stats over the ring buffer, slowest p95 first."""
+        with self._lock:
+            rows = [(name, h.count, sorted(h.recent)) for name, h in self._histograms.items()]
+        stats = [{
+            "op": name, "count": n,
+            "p50_ms": round(_percentile(recent, 50), 2),
+            "p95_ms": round(_percentile(recent, 95), 2),
+            "p99_ms": round(_percentile(recent, 99), 2),
+            "max_ms": round(recent[-1], 2) if recent else 0.0,
+        } for name, n, recent in rows]
+        return sorted(stats, key=lambda s: s["p95_ms"], reverse=True)
+
+    def counters(self):
+        with self._lock:
+            return {f"{name}{{{labels}}}" if labels else name: v for (name, labels), v in self._counters.items()}
+
+    def prometheus(self, prefix="planner"):
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines = [f"# HELP {prefix}_op_duration_seconds Duration of instrumented planner operations.",
+                 f"# TYPE {prefix}_op_duration_seconds histogram"]
+        with self._lock:
+            hists = [(name, list(h.buckets), h.count, h.total_ms) for name, h in sorted(self._histograms.items())]
+            counters = sorted(self._counters.items())
+        for name, buckets, n, total_ms in hists:
+            cumulative = 0
+            for le, c in zip(list(BUCKETS_MS) + ["+Inf"], buckets):
+                cumulative += c
+                le_s = le if le == "+Inf" else f"{le / 1000:g}"
+                lines.append(f'{prefix}_op_duration_seconds_bucket{{op="{name}",le="{le_s}"}} {cumulative}')
+            lines.append(f'{prefix}_op_duration_seconds_sum{{op="{name}"}} {total_ms / 1000:.6f}')
+            lines.append(f'{prefix}_op_duration_seconds_count{{op="{name}"}} {n}')
+        typed = set()
+        for (name, labels), v in counters:
+            if name not in typed:
+                lines.append(f"# TYPE {prefix}_{name}_total counter")
+                typed.add(name)
+            lines.append(f"{prefix}_{name}_total{{{labels}}} {v}" if labels else f"{prefix}_{name}_total {v}")
+        for name, v in sorted(self._gauges().items()):
+            lines.append(f"# TYPE {prefix}_{name} gauge")
+            lines.append(f"{prefix}_{name} {v}")
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+timer = REGISTRY.timer
+timed = REGISTRY.timed
+count = REGISTRY.count
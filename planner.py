@@ -0,0 +1,1520 @@
+"""
+Planner core: data loading, timetable lookup, room vacancy, grid/ICS rendering.
+
+Kept free of Streamlit so it can be reused by the benchmarks and other tools;
+app.py adds the caching and the UI on top.
+"""
+import pandas as pd
+import numpy as np
+import os
+import re
+import zlib
+import json
+import hashlib
+import mmap
+import threading
+import time
+import warnings
+import weakref
+from array import array
+from bisect import bisect_left, bisect_right
+from functools import lru_cache
+from collections import OrderedDict
+from datetime import datetime, timedelta, date
+from difflib import SequenceMatcher
+from email.utils import formatdate, parsedate_to_datetime
+from openpyxl import load_workbook
+
+# --------------------------------------------------
+# CONSTANTS & DATES
+# --------------------------------------------------
+
+DATA_FOLDER = "data"
+TIMETABLE_FILE = "timetable_schedule.xlsx"
+LINKS_FILE = "subjects_links.xlsx"
+VENUES_FILE = "venues.xlsx"
+SEMESTER_START = date(2026, 1, 12)
+SEMESTER_END = date(2026, 5, 7)
+
+# --------------------------------------------------
+# HELPERS
+# --------------------------------------------------
+SUBJECT_GRADIENTS = [
+    "linear-gradient(135deg, #a18cd1 0%, #fbc2eb 100%)", "linear-gradient(135deg, #84fab0 0%, #8fd3f4 100%)",
+    "linear-gradient(135deg, #e0c3fc 0%, #8ec5fc 100%)", "linear-gradient(135deg, #ff9a9e 0%, #fecfef 100%)",
+    "linear-gradient(135deg, #fccb90 0%, #d57eeb 100%)", "linear-gradient(135deg, #fa709a 0%, #fee140 100%)",
+    "linear-gradient(135deg, #4facfe 0%, #00f2fe 100%)", "linear-gradient(135deg, #43e97b 0%, #38f9d7 100%)"
+]
+
+def get_subject_gradient(subject_name):
+    if not subject_name: return SUBJECT_GRADIENTS[0]
+    idx = zlib.adler32(subject_name.encode('utf-8')) % len(SUBJECT_GRADIENTS)
+    return SUBJECT_GRADIENTS[idx]
+
+def correct_subject_name(text):
+    if pd.isna(text): return ""
+    return str(text).replace("Quantun Physics", "Quantum Physics")
+
+def clean_text(text): 
+    if pd.isna(text): return ""
+    return re.sub(r'[^a-z0-9]', '', str(text).lower())
+
+def subject_key(text):
+    """Canonical subject ID shared by enrolments, the timetable and the link map."""
+    return clean_text(correct_subject_name(text))
+
+def clean_mis(text):
+    if pd.isna(text): return ""
+    s = str(text).strip()
+    return clean_text(s[:-2] if s.endswith(".0") else s)
+
+def normalize_division(text):
+    if pd.isna(text): return ""
+    clean = str(text).lower()
+    nums = re.findall(r'\d+', clean)
+    return nums[0] if nums else clean.replace("division", "").replace("div", "").strip()
+
+def normalize_batch(text):
+    if pd.isna(text): return "all"
+    clean = str(text).lower().replace(" ", "")
+    if clean in ["-", "nan", "", "_"]: return "all"
+    nums = re.findall(r'\d+', clean)
+    return f"b{nums[0]}" if nums else "all"
+
+def is_fuzzy_match(str1, str2):
+    if str1 in str2 or str2 in str1: return True
+    return SequenceMatcher(None, str1, str2).ratio() > 0.85
+
+@lru_cache(maxsize=65536)
+def fuzzy_match_cached(str1, str2):
+    return is_fuzzy_match(str1, str2)
+
+CLASS_KINDS = ("THEORY", "LAB", "TUTORIAL")
+
+def class_kind(type_text):
+    """Timetable Type cell -> index into CLASS_KINDS (labs and tutorials are batch-specific)."""
+    type_str = "" if pd.isna(type_text) else str(type_text).lower()
+    return 1 if "lab" in type_str else 2 if "tutorial" in type_str else 0
+
+def day_title(text):
+    return str(text).title().strip()
+
+def parse_time(time_str):
+    """
+    Parses time strings like '10:30 TO 12:30' or '11:00 - 12:30'.
+    Returns:
+       start_str: String (e.g., "11:00")
+       duration: Float (hours, e.g., 1.5)
+    """
+    if pd.isna(time_str): return None, 1.0
+    
+    # Normalize string
+    raw = str(time_str).upper().replace('.', ':').replace('-', ' ').replace('TO', ' ')
+    times = re.findall(r'(\d{1,2}:\d{2})', raw)
+    
+    if not times: return None, 1.0
+    
+    start_str = times[0].lstrip("0")
+    duration = 1.0 # Default
+    
+    if len(times) >= 2:
+        try:
+            t1 = datetime.strptime(start_str, "%H:%M")
+            t2 = datetime.strptime(times[1], "%H:%M")
+            
+            # Handle 12-hour crossover (e.g. 11:30 to 1:30)
+            if t2 < t1:
+                t2 += timedelta(hours=12)
+            
+            diff_mins = (t2 - t1).total_seconds() / 60
+            
+            # Allow for small margin of error (e.g. 85 mins -> 1.5 hrs)
+            if diff_mins > 20:
+                duration = diff_mins / 60.0
+        except: pass
+        
+    return start_str, duration
+
+def map_to_slot(time_str, slots):
+    """
+    Maps a start time (e.g. 11:00) to the nearest previous slot (e.g. 10:30).
+    Allows a delay of up to 30 mins.
+    """
+    try:
+        t = datetime.strptime(time_str, "%H:%M")
+        best, min_diff = None, 999
+        
+        for s in slots:
+            slot_time = datetime.strptime(s, "%H:%M")
+            diff = (t - slot_time).total_seconds() / 60
+            
+            # Logic: We are looking for a slot that is equal to or BEFORE the time
+            # But not too far before (max 30 mins).
+            # e.g. 11:00 matches 10:30 (diff +30)
+            # e.g. 10:30 matches 10:30 (diff 0)
+            if 0 <= diff <= 30:
+                if diff < min_diff:
+                    min_diff = diff
+                    best = s
+        return best
+    except: pass
+    return None
+
+# --- MASTER ICS GENERATION ---
+def event_uid(cls):
+    """Same class, same UID: a re-imported or re-fetched calendar updates its events instead of duplicating them."""
+    key = f"{cls['Day']}|{cls['StartTime']}|{subject_key(cls['Subject'])}|{cls['Type']}"
+    return f"{hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]}@coep-planner"
+
+def generate_master_ics(weekly_schedule, semester_end_date, first_date=None, feed=False):
+    """
+    Weekly recurring events from first_date (default today) to semester_end_date.
+    feed=True adds the calendar name and refresh hints subscribed calendars read.
+    """
+    day_map = { "Monday": "MO", "Tuesday": "TU", "Wednesday": "WE", "Thursday": "TH", "Friday": "FR", "Saturday": "SA", "Sunday": "SU" }
+    ics_lines = [ "BEGIN:VCALENDAR", "VERSION:2.0", "PRODID:-//StudentPortal//MasterTimetable//EN", "CALSCALE:GREGORIAN", "METHOD:PUBLISH" ]
+    if feed:
+        ics_lines += ["X-WR-CALNAME:Semester Timetable", f"REFRESH-INTERVAL;VALUE=DURATION:{FEED_REFRESH}", f"X-PUBLISHED-TTL:{FEED_REFRESH}"]
+    today = first_date or date.today()
+    uids = {}
+    days_list = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+    for cls in weekly_schedule:
+        try:
+            target_day_name = cls['Day'] 
+            if target_day_name not in days_list: continue
+            
+            target_idx = days_list.index(target_day_name)
+            current_idx = today.weekday()
+            days_ahead = target_idx - current_idx if target_idx >= current_idx else 7 - (current_idx - target_idx)
+            start_date = today + timedelta(days=days_ahead)
+            
+            start_h, start_m = map(int, cls['StartTime'].split(':'))
+            
+            # Fix 12-hour crossover for PM classes
+            if start_h < 8:
+                start_h += 12
+
+            dt_start = datetime.combine(start_date, datetime.min.time()).replace(hour=start_h, minute=start_m)
+            # Use a rough int duration for ICS block logic
+            dt_end = dt_start + timedelta(hours=cls.get('Duration', 1)) 
+            
+            fmt = "%Y%m%dT%H%M%S"
+            until_str = semester_end_date.strftime("%Y%m%dT235959")
+            rrule_day = day_map.get(target_day_name, "MO")
+            uid = event_uid(cls)
+            uids[uid] = uids.get(uid, 0) + 1
+            if uids[uid] > 1: uid = f"{uid[:16]}-{uids[uid]}{uid[16:]}"
+            event_block = [
+                "BEGIN:VEVENT", f"UID:{uid}", f"SUMMARY:{cls['Subject']} ({cls['Type']})", f"DTSTART:{dt_start.strftime(fmt)}", f"DTEND:{dt_end.strftime(fmt)}",
+                f"RRULE:FREQ=WEEKLY;BYDAY={rrule_day};UNTIL={until_str}", f"LOCATION:{cls['Venue']}", f"DESCRIPTION:Weekly {cls['Type']} session.",
+                "BEGIN:VALARM", "TRIGGER:-PT15M", "ACTION:DISPLAY", "DESCRIPTION:Reminder", "END:VALARM", "END:VEVENT"
+            ]
+            ics_lines.extend(event_block)
+        except: continue
+    ics_lines.append("END:VCALENDAR")
+    return "\n".join(ics_lines)
+
+# --- ICS FEEDS ---
+# A subscribed calendar polls its URL every few hours. Each distinct timetable
+# is rendered once (a cohort shares one artifact), anchored to the semester
+# start rather than today, so the body, ETag and Last-Modified only change
+# when the timetable itself does - including across data reloads.
+FEED_REFRESH = "PT6H"
+FEED_CACHE_SIZE = 4096
+
+class FeedArtifact:
+    def __init__(self, key, body, modified):
+        self.key = key
+        self.body = body
+        self.modified = int(modified)   # HTTP dates have whole seconds
+        self.etag = f'"{key[:20]}"'
+        self.last_modified = formatdate(self.modified, usegmt=True)
+
+    def not_modified(self, if_none_match=None, if_modified_since=None):
+        """Conditional GET check; If-None-Match wins when both are sent."""
+        if if_none_match: return self.etag in if_none_match or if_none_match.strip() == "*"
+        if if_modified_since:
+            try: return parsedate_to_datetime(if_modified_since).timestamp() >= self.modified
+            except (TypeError, ValueError): return False
+        return False
+
+class FeedStore:
+    """
+    timetable -> FeedArtifact, keyed by timetable_hash. With a directory the
+    rendered feeds are files there, shared by every worker and restart.
+    """
+
+    def __init__(self, directory=None, maxsize=FEED_CACHE_SIZE):
+        self.directory = directory
+        self._memo = LRUMemo(maxsize)
+
+    def get(self, timetable):
+        key = timetable_hash(timetable)
+        return self._memo.get_or_compute(key, lambda: self._load(key, timetable))
+
+    def _load(self, key, timetable):
+        path = os.path.join(self.directory, f"feed-{key}.ics") if self.directory else None
+        if path:
+            try:
+                with open(path, "rb") as fh: return FeedArtifact(key, fh.read(), os.fstat(fh.fileno()).st_mtime)
+            except FileNotFoundError: pass
+        body = generate_master_ics(timetable, SEMESTER_END, first_date=SEMESTER_START, feed=True).encode("utf-8")
+        if not path: return FeedArtifact(key, body, time.time())
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as fh: fh.write(body)
+        os.replace(tmp, path)
+        return FeedArtifact(key, body, os.stat(path).st_mtime)
+
+    def stats(self):
+        return self._memo.stats()
+
+
+def normalize_venue(venue_text):
+    """Cleans up venue names to ensure 'AC 101' matches 'ac101'."""
+    if pd.isna(venue_text) or str(venue_text).strip() in ["-", "", "nan"]:
+        return None
+    return str(venue_text).strip().upper()
+
+# --- VENUE REGISTRY & OCCUPANCY INDEX ---
+FLOOR_NAMES = {0: "Ground Floor", 1: "First Floor", 2: "Second Floor", 3: "Third Floor", 4: "Fourth Floor"}
+WEEK_DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday"]
+DAY_START, DAY_END = 8 * 60 + 30, 18 * 60 + 30   # free windows are clipped to teaching hours
+
+def format_minutes(minutes):
+    return f"{minutes // 60}:{minutes % 60:02d}"
+
+def load_venues(folder=DATA_FOLDER):
+    """
+    venues.xlsx -> {venue: {building, floor, capacity, type, bookable}}.
+    Venues missing from the registry count as bookable rooms on an unknown floor.
+    """
+    venues = {}
+    try:
+        df = pd.read_excel(os.path.join(folder, VENUES_FILE))
+        df.columns = df.columns.astype(str).str.strip().str.lower()
+    except: return venues
+    for row in df.to_dict("records"):
+        name = normalize_venue(row.get("venue"))
+        if not name: continue
+        floor, capacity = row.get("floor"), row.get("capacity")
+        venues[name] = {
+            "building": "" if pd.isna(row.get("building")) else str(row.get("building")).strip(),
+            "floor": None if pd.isna(floor) else int(floor),
+            "capacity": None if pd.isna(capacity) else int(capacity),
+            "type": "" if pd.isna(row.get("type")) else str(row.get("type")).strip().lower(),
+            "bookable": str(row.get("bookable")).strip().lower() not in ["no", "n", "false", "0"],
+        }
+    return venues
+
+def class_minutes(time_value):
+    """Timetable time cell -> (start, end) in minutes after midnight, or None."""
+    start_str, duration = parse_time(time_value)
+    if not start_str: return None
+    try:
+        class_start = datetime.strptime(start_str, "%H:%M")
+    except: return None
+    # AM/PM Fix: If class starts before 8:00, assume PM (e.g. 1:30 -> 13:30)
+    if class_start.hour < 8:
+        class_start = class_start.replace(hour=class_start.hour + 12)
+    s_mins = class_start.hour * 60 + class_start.minute
+    return s_mins, s_mins + int(round(duration * 60))
+
+class VenueIndex:
+    """
+    Registry attributes plus, per day, each venue's busy intervals merged and
+    sorted by start, so "is it free at t" is one bisect per venue. Built once
+    per data generation (a DataManager derive) from that folder's venues.xlsx.
+    """
+
+    def __init__(self, sched_df, venues):
+        self.venues = venues
+        self.busy = {}   # day -> venue -> ([starts], [ends])
+        known = set(venues)
+        if sched_df is not None and not sched_df.empty:
+            cols, vocab = schema_of(sched_df, "timetable"), sched_df.attrs["vocab"]
+            names = vocab.mapped(normalize_venue)
+            if "venue" in cols:
+                known.update(v for v in (names[c] for c in np.unique(codes_of(sched_df, cols["venue"])).tolist()) if v)
+            if "venue" in cols and "day" in cols and "time" in cols:
+                raw = {}
+                days, minutes = vocab.mapped(day_title), vocab.mapped(class_minutes)
+                for day, time_code, venue in zip(*(codes_of(sched_df, cols[f]).tolist() for f in ("day", "time", "venue"))):
+                    venue, span = names[venue], minutes[time_code]
+                    if venue and span:
+                        raw.setdefault(days[day], {}).setdefault(venue, []).append(span)
+                self.busy = {day: {v: self._merge(spans) for v, spans in by_venue.items()} for day, by_venue in raw.items()}
+        self.bookable = sorted(v for v in known if venues.get(v, {}).get("bookable", True))
+        self.by_floor = {}
+        for v in self.bookable:
+            self.by_floor.setdefault(self.info(v).get("floor"), []).append(v)
+        # (capacity, venue), ascending, for "at least n seats" lookups
+        self.by_capacity = sorted((venues[v]["capacity"], v) for v in self.bookable if venues.get(v, {}).get("capacity") is not None)
+
+    @staticmethod
+    def _merge(spans):
+        starts, ends = [], []
+        for s, e in sorted(spans):
+            if ends and s <= ends[-1]:
+                ends[-1] = max(ends[-1], e)
+            else:
+                starts.append(s); ends.append(e)
+        return starts, ends
+
+    def info(self, venue):
+        return self.venues.get(venue, {})
+
+    def floor_label(self, venue, default="Available"):
+        return FLOOR_NAMES.get(self.info(venue).get("floor"), default)
+
+    def floors(self):
+        return sorted(f for f in self.by_floor if f is not None)
+
+    def candidates(self, floor=None, min_capacity=None):
+        rooms = self.by_floor.get(floor, []) if floor is not None else self.bookable
+        if min_capacity is not None:
+            roomy = {v for _, v in self.by_capacity[bisect_right(self.by_capacity, (min_capacity, "")):]}
+            rooms = [v for v in rooms if v in roomy]
+        return rooms
+
+    def is_free(self, day, venue, minute):
+        starts, ends = self.busy.get(day, {}).get(venue, ((), ()))
+        i = bisect_right(starts, minute) - 1
+        return i < 0 or minute >= ends[i]
+
+    def vacant(self, day, minute, floor=None, min_capacity=None):
+        day = day.strip().title()
+        return [v for v in self.candidates(floor, min_capacity) if self.is_free(day, v, minute)]
+
+    def free_until(self, day, venue, minute):
+        """End of the vacant window containing `minute` (next class or DAY_END); None if occupied."""
+        starts, ends = self.busy.get(day.strip().title(), {}).get(venue, ((), ()))
+        i = bisect_right(starts, minute)
+        if i and minute < ends[i - 1]: return None
+        return min(starts[i], DAY_END) if i < len(starts) else DAY_END
+
+    def vacant_until(self, day, minute, floor=None, min_capacity=None):
+        """[(venue, free until)] for every vacant room, longest stretch first."""
+        rooms = [(v, self.free_until(day, v, minute)) for v in self.candidates(floor, min_capacity)]
+        return sorted(((v, u) for v, u in rooms if u is not None), key=lambda r: (-r[1], r[0]))
+
+    def next_free(self, venue, day, minute, min_length=1):
+        """
+        First vacant window of at least `min_length` minutes for `venue`, at or
+        after `minute` on `day`, wrapping through the week: (day, start, end) or None.
+        """
+        first = WEEK_DAYS.index(day.strip().title()) if day.strip().title() in WEEK_DAYS else 0
+        for k in range(len(WEEK_DAYS) + 1):
+            d = WEEK_DAYS[(first + k) % len(WEEK_DAYS)]
+            starts, ends = self.busy.get(d, {}).get(venue, ((), ()))
+            t = max(minute if k == 0 else DAY_START, DAY_START)
+            i = bisect_right(starts, t)
+            if i and t < ends[i - 1]: t = ends[i - 1]
+            while t < DAY_END:
+                end = min(starts[i], DAY_END) if i < len(starts) else DAY_END
+                if end - t >= min_length: return d, t, end
+                if i >= len(starts): break
+                t, i = ends[i], i + 1
+        return None
+
+def get_vacant_venues(venues, target_day, target_time_str, floor=None, min_capacity=None):
+    """
+    Returns a list of venues that are NOT occupied at the specific Day and Time,
+    looked up in a VenueIndex. Venues the registry marks as not bookable
+    (labs, halls) are left out.
+    """
+    if not venues.busy:
+        return []
+    try:
+        q_time = datetime.strptime(target_time_str, "%H:%M").time()
+    except:
+        return [] # Invalid time format
+    return venues.vacant(target_day, q_time.hour * 60 + q_time.minute, floor, min_capacity)
+
+def get_free_until(venues, target_day, target_time_str, floor=None, min_capacity=None):
+    """[(venue, "H:MM")] from a VenueIndex: every vacant room and when its next class starts, longest stretch first."""
+    if not venues.busy: return []
+    try: q_time = datetime.strptime(target_time_str, "%H:%M").time()
+    except: return []
+    rooms = venues.vacant_until(target_day, q_time.hour * 60 + q_time.minute, floor, min_capacity)
+    return [(v, format_minutes(u)) for v, u in rooms]
+
+# --------------------------------------------------
+# COLUMN SCHEMA
+# --------------------------------------------------
+# Each workbook's headers are mapped to canonical fields once, in load_data,
+# and the positions are kept in df.attrs["schema"]. Fields are resolved in
+# this order and a header is claimed by one field only, so 'BranchName' is the
+# branch column and never the student's name.
+SCHEMA_FIELDS = (
+    ("mis", lambda h: "MIS" in h.upper()),
+    ("branch", lambda h: "Branch" in h),
+    ("subject", lambda h: "Subject" in h or "Title" in h),
+    ("division", lambda h: "Division" in h),
+    ("batch", lambda h: "BATCH" in h.upper()),
+    ("type", lambda h: "Type" in h),
+    ("day", lambda h: "Day" in h),
+    ("time", lambda h: "Time" in h),
+    ("venue", lambda h: "Venue" in h),
+    ("name", lambda h: "Name" in h),
+)
+SHEET_FIELDS = {
+    "enrolment": ("mis", "name", "branch", "subject", "division", "batch"),
+    "timetable": ("subject", "type", "division", "batch", "day", "time", "venue"),
+}
+REQUIRED_FIELDS = {"enrolment": ("mis", "subject"), "timetable": ("subject", "division", "day", "time")}
+
+class SchemaError(ValueError):
+    """A sheet is missing a column the planner cannot do without."""
+
+class SchemaWarning(UserWarning):
+    pass
+
+def resolve_schema(headers, kind, strict=True):
+    """
+    headers -> ({field: column position}, [warnings]) for an "enrolment" or
+    "timetable" sheet. When several headers fit a field the first one wins
+    and a warning says so; a missing required field raises SchemaError
+    (unless strict=False, which returns whatever was found).
+    """
+    headers = [str(h).strip() for h in headers]
+    wanted = SHEET_FIELDS[kind]
+    schema, notes, claimed = {}, [], set()
+    for field, test in SCHEMA_FIELDS:
+        if field not in wanted: continue
+        hits = [i for i, h in enumerate(headers) if i not in claimed and test(h)]
+        if not hits: continue
+        if len(hits) > 1:
+            notes.append(f"{field}: {', '.join(repr(headers[i]) for i in hits)} all match; using {headers[hits[0]]!r}")
+        schema[field] = hits[0]
+        claimed.add(hits[0])
+    missing = [f for f in REQUIRED_FIELDS[kind] if f not in schema]
+    if missing and strict:
+        raise SchemaError(f"no {', '.join(missing)} column among {headers}")
+    return schema, notes
+
+def schema_of(df, kind="enrolment"):
+    """The {field: position} map load_data stored on the frame (resolved on the spot for other frames)."""
+    schema = df.attrs.get("schema")
+    if schema is None: schema = resolve_schema(df.columns, kind, strict=False)[0]
+    return schema
+
+def schema_column(df, schema, field, default=None):
+    """A resolved column as a list, or [default] * len(df) when the sheet does not have it."""
+    pos = schema.get(field)
+    return df.iloc[:, pos].tolist() if pos is not None else [default] * len(df)
+
+# --------------------------------------------------
+# DATA LOADING & LOGIC
+# --------------------------------------------------
+def get_data_version(folder=DATA_FOLDER):
+    """Identifies the current generation of the workbooks (name, size, mtime of each)."""
+    stats = []
+    for f in sorted(os.listdir(folder)):
+        # Links have their own version (see load_link_map)
+        if not f.endswith(".xlsx") or "link" in f.lower(): continue
+        info = os.stat(os.path.join(folder, f))
+        stats.append(f"{f}:{info.st_size}:{info.st_mtime_ns}")
+    return hashlib.sha1("|".join(stats).encode("utf-8")).hexdigest()[:12]
+
+# --- WORKBOOK INGESTION ---
+# Workbooks are streamed row by row in openpyxl's read-only mode and only the
+# schema's columns are kept: MIS as int64 (0 for a blank cell) and every text
+# field as int32 codes into one Vocabulary shared by all sheets of a load.
+# A reload holds the compact columns plus one row of cells, never a whole sheet.
+NAN = float("nan")
+
+class Vocabulary:
+    """
+    Intern table for the text cells of every sheet in one load. All the
+    categorical columns share its dtype, so a division, subject or venue has
+    the same integer code in every frame, and a normalizer runs once per
+    distinct value (mapped / keys) instead of once per row and request.
+    Code -1 is a blank cell.
+    """
+
+    def __init__(self):
+        self.values = []
+        self._codes = {}
+        self._dtype = None
+        self._mapped = {}   # fn -> [fn(value) per code] + [fn(NaN)]
+        self._keys = {}     # fn -> (key id per code, {normalized value: key id})
+
+    def __deepcopy__(self, memo):
+        return self   # frames carry it in attrs, and pandas deep-copies attrs on every slice
+
+    def __getstate__(self):
+        return {"values": self.values}
+
+    def __setstate__(self, state):
+        self.__init__()
+        for v in state["values"]: self.intern(v)
+
+    def __len__(self):
+        return len(self.values)
+
+    def intern(self, text):
+        code = self._codes.get(text)
+        if code is None:
+            code = self._codes[text] = len(self.values)
+            self.values.append(text)
+        return code
+
+    @property
+    def dtype(self):
+        if self._dtype is None or len(self._dtype.categories) != len(self.values):
+            self._dtype = pd.CategoricalDtype(self.values)
+        return self._dtype
+
+    def column(self, codes):
+        return pd.Categorical.from_codes(np.frombuffer(codes, dtype=np.int32), dtype=self.dtype)
+
+    def mapped(self, fn):
+        """[fn(value) for every code] plus fn(NaN) last, so a blank cell's code (-1) indexes it."""
+        out = self._mapped.get(fn)
+        if out is None or len(out) != len(self.values) + 1:
+            out = self._mapped[fn] = [fn(v) for v in self.values] + [fn(NAN)]
+        return out
+
+    def keys(self, fn):
+        """
+        (ids, index): mapped(fn) as an int array of key ids, so values that
+        normalize the same compare equal as integers; index maps a
+        normalized value to its id.
+        """
+        hit = self._keys.get(fn)
+        if hit is None or len(hit[0]) != len(self.values) + 1:
+            index = {}
+            ids = np.array([index.setdefault(v, len(index)) for v in self.mapped(fn)], dtype=np.int32)
+            hit = self._keys[fn] = (ids, index)
+        return hit
+
+def codes_of(df, pos):
+    """The vocabulary codes of a categorical column (a view, not a copy)."""
+    return df.iloc[:, pos].array.codes
+
+def _cell_text(value):
+    if value is None: return None
+    text = str(value).strip()
+    return text or None
+
+def read_sheet(path, kind, vocab):
+    """
+    Streams the first worksheet of a workbook into (columns, attrs):
+    columns is [(header, field, array)] for the schema's fields, MIS as int64
+    and text as codes into vocab. _to_frame turns them into a DataFrame once
+    every sheet has been interned.
+    """
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = wb.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None) or ()
+        headers = [f"Unnamed: {i}" if h is None else str(h).strip() for i, h in enumerate(header)]
+        schema, notes = resolve_schema(headers, kind)
+        fields = sorted(schema, key=schema.get)   # keep the workbook's column order
+        positions = [schema[f] for f in fields]
+        data = [array("q") if f == "mis" else array("i") for f in fields]
+        intern = vocab.intern
+        blank, skipped = [], []   # skipped: blank rows with data after them, which shift the numbering
+        for number, row in enumerate(rows, start=2):
+            cells = [row[p] if p < len(row) else None for p in positions]
+            if all(c is None for c in cells):
+                blank.append(number)
+                continue
+            if blank: skipped += blank; blank = []
+            for field, out, value in zip(fields, data, cells):
+                value = _cell_text(value)
+                if field == "mis": out.append(mis_number(value) if value else 0)
+                else: out.append(-1 if value is None else intern(value))
+    finally:
+        wb.close()
+    attrs = {"kind": kind, "schema": {f: i for i, f in enumerate(fields)}, "schema_warnings": notes, "blank_rows": skipped}
+    return [(headers[schema[f]], f, a) for f, a in zip(fields, data)], attrs
+
+def sheet_rows(df):
+    """Worksheet row number of every frame row: the header is row 1 and read_sheet drops blank rows."""
+    blank = np.asarray(df.attrs.get("blank_rows", ()), dtype=np.int64)
+    # A blank row at sheet row b, with j blank rows above it, shifts every frame row from b - 2 - j on
+    shift_from = blank - 2 - np.arange(len(blank))
+    positions = np.arange(len(df))
+    return positions + 2 + np.searchsorted(shift_from, positions, side="right")
+
+def _to_frame(columns, attrs, vocab):
+    df = pd.DataFrame({h: np.frombuffer(a, dtype=np.int64) if f == "mis" else vocab.column(a) for h, f, a in columns})
+    df.attrs.update(attrs, vocab=vocab)
+    return df
+
+def load_data(folder=DATA_FOLDER):
+    if not os.path.exists(folder): return [], None, ""
+    vocab = Vocabulary()
+    sheets = []
+    for f in os.listdir(folder):
+        if not f.endswith(".xlsx"): continue
+        # Loaded separately by load_link_map / load_venues
+        if "link" in f.lower() or f.lower() == VENUES_FILE.lower(): continue
+        path = os.path.join(folder, f)
+        kind = "timetable" if f.lower() == TIMETABLE_FILE.lower() else "enrolment"
+        try:
+            columns, attrs = read_sheet(path, kind, vocab)
+        except SchemaError as e:
+            warnings.warn(f"{f}: skipped, {e}", SchemaWarning)
+            continue
+        except: continue
+        for note in attrs["schema_warnings"]: warnings.warn(f"{f}: {note}", SchemaWarning)
+        sheets.append((columns, dict(attrs, source=f)))
+    # Frames are built after every sheet is read so they all share one categorical dtype
+    sub_dfs, sched_df = [], None
+    for columns, attrs in sheets:
+        df = _to_frame(columns, attrs, vocab)
+        if attrs["kind"] == "timetable":
+            sched_df = df
+        else:
+            sub_dfs.append(df)
+    return sub_dfs, sched_df, get_data_version(folder)
+
+def get_links_version(folder=DATA_FOLDER):
+    path = os.path.join(folder, LINKS_FILE)
+    return os.stat(path).st_mtime_ns if os.path.exists(path) else 0
+
+NO_LINK_CELL = "<span style='color:#aaa'>No Link</span>"
+
+def load_link_map(links_version, folder=DATA_FOLDER):
+    """
+    Maps subject_key -> pre-rendered 'Material' cell.
+    Cached per version of subjects_links.xlsx, so editing it reloads only this
+    file instead of every workbook.
+    """
+    link_map = {}
+    if not links_version: return link_map
+    try:
+        df = pd.read_excel(os.path.join(folder, LINKS_FILE))
+        if df.shape[1] < 2: return link_map
+        for sub, link in zip(df.iloc[:, 0], df.iloc[:, 1]):
+            link_map[subject_key(sub)] = f'<a href="{str(link).strip()}" target="_blank" class="drive-btn">📂 Open Drive</a>'
+    except: pass
+    return link_map
+
+# --- SHARED DATASET FILES ---
+# With several app processes on one host, the first one to load a data version
+# writes its columns to <shared_dir>/dataset-<version>.bin and every process
+# (that one included) maps the file read-only. The frames' MIS and code arrays
+# are views into the mapping, so the page cache holds them once however many
+# workers attach; only the vocabulary strings and the small derived indexes
+# (venue occupancy, link map) are built per process. A shared_dir on /dev/shm
+# keeps the file in RAM.
+DATASET_MAGIC = b"PLANNER1"
+DATASET_GRACE = 300   # seconds an older dataset (or an abandoned .tmp) is kept for workers about to attach it
+_HEADER = DATASET_MAGIC + b"%016d"   # magic, then the JSON header's length
+
+def dataset_path(shared_dir, version):
+    return os.path.join(shared_dir, f"dataset-{version}.bin")
+
+def publish_dataset(sub_dfs, sched_df, version, shared_dir):
+    """Writes a load_data result where attach_dataset can map it; atomic, so readers never see half a file."""
+    frames = sub_dfs + ([sched_df] if sched_df is not None else [])
+    vocab = frames[0].attrs["vocab"] if frames else Vocabulary()
+    sheets, arrays, offset = [], [], 0
+    for df in frames:
+        columns = []
+        for pos, header in enumerate(df.columns):
+            values = df.iloc[:, pos].array
+            arr = np.ascontiguousarray(values.codes if isinstance(values, pd.Categorical) else values.to_numpy())
+            columns.append({"header": header, "categorical": isinstance(values, pd.Categorical), "dtype": arr.dtype.str, "offset": offset})
+            arrays.append(arr)
+            offset += -(-arr.nbytes // 8) * 8   # keep every array 8-byte aligned
+        sheets.append({"rows": len(df), "columns": columns, "attrs": {k: v for k, v in df.attrs.items() if k != "vocab"}})
+    header = json.dumps({"version": version, "vocab": vocab.values, "sheets": sheets}).encode("utf-8")
+    header += b" " * (-(len(_HEADER % 0) + len(header)) % 8)
+
+    os.makedirs(shared_dir, exist_ok=True)
+    path = dataset_path(shared_dir, version)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as fh:
+        fh.write(_HEADER % len(header) + header)
+        for arr in arrays:
+            fh.write(arr.tobytes())
+            fh.write(b"\0" * (-arr.nbytes % 8))
+    os.replace(tmp, path)
+    collect_datasets(shared_dir, keep=path)
+    return path
+
+def collect_datasets(shared_dir, keep, grace=DATASET_GRACE):
+    """Removes dataset files older than `keep` and .tmp files left by dead writers, once `grace` has passed."""
+    cutoff = min(os.path.getmtime(keep), time.time() - grace)
+    for f in os.listdir(shared_dir):
+        full = os.path.join(shared_dir, f)
+        if not f.startswith("dataset-") or full == keep or not f.endswith((".bin", ".tmp")): continue
+        # Processes still mapping a removed file keep their pages until they let go
+        try:
+            if os.path.getmtime(full) < cutoff: os.remove(full)
+        except OSError: pass
+
+def attach_dataset(path):
+    """Maps a published dataset read-only -> (sub_dfs, sched_df, version), frames backed by the mapping."""
+    with open(path, "rb") as fh:
+        buf = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+    prefix = len(_HEADER % 0)
+    if buf[:len(DATASET_MAGIC)] != DATASET_MAGIC: raise ValueError(f"{path} is not a dataset file")
+    size = int(buf[len(DATASET_MAGIC):prefix])
+    meta = json.loads(buf[prefix:prefix + size])
+    base = prefix + size
+    vocab = Vocabulary()
+    for v in meta["vocab"]: vocab.intern(v)
+    sub_dfs, sched_df = [], None
+    for sheet in meta["sheets"]:
+        data = {}
+        for col in sheet["columns"]:
+            arr = np.frombuffer(buf, dtype=np.dtype(col["dtype"]), count=sheet["rows"], offset=base + col["offset"])
+            data[col["header"]] = pd.Categorical.from_codes(arr, dtype=vocab.dtype, validate=False) if col["categorical"] else arr
+        df = pd.DataFrame(data, copy=False)
+        df.attrs.update(sheet["attrs"], vocab=vocab)
+        if sheet["attrs"]["kind"] == "timetable":
+            sched_df = df
+        else:
+            sub_dfs.append(df)
+    return sub_dfs, sched_df, meta["version"]
+
+# --- DATA GENERATIONS ---
+# Requests are served from one immutable Generation at a time. When the
+# workbooks change, the next generation (frames plus every derived index) is
+# built on a background thread while requests keep reading the current one,
+# then swapped in with a single reference assignment. A retired generation is
+# freed by the garbage collector once the last session holding it lets go.
+GENERATION_CHECK_INTERVAL = 60   # seconds between workbook stat() checks
+
+class Generation:
+    """One load of the workbooks: frames, data version and derived values (see DataManager)."""
+
+    def __init__(self, number, version, sub_dfs, sched_df):
+        self.number = number
+        self.version = version
+        self.sub_dfs = sub_dfs
+        self.sched_df = sched_df
+        self.derived = {}
+        self.built_at = time.time()
+
+class DataManager:
+    """
+    Double-buffered data generations. current() never waits on a reload
+    (except the very first load); derive maps a name to fn(generation) and
+    each one is computed before the swap, so a new generation arrives with
+    its indexes already built. With shared_dir, frames come from a dataset
+    file shared by every process on the host (see publish_dataset).
+    """
+
+    def __init__(self, folder=DATA_FOLDER, derive=None, check_interval=GENERATION_CHECK_INTERVAL, shared_dir=None):
+        self.folder = folder
+        self.shared_dir = shared_dir
+        self.derive = derive or {}
+        self.check_interval = check_interval
+        self._current = None
+        self._lock = threading.Lock()
+        self._builder = None
+        self._checked = 0.0
+        self._retired = weakref.WeakSet()   # swapped out but still referenced somewhere
+        self.swaps = 0
+        self.build_ms = None
+        self.last_error = None
+
+    def current(self):
+        gen = self._current
+        if gen is None:
+            with self._lock:
+                if self._current is None: self._swap(self._build())
+                return self._current
+        now = time.monotonic()
+        if now - self._checked >= self.check_interval:
+            self._checked = now
+            try: changed = get_data_version(self.folder) != gen.version
+            except OSError: changed = False
+            if changed: self.reload()
+        return gen
+
+    def reload(self, wait=False):
+        """Starts a background build unless one is already running."""
+        with self._lock:
+            if self._builder is None or not self._builder.is_alive():
+                self._builder = threading.Thread(target=self._build_and_swap, name="data-generation", daemon=True)
+                self._builder.start()
+            builder = self._builder
+        if wait: builder.join()
+
+    def _build(self):
+        t0 = time.perf_counter()
+        # Stamped before reading: a workbook saved mid-load shows up as a change on the next check
+        version = get_data_version(self.folder) if os.path.exists(self.folder) else ""
+        if self.shared_dir and version:
+            path = dataset_path(self.shared_dir, version)
+            if not os.path.exists(path):
+                publish_dataset(*load_data(self.folder)[:2], version, self.shared_dir)
+            try:
+                sub_dfs, sched_df, _ = attach_dataset(path)
+            except FileNotFoundError:
+                # Collected by another process after a newer publish; read the workbooks instead
+                sub_dfs, sched_df, _ = load_data(self.folder)
+        else:
+            sub_dfs, sched_df, _ = load_data(self.folder)
+        previous = self._current
+        gen = Generation(previous.number + 1 if previous else 1, version, sub_dfs, sched_df)
+        for name, fn in self.derive.items():
+            gen.derived[name] = fn(gen)
+        self.build_ms = round((time.perf_counter() - t0) * 1000, 1)
+        return gen
+
+    def _build_and_swap(self):
+        try:
+            gen = self._build()
+        except Exception as e:
+            self.last_error = repr(e)   # keep serving the current generation
+            return
+        with self._lock: self._swap(gen)
+
+    def _swap(self, gen):
+        old, self._current = self._current, gen
+        self.last_error = None
+        if old is not None:
+            self._retired.add(old)
+            self.swaps += 1
+
+    def metrics(self):
+        gen = self._current
+        return {
+            "generation": gen.number if gen else 0,
+            "retired_alive": len(self._retired),
+            "swaps": self.swaps,
+            "build_ms": self.build_ms,
+            "building": int(bool(self._builder and self._builder.is_alive())),
+        }
+
+def student_ids(sub_dfs):
+    """Every enrolled MIS, as sorted strings."""
+    ids = set()
+    for df in sub_dfs:
+        cols = schema_of(df)
+        if "mis" in cols: ids.update(df.iloc[:, cols["mis"]].unique().tolist())
+    ids.discard(0)
+    return sorted(str(m) for m in ids)
+
+# --- STUDENT SEARCH ---
+# Built once per data generation. MIS prefixes are a bisect over the sorted
+# MIS strings; names are a bisect over the sorted (token, student) pairs, so
+# "sha pat" finds every student with a token starting "sha" and one starting
+# "pat". When no name matches, students sharing the most trigrams with the
+# query are suggested instead, which absorbs most typos.
+SEARCH_LIMIT = 8
+NAME_QUERY_MIN = 3   # letters before a name query is looked up; shorter ones match half the cohort
+NAME_TOKEN = re.compile(r"[a-z0-9]+")
+
+def name_tokens(text):
+    return NAME_TOKEN.findall(str(text).lower())
+
+def trigrams(token):
+    padded = f" {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class StudentIndex:
+    """Typeahead over the enrolled students: search() -> [(mis, name, branch)]."""
+
+    def __init__(self, sub_dfs):
+        people = {}   # mis -> [name, branch], first usable value wins (as in get_schedule)
+        for df in sub_dfs:
+            cols = schema_of(df)
+            if "mis" not in cols: continue
+            vocab = df.attrs["vocab"]
+            mis = df.iloc[:, cols["mis"]].to_numpy()
+            _, first = np.unique(mis, return_index=True)
+            fields = [(i, codes_of(df, cols[f])) for i, f in enumerate(("name", "branch")) if f in cols]
+            for row in first.tolist():
+                entry = people.setdefault(int(mis[row]), ["", ""])
+                for i, codes in fields:
+                    code = int(codes[row])
+                    text = vocab.values[code].strip() if code >= 0 else ""
+                    if not entry[i] and text.lower() not in ("", "nan", "-", "general"): entry[i] = text
+        people.pop(0, None)
+        ordered = sorted((str(m), name, branch) for m, (name, branch) in people.items())
+        self.mis = [m for m, _, _ in ordered]
+        self.students = ordered
+        self.tokens = sorted((t, i) for i, (_, name, _) in enumerate(ordered) for t in set(name_tokens(name)))
+        self.grams = {}   # trigram -> [student]
+        for i, (_, name, _) in enumerate(ordered):
+            for g in set().union(*map(trigrams, name_tokens(name))):
+                self.grams.setdefault(g, []).append(i)
+
+    def __len__(self):
+        return len(self.mis)
+
+    def __contains__(self, mis):
+        m = clean_mis(mis)
+        i = bisect_left(self.mis, m)
+        return i < len(self.mis) and self.mis[i] == m
+
+    def _mis_prefix(self, prefix, limit):
+        i = bisect_left(self.mis, prefix)
+        hits = []
+        while i < len(self.mis) and len(hits) < limit and self.mis[i].startswith(prefix):
+            hits.append(i); i += 1
+        return hits
+
+    def _token_prefix(self, prefix):
+        i = bisect_left(self.tokens, (prefix, -1))
+        hits = set()
+        while i < len(self.tokens) and self.tokens[i][0].startswith(prefix):
+            hits.add(self.tokens[i][1]); i += 1
+        return hits
+
+    def _similar(self, tokens, limit):
+        grams = set().union(*map(trigrams, tokens))
+        shared = {}
+        for g in grams:
+            for i in self.grams.get(g, ()): shared[i] = shared.get(i, 0) + 1
+        best = sorted(shared.items(), key=lambda s: (-s[1], s[0]))[:limit]
+        return [i for i, n in best if n * 2 >= len(grams)]
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        digits = clean_mis(query) if query else ""
+        if not digits: return []
+        if digits.isdigit():
+            hits = self._mis_prefix(digits, limit)
+        else:
+            tokens = name_tokens(query)
+            if sum(map(len, tokens)) < NAME_QUERY_MIN: return []
+            found = set.intersection(*(self._token_prefix(t) for t in tokens))
+            hits = sorted(found, key=lambda i: (self.students[i][1], i))[:limit] if found else self._similar(tokens, limit)
+        return [self.students[i] for i in hits]
+
+def get_schedule(mis, sub_dfs, sched_df):
+    found_subs = []
+    # Initialize defaults
+    name = "Unknown"
+    branch = "General" 
+    target_mis = mis_number(mis)
+    
+    # 1. Find User Subjects & Info across ALL sheets
+    for df in sub_dfs:
+        cols = schema_of(df)
+        if "mis" not in cols: continue
+        
+        match = df[df.iloc[:, cols["mis"]].to_numpy() == target_mis]
+        
+        if not match.empty:
+            row = match.iloc[0].tolist()
+            
+            # --- A. NAME LOGIC ---
+            # Capture name from the first sheet that has it
+            if name == "Unknown" and "name" in cols:
+                found_name = str(row[cols["name"]]).strip()
+                if found_name and found_name.lower() != "nan":
+                    name = found_name
+
+            # --- B. IMPROVED BRANCH LOGIC ---
+            # Look for a branch column in THIS specific sheet
+            if "branch" in cols:
+                found_branch = str(row[cols["branch"]]).strip()
+                
+                # Update 'branch' only if:
+                # 1. We currently have the default "General"
+                # 2. The new found_branch is VALID (not "General", empty, or "nan")
+                is_valid = found_branch and found_branch.lower() not in ["nan", "", "-", "general"]
+                
+                if branch == "General" and is_valid:
+                    branch = found_branch
+
+            # --- C. SUBJECT EXTRACTION ---
+            if "subject" in cols:
+                found_subs.append({
+                    "Subject": correct_subject_name(str(row[cols["subject"]]).strip()),
+                    "Division": str(row[cols["division"]]).strip() if "division" in cols else "",
+                    "Batch": str(row[cols["batch"]]) if "batch" in cols else ""
+                })
+    
+    # 2. Map to Timetable (Standard Logic)
+    # Every cell is a vocabulary code, and each normalizer has run once per
+    # distinct value; matching a subject is integer comparisons over the rows.
+    timetable = []
+    if sched_df is not None and found_subs:
+        cols = schema_of(sched_df, "timetable")
+        vocab = sched_df.attrs["vocab"]
+        codes = {f: codes_of(sched_df, pos) for f, pos in cols.items()}
+        blank = np.full(len(sched_df), -1, dtype=np.int32)
+        div_ids, div_index = vocab.keys(normalize_division)
+        batch_ids, batch_index = vocab.keys(normalize_batch)
+        t_div = div_ids[codes["division"]]
+        t_batch = batch_ids[codes.get("batch", blank)]
+        kinds = np.array(vocab.mapped(class_kind), dtype=np.int8)[codes.get("type", blank)]
+        batch_free = (kinds == 0) | (t_batch == batch_index.get("all", -1))
+        t_sub = codes["subject"]
+        subjects = np.unique(t_sub)
+        sub_text = vocab.mapped(clean_text)
+        times, days = vocab.mapped(parse_time), vocab.mapped(day_title)
+        venues = vocab.mapped(str) if "venue" in codes else None
+        
+        for sub in found_subs:
+            s_sub_clean = subject_key(sub['Subject'])
+            s_div = div_index.get(normalize_division(sub['Division']), -1)
+            s_batch = batch_index.get(normalize_batch(sub['Batch']), -1)
+            
+            hits = [c for c in subjects.tolist() if fuzzy_match_cached(s_sub_clean, sub_text[c])]
+            rows = np.flatnonzero(np.isin(t_sub, hits) & (t_div == s_div) & (batch_free | (t_batch == s_batch)))
+            for i in rows.tolist():
+                start, dur_hours = times[codes["time"][i]]
+                    
+                if start:
+                    row_span = int(dur_hours)
+                    if dur_hours > 1.2 and dur_hours <= 2.2:
+                        row_span = 2
+                    elif dur_hours > 2.2:
+                        row_span = 3 
+                    
+                    is_offset = False
+                    if ":00" in start or (dur_hours == 1.5):
+                         is_offset = True
+
+                    display_type = CLASS_KINDS[kinds[i]]
+
+                    timetable.append({
+                        "Day": days[codes["day"][i]], 
+                        "StartTime": start, 
+                        "Duration": row_span,
+                        "DurationFloat": dur_hours,
+                        "IsOffset": is_offset,
+                        "Subject": sub['Subject'], 
+                        "Type": display_type, 
+                        "Venue": venues[codes["venue"][i]] if venues else "-"
+                    })
+                
+    return found_subs, timetable, name, branch
+
+
+# --- TIMETABLE VALIDATION ---
+# Run once per data version. Students who share the same (subject, division,
+# batch) enrolments share one timetable, so the sweep runs per distinct
+# enrolment profile, not per student.
+VALIDATION_REPORT = os.path.join("reports", "timetable_validation.txt")
+REPORT_EXAMPLES = 5
+
+def _memo(fn):
+    """Per-pass cache: the same cell values repeat across thousands of rows."""
+    cache = {}
+    def wrapper(value):
+        try: return cache[value]
+        except KeyError:
+            cache[value] = out = fn(value)
+            return out
+        except TypeError:
+            return fn(value)
+    return wrapper
+
+def _timetable_rows(sched_df):
+    """Parsed timetable rows for validation, plus the cells that could not be parsed."""
+    cols = schema_of(sched_df, "timetable")
+    header = lambda field: sched_df.columns[cols[field]] if field in cols else None
+    div_c, batch_c, type_c, time_c, day_c, venue_c = map(header, ("division", "batch", "type", "time", "day", "venue"))
+    rows, bad = [], []
+    if not ("subject" in cols and time_c and day_c): return rows, bad
+    minutes, text, division, batch, venue = map(_memo, (class_minutes, clean_text, normalize_division, normalize_batch, normalize_venue))
+    column = lambda field, default: schema_column(sched_df, cols, field, default)
+    for excel_row, sub, div, bat, typ, tim, day_raw, ven in zip(
+            sheet_rows(sched_df).tolist(),
+            column("subject", ""), column("division", ""), column("batch", None), column("type", ""),
+            column("time", None), column("day", ""), column("venue", None)):
+        span = minutes(tim)
+        day = str(day_raw).title().strip()
+        if not span: bad.append({"row": excel_row, "column": time_c, "value": str(tim)})
+        if day not in WEEK_DAYS: bad.append({"row": excel_row, "column": day_c, "value": str(day_raw)})
+        if not span or day not in WEEK_DAYS: continue
+        type_str = str(typ).lower() if type_c else ""
+        rows.append({
+            "row": excel_row, "day": day, "start": span[0], "end": span[1],
+            "subject": str(sub).strip(), "subject_clean": text(sub),
+            "division": division(div) if div_c else "",
+            "batch": batch(bat) if batch_c else "all",
+            "batch_specific": "lab" in type_str or "tutorial" in type_str,
+            "type": type_str.upper(),
+            "venue": venue(ven) if venue_c else None,
+        })
+    return rows, bad
+
+def _enrolments(sub_dfs):
+    """mis -> set of (subject key, division, batch), read the way get_schedule reads them."""
+    enrolled = {}
+    mis_key = _memo(lambda v: clean_mis(v) if v else "")
+    subject = _memo(lambda v: subject_key(str(v).strip()))
+    division = _memo(lambda v: normalize_division(str(v).strip()))
+    batch = _memo(lambda v: normalize_batch(str(v)))
+    for df in sub_dfs:
+        cols = schema_of(df)
+        if "mis" not in cols or "subject" not in cols: continue
+        seen = set()
+        for mis, sub, div, bat in zip(*(schema_column(df, cols, f, "") for f in ("mis", "subject", "division", "batch"))):
+            mis = mis_key(mis)
+            if not mis or mis in seen: continue   # get_schedule reads a student's first row only
+            seen.add(mis)
+            enrolled.setdefault(mis, set()).add((subject(sub), division(div), batch(bat)))
+    return enrolled
+
+def _describe(r):
+    return f"{r['subject']} ({r['type'] or '-'}) {format_minutes(r['start'])}-{format_minutes(r['end'])} @ {r['venue'] or '-'} [row {r['row']}]"
+
+def _quarter_mask(r):
+    """The row's quarter hours of the week as bits (rounded outwards, so it can only over-report)."""
+    base = WEEK_DAYS.index(r["day"]) * 96
+    lo, hi = base + r["start"] // 15, base + (r["end"] + 14) // 15
+    return ((1 << (hi - lo)) - 1) << lo
+
+def _sweep(rows):
+    """Every overlapping pair in an interval list, sweeping by start time with the set of still-running rows."""
+    pairs, active = [], []
+    for r in sorted(rows, key=lambda r: (r["start"], r["end"], r["row"])):
+        active = [a for a in active if a["end"] > r["start"]]
+        pairs.extend((a, r) for a in active)
+        active.append(r)
+    return pairs
+
+def validate_timetable(sub_dfs, sched_df):
+    """
+    Student clashes, venue double-bookings and unreadable time/day cells
+    across the whole cohort. Returns a dict; format_validation_report renders it.
+    """
+    t0 = time.perf_counter()
+    report = {"students": 0, "profiles": 0, "student_clashes": [], "venue_conflicts": [], "unparseable": []}
+    if sched_df is None or sched_df.empty: return report
+    rows, report["unparseable"] = _timetable_rows(sched_df)
+
+    # 1. Venue double-bookings: per day and room, sweep by start time. The same
+    #    subject at the same time is one combined session, not a conflict.
+    by_venue = {}
+    for r in rows:
+        if r["venue"]: by_venue.setdefault((r["day"], r["venue"]), []).append(r)
+    for (day, venue), group in sorted(by_venue.items()):
+        for a, b in _sweep(group):
+            if (a["subject_clean"], a["start"], a["end"]) == (b["subject_clean"], b["start"], b["end"]): continue
+            report["venue_conflicts"].append({"day": day, "venue": venue, "first": _describe(a), "second": _describe(b)})
+
+    # 2. Student clashes. Each enrolment gets a bitmask of the quarter hours it
+    #    occupies in the week; a profile is only swept when two of its masks
+    #    intersect (or one overlaps itself), which most profiles never do.
+    by_division = {}
+    for r in rows: by_division.setdefault(r["division"], []).append(r)
+    fuzzy, matches = {}, {}
+    def matched_rows(enrolment):
+        if enrolment not in matches:
+            subject, division, batch = enrolment
+            hits, mask, overlaps = [], 0, False
+            for r in by_division.get(division, []):
+                pair = (subject, r["subject_clean"])
+                if pair not in fuzzy: fuzzy[pair] = is_fuzzy_match(*pair)
+                if fuzzy[pair] and (not r["batch_specific"] or r["batch"] in ("all", batch)):
+                    hits.append(r)
+                    bits = _quarter_mask(r)
+                    overlaps = overlaps or bool(mask & bits)
+                    mask |= bits
+            matches[enrolment] = (hits, mask, overlaps)
+        return matches[enrolment]
+
+    def may_clash(enrolments):
+        seen = 0
+        for e in enrolments:
+            _, mask, overlaps = matched_rows(e)
+            if overlaps or seen & mask: return True
+            seen |= mask
+        return False
+
+    profiles = {}
+    for mis, enrolments in _enrolments(sub_dfs).items():
+        profiles.setdefault(frozenset(enrolments), []).append(mis)
+    report["students"] = sum(len(m) for m in profiles.values())
+    report["profiles"] = len(profiles)
+
+    clashes = {}
+    for enrolments, students in profiles.items():
+        if not may_clash(enrolments): continue
+        by_day = {}
+        for r in {r["row"]: r for e in enrolments for r in matched_rows(e)[0]}.values():
+            by_day.setdefault(r["day"], []).append(r)
+        for day, group in by_day.items():
+            for a, b in _sweep(group):
+                hit = clashes.setdefault((a["row"], b["row"]), {"day": day, "first": _describe(a), "second": _describe(b), "students": 0, "examples": []})
+                hit["students"] += len(students)
+                hit["examples"] = (hit["examples"] + students)[:REPORT_EXAMPLES]
+    report["student_clashes"] = sorted(clashes.values(), key=lambda c: (-c["students"], c["day"], c["first"]))
+    report["elapsed_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+    return report
+
+def format_validation_report(report, data_version=""):
+    lines = [f"Timetable validation{f' (data version {data_version})' if data_version else ''}",
+             f"{report['students']} students in {report['profiles']} enrolment profiles, checked in {report.get('elapsed_ms', 0)} ms", ""]
+    lines.append(f"STUDENT CLASHES: {len(report['student_clashes'])}")
+    for c in report["student_clashes"]:
+        lines.append(f"  {c['day']}: {c['first']}  <->  {c['second']}")
+        lines.append(f"      {c['students']} student(s), e.g. {', '.join(c['examples'])}")
+    lines += ["", f"VENUE DOUBLE-BOOKINGS: {len(report['venue_conflicts'])}"]
+    for c in report["venue_conflicts"]:
+        lines.append(f"  {c['day']} {c['venue']}: {c['first']}  <->  {c['second']}")
+    lines += ["", f"UNPARSEABLE CELLS: {len(report['unparseable'])}"]
+    for c in report["unparseable"]:
+        lines.append(f"  row {c['row']}, {c['column']}: {c['value']!r}")
+    return "\n".join(lines) + "\n"
+
+def write_validation_report(report, path=VALIDATION_REPORT, data_version=""):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as fh:
+        fh.write(format_validation_report(report, data_version))
+    return path
+
+class LRUMemo:
+    """Thread-safe, size-bounded LRU memo with hit/miss/eviction counters."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get_or_compute(self, key, compute):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+        value = compute()
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def clear(self):
+        with self._lock: self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+GRID_SLOTS = ["8:30", "9:30", "10:30", "11:30", "12:30", "1:30", "2:30", "3:30", "4:30", "5:30"]
+GRID_DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday"]
+GRID_CACHE_SIZE = 256
+
+# --- PRECOMPILED GRID FRAGMENTS ---
+# Built once at import; render_grid only fills in the per-class values.
+GRID_HEAD = '<div class="timetable-wrapper"><table class="custom-grid"><thead><tr><th>Time</th>' + ''.join(f'<th>{d}</th>' for d in GRID_DAYS) + '</tr></thead><tbody>'
+GRID_TAIL = '</tbody></table></div>'
+GRID_ROW_OPEN = [f'<tr><td class="time-label">{s} - {int(s.split(":")[0]) + 1}:{s.split(":")[1]}</td>' for s in GRID_SLOTS]
+GRID_EMPTY_CELL = '<td><div class="class-card type-empty"></div></td>'
+GRID_CELL = '<td {span}><div class="class-card filled" style="background:{grad}"><div class="batch-badge">{type}</div><div class="sub-title">{subject}</div><div class="sub-meta">📍 {venue}</div></div></td>'.format
+GRID_OFFSET_CELL = '''
+                    <td {span} style="padding:0; vertical-align: top;">
+                        <div class="offset-wrapper">
+                            <div class="offset-spacer"></div>
+                            <div class="offset-card-container">
+                                <div class="class-card filled offset-style" style="background:{grad}">
+                                    <div class="batch-badge">{type} (1.5h)</div>
+                                    <div class="sub-title">{subject}</div>
+                                    <div class="sub-meta">📍 {venue} <br> ⏰ {start}</div>
+                                </div>
+                            </div>
+                        </div>
+                    </td>
+                    '''.format
+
+_grid_cache = LRUMemo(GRID_CACHE_SIZE)   # ("html" | "json", timetable hash) -> rendered grid
+
+def timetable_hash(entries):
+    """Stable digest of a timetable; identical cohort timetables share the same key."""
+    payload = json.dumps(entries, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+@lru_cache(maxsize=None)
+def grid_slot_index(start_time):
+    """Row index in GRID_SLOTS for a class start time (memoized map_to_slot)."""
+    slot = map_to_slot(start_time, GRID_SLOTS)
+    return GRID_SLOTS.index(slot) if slot else None
+
+def compile_grid(entries):
+    """
+    Places entries on the slot x day grid.
+    Returns a list of rows (one per slot), each a list of cells (one per day):
+       None     -> empty cell
+       "MERGED" -> covered by a rowspan from above
+       dict     -> the class entry starting in that cell
+    """
+    grid = [[None] * len(GRID_DAYS) for _ in GRID_SLOTS]
+    day_index = {d: i for i, d in enumerate(GRID_DAYS)}
+
+    for e in entries:
+        d = day_index.get(e['Day'])
+        if d is None: continue
+        idx = grid_slot_index(e['StartTime'])
+        if idx is None: continue
+        grid[idx][d] = e
+        # Merge cells logic
+        for i in range(1, e['Duration']):
+            if idx + i < len(GRID_SLOTS): grid[idx + i][d] = "MERGED"
+    return grid
+
+def render_grid(entries):
+    return _grid_cache.get_or_compute(("html", timetable_hash(entries)), lambda: _grid_html(entries))
+
+def _grid_html(entries):
+    parts = [GRID_HEAD]
+    for row_open, row in zip(GRID_ROW_OPEN, compile_grid(entries)):
+        parts.append(row_open)
+        for cell in row:
+            if cell == "MERGED": continue
+            if not cell:
+                parts.append(GRID_EMPTY_CELL)
+                continue
+            span = f'rowspan="{cell["Duration"]}"' if cell['Duration'] > 1 else ''
+            fields = dict(span=span, grad=get_subject_gradient(cell['Subject']), type=cell["Type"], subject=cell["Subject"], venue=cell["Venue"])
+            # --- OFFSET RENDER LOGIC ---
+            if cell.get('IsOffset', False) and cell.get('DurationFloat', 1) == 1.5:
+                parts.append(GRID_OFFSET_CELL(start=cell["StartTime"], **fields))
+            else:
+                parts.append(GRID_CELL(**fields))
+        parts.append('</tr>')
+    parts.append(GRID_TAIL)
+    return "".join(parts)
+
+def render_grid_json(entries):
+    """
+    Compact JSON form of the grid for a client-side renderer.
+    Subjects and venues are listed once; each class is
+    [day_idx, slot_idx, rowspan, subject_idx, type, venue_idx, start, offset].
+    """
+    return _grid_cache.get_or_compute(("json", timetable_hash(entries)), lambda: _grid_json(entries))
+
+def _grid_json(entries):
+    subjects, venues, classes = [], [], []
+    for slot_idx, row in enumerate(compile_grid(entries)):
+        for day_idx, cell in enumerate(row):
+            if not isinstance(cell, dict): continue
+            if cell['Subject'] not in subjects: subjects.append(cell['Subject'])
+            if cell['Venue'] not in venues: venues.append(cell['Venue'])
+            is_offset = bool(cell.get('IsOffset', False) and cell.get('DurationFloat', 1) == 1.5)
+            classes.append([day_idx, slot_idx, cell['Duration'], subjects.index(cell['Subject']), cell['Type'],
+                            venues.index(cell['Venue']), cell['StartTime'], int(is_offset)])
+
+    payload = {"days": GRID_DAYS, "slots": GRID_SLOTS, "subjects": subjects, "venues": venues, "classes": classes}
+    return json.dumps(payload, separators=(",", ":"), ensure_ascii=False)
+
+@lru_cache(maxsize=4096)
+def subject_row_html(subject, batch, division, link_cell):
+    return f"<tr><td>{subject}</td><td>{batch}</td><td>{division}</td><td>{link_cell}</td></tr>"
+
+def render_subject_html(subjects, link_map):
+    html_parts = ["""
+    <style>
+    .sub-alloc-wrapper { font-family: 'Poppins', sans-serif; margin-top: 10px; border-radius: 12px; overflow-x: auto; border: none; box-shadow: 0 4px 20px var(--card-shadow); background: var(--card-bg); }
+    table.sub-alloc-table { width: 100%; min-width: 600px; border-collapse: collapse; background: var(--card-bg); }
+    .sub-alloc-table thead th { background: linear-gradient(90deg, #a18cd1 0%, #fbc2eb 100%); color: white; padding: 18px; font-size: 17px; font-weight: 700; text-align: left; white-space: nowrap; }
+    .sub-alloc-table tbody td { padding: 16px; font-size: 16px; color: var(--text-color); border-bottom: 1px solid rgba(128,128,128,0.1); background: var(--card-bg); vertical-align: middle; transition: all 0.2s; white-space: nowrap; }
+    .sub-alloc-table tbody tr:hover td { background-color: var(--table-row-hover); transform: scale(1.005); color: #6a11cb; cursor: default; }
+    .drive-btn { background: linear-gradient(135deg, #6a11cb 0%, #2575fc 100%); color: white !important; padding: 8px 16px; border-radius: 50px; text-decoration: none; font-size: 13px; font-weight: 600; display: inline-block; transition: 0.2s; }
+    .drive-btn:hover { transform: translateY(-2px); box-shadow: 0 6px 15px rgba(37, 117, 252, 0.3); }
+    </style>
+    <div class="sub-alloc-wrapper"><table class="sub-alloc-table"><thead><tr><th style="width:40%">Subject Name</th><th style="width:20%">Batch</th><th style="width:20%">Division</th><th style="width:20%">Material</th></tr></thead><tbody>
+    """]
+    for sub in subjects:
+        link_cell = link_map.get(subject_key(sub.get('Subject')), NO_LINK_CELL)
+        html_parts.append(subject_row_html(sub.get('Subject'), sub.get('Batch'), sub.get('Division'), link_cell))
+    html_parts.append("</tbody></table></div>")
+    return "".join(html_parts)
+
+def calculate_semester_totals(timetable_entries):
+    totals = {}
+    weekly_map = {}
+    for entry in timetable_entries:
+        d = entry['Day']
+        if d not in weekly_map: weekly_map[d] = []
+        weekly_map[d].append(entry)
+        key = f"{entry['Subject']}|{entry['Type']}"
+        totals[key] = 0
+    
+    curr_date = SEMESTER_START
+    # CHANGE: Stop counting at today's date instead of SEMESTER_END
+    # to get "Total lectures taken place till now"
+    end_date = date.today() 
+    
+    while curr_date <= end_date:
+        # Don't count future dates if SEMESTER_START is in future
+        if curr_date > SEMESTER_END: break 
+        
+        day_name = curr_date.strftime("%A")
+        if day_name in weekly_map:
+            for cls in weekly_map[day_name]:
+                totals[f"{cls['Subject']}|{cls['Type']}"] += 1
+        curr_date += timedelta(days=1)
+    return totals
+
+# --- ATTENDANCE IDS ---
+# A mark is one integer: MIS in the high bits, then the class within that
+# student's semester. Sheets and SQLite store it as a short base-36 token.
+#   bits 29-37  day offset from SEMESTER_START (0-511)
+#   bits  9-28  subject (20-bit CRC of subject_key; wide enough that no two
+#               subjects in one timetable should share a code)
+#   bits  7-8   type (0 other, 1 theory, 2 lab, 3 tutorial)
+#   bits  0-6   start time in 15-minute steps
+CLASS_BITS = 38
+ATTENDANCE_TYPES = {"theory": 1, "lab": 2, "tutorial": 3}
+
+def mis_number(mis):
+    """MIS as an int; non-numeric IDs get a CRC above the numeric range."""
+    m = clean_mis(mis)
+    return int(m) if m.isdigit() else zlib.crc32(m.encode()) | 1 << 40
+
+@lru_cache(maxsize=1024)
+def subject_code(subject):
+    return zlib.crc32(subject_key(subject).encode()) & 0xFFFFF
+
+def type_code(cls_type):
+    return ATTENDANCE_TYPES.get(str(cls_type).strip().lower(), 0)
+
+def start_code(start):
+    h, m = str(start).split(":")[:2]
+    return (int(h) * 60 + int(m)) // 15 & 0x7F
+
+def attendance_code(mis, day, subject, cls_type, start):
+    """Packs one attendance mark; `day` is a date inside the semester."""
+    offset = (day - SEMESTER_START).days & 0x1FF
+    return (mis_number(mis) << CLASS_BITS | offset << 29 | subject_code(subject) << 9
+            | type_code(cls_type) << 7 | start_code(start))
+
+def attendance_mis(code):
+    return code >> CLASS_BITS
+
+def attendance_subject_type(code):
+    """(subject code, type code) of a mark, for per-subject tallies."""
+    return code >> 9 & 0xFFFFF, code >> 7 & 0x3
+
+def attendance_token(code):
+    digits = "0123456789abcdefghijklmnopqrstuvwxyz"
+    out = ""
+    while True:
+        code, r = divmod(code, 36)
+        out = digits[r] + out
+        if not code: return out
+
+def parse_attendance_id(text):
+    """Token -> code. Also accepts the old 'mis_YYYY-MM-DD_Subject_TYPE_HH:MM' strings; None if unreadable."""
+    text = str(text).strip()
+    if not text: return None
+    try:
+        if "_" not in text: return int(text, 36)
+        mis, day, rest = text.split("_", 2)
+        subject, cls_type, start = rest.rsplit("_", 2)
+        return attendance_code(mis, date.fromisoformat(day), subject, cls_type, start)
+    except ValueError:
+        return None
+
+if __name__ == "__main__":
+    # python planner.py [data folder]  ->  writes reports/timetable_validation.txt
+    import sys
+    folder = sys.argv[1] if len(sys.argv) > 1 else DATA_FOLDER
+    sub_dfs, sched_df, version = load_data(folder)
+    report = validate_timetable(sub_dfs, sched_df)
+    print(write_validation_report(report, data_version=version))
+    print(f"{len(report['student_clashes'])} student clashes, {len(report['venue_conflicts'])} venue double-bookings, "
+          f"{len(report['unparseable'])} unparseable cells ({report.get('elapsed_ms', 0)} ms)")
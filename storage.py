@@ -0,0 +1,753 @@
+"""
+Persistence: attendance marks and the game leaderboard.
+
+Two interchangeable backends implement load_attendance / update_attendance /
+get_leaderboard:
+   SheetsBackend  - Google Sheets via gspread, every call blocking
+   AsyncSheetsBackend - the same sheets behind a background executor:
+                    optimistic writes, stale-while-revalidate reads
+   SQLiteBackend  - local SQLite in WAL mode, optionally mirrored to Sheets
+                    in the background by SheetsMirror
+make_backend() picks one from the app's secrets.
+
+Sheets are reached through get_google_client(); use_client() swaps in a
+stand-in (see bench.loadtest) so the same code paths can run without Google.
+"""
+import gspread
+from google.oauth2.service_account import Credentials
+import streamlit as st
+import pandas as pd
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+import os
+import re
+import sqlite3
+import threading
+import sys
+import time
+
+from metrics import timed, timer, count
+from planner import CLASS_BITS, attendance_mis, attendance_token, mis_number, parse_attendance_id
+
+_client_override = None
+
+class StorageUnavailable(RuntimeError):
+    """A read could not reach the backing store; callers keep whatever they had."""
+
+def use_client(client):
+    """Routes every Sheets call through `client` (a gspread.Client look-alike); None restores Google."""
+    global _client_override
+    _client_override = client
+
+def sheet_url(secret_name):
+    # Stand-in clients are addressed by the secret name itself.
+    return secret_name if _client_override is not None else st.secrets[secret_name]
+
+# --- GOOGLE SHEETS PERSISTENCE ---
+def get_google_client():
+    if _client_override is not None: return _client_override
+    scope = ['https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/drive']
+    creds = Credentials.from_service_account_info(st.secrets["gcp_service_account"], scopes=scope)
+    return gspread.authorize(creds)
+
+def get_google_sheet(index=0):
+    client = get_google_client()
+    url = sheet_url("private_sheet_url")
+    try:
+        sh = client.open_by_url(url)
+        if index >= len(sh.worksheets()):
+            return sh.add_worksheet(title="Leaderboard", rows="1000", cols="4")
+        return sh.get_worksheet(index)
+    except Exception as e:
+        return None
+
+# --- ATTENDANCE ROW INDEX ---
+# Marks are packed integer codes (planner.attendance_code), one base-36 token
+# per row. Undo blanks the mark's cell (a tombstone) instead of find +
+# delete_rows, so no rows shift and the row index stays valid. Blank rows and
+# rows still holding the old long-form IDs are rewritten by compact_attendance,
+# an admin task (never part of a read): run it from one place at a quiet time.
+COMPACT_MIN_TOMBSTONES = 200
+COMPACT_TOMBSTONE_RATIO = 0.2
+_ROW_RE = re.compile(r"![A-Z]+(\d+)")
+
+class AttendanceRowIndex:
+    """code -> sheet row, rebuilt on every full load and kept up to date by appends."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rows = {}
+        self.tombstones = 0   # blank or unreadable rows, plus long-form IDs worth rewriting
+        self.total_rows = 0
+
+    def rebuild(self, values, codes):
+        with self._lock:
+            self._rows = {c: i for i, c in enumerate(codes, start=1) if c is not None}
+            self.total_rows = len(values)
+            self.tombstones = sum(1 for v, c in zip(values, codes) if c is None or "_" in v)
+
+    def appended(self, code, response):
+        m = _ROW_RE.search(((response or {}).get("updates") or {}).get("updatedRange", ""))
+        if not m: return
+        with self._lock:
+            self._rows[code] = int(m.group(1))
+            self.total_rows = max(self.total_rows, int(m.group(1)))
+
+    def pop(self, code):
+        with self._lock:
+            row = self._rows.pop(code, None)
+            if row: self.tombstones += 1
+            return row
+
+    def needs_compaction(self):
+        return self.tombstones >= COMPACT_MIN_TOMBSTONES and self.tombstones >= self.total_rows * COMPACT_TOMBSTONE_RATIO
+
+_row_index = AttendanceRowIndex()
+
+def attendance_sheet_stats():
+    """Row counts from the last full read of the attendance sheet, for the admin panel."""
+    return {"rows": _row_index.total_rows, "tombstones": _row_index.tombstones, "needs_compaction": _row_index.needs_compaction()}
+
+@timed("sheets.compact_attendance")
+def compact_attendance(sheet=None):
+    """
+    Rewrites column A as tokens without blank rows: the live rows are written
+    over the top of the column first, then the leftover tail is cleared, so
+    a failed call never leaves the sheet emptier than it was. Marks appended
+    meanwhile land below the rows read here and are kept; an undo made
+    between the read and the write comes back. Raises on API errors.
+    """
+    sheet = sheet or get_google_sheet(0)
+    data = sheet.col_values(1)
+    codes = [parse_attendance_id(v) for v in data]
+    live = [attendance_token(c) for c in dict.fromkeys(c for c in codes if c is not None)]
+    if live == data: return {"rows": len(data), "live": len(live)}
+    if live: sheet.update(range_name=f"A1:A{len(live)}", values=[[v] for v in live])
+    if len(data) > len(live): sheet.batch_clear([f"A{len(live) + 1}:A{len(data)}"])
+    _row_index.rebuild(live, [parse_attendance_id(v) for v in live])
+    return {"rows": len(data), "live": len(live)}
+
+@timed("sheets.load_attendance")
+def read_attendance():
+    """Every mark in the attendance sheet. Raises StorageUnavailable instead of returning a partial or empty read."""
+    sheet = get_google_sheet(0)
+    if sheet is None: raise StorageUnavailable("attendance sheet unavailable")
+    try:
+        data = sheet.col_values(1)
+    except Exception as e:
+        raise StorageUnavailable(f"attendance sheet: {e}") from e
+    codes = [parse_attendance_id(v) for v in data]
+    _row_index.rebuild(data, codes)
+    return {code: True for code in codes if code is not None}
+
+def apply_attendance_update(sheet, code, action):
+    """One append for a mark; one read and one cell write for an undo, however long the sheet is. Raises on API errors."""
+    if action == "add":
+        _row_index.appended(code, sheet.append_row([attendance_token(code)]))
+    elif action == "remove":
+        row = _row_index.pop(code)
+        if row and parse_attendance_id(sheet.cell(row, 1).value or "") != code:
+            row = None   # the sheet was compacted elsewhere; the index is stale
+        if not row:
+            cell = sheet.find(attendance_token(code))
+            row = cell.row if cell else None
+        if row: sheet.update_cell(row, 1, "")
+
+@timed("sheets.update_attendance")
+def update_attendance_in_sheet(code, action):
+    try:
+        sheet = get_google_sheet(0) 
+        apply_attendance_update(sheet, code, action)
+    except Exception as e:
+        pass
+
+@timed("sheets.leaderboard")
+def get_leaderboard_data(on_error=None):
+    """Fetches live scores with debug error handling (errors go to st.error unless on_error is given)."""
+    on_error = on_error or st.error
+    try:
+        client = get_google_client()
+        sh = client.open_by_url(sheet_url("game_sheet_url"))
+
+
+        
+        # STRICT CHECK: Try to find 'Leaderboard'. 
+        # If not found, print error instead of silently loading wrong sheet.
+        try:
+            sheet = sh.worksheet("Leaderboard")
+        except gspread.exceptions.WorksheetNotFound:
+            on_error("⚠️ Error: Tab named 'Leaderboard' not found in Google Sheet.")
+            return pd.DataFrame()
+
+        # Get all data
+        data = sheet.get_all_values()
+        
+        # ERROR CHECK: Empty Data
+        if not data or len(data) < 2: 
+            return pd.DataFrame()
+            
+        # Parse Headers and Rows
+        header = data[0]
+        rows = data[1:]
+        
+        # create DataFrame
+        df = pd.DataFrame(rows, columns=header)
+        
+        # CLEANUP: Fix columns if they are missing
+        expected_cols = ["Score", "Branch", "Name", "MIS"]
+        for c in expected_cols:
+            if c not in df.columns: df[c] = ""
+
+        # CONVERT TYPES: Force Score to be an integer
+        # This fixes the "sorting by text" bug (where 9 > 1000)
+        df['Score'] = pd.to_numeric(df['Score'], errors='coerce').fillna(0).astype(int)
+        
+        return df
+
+    except Exception as e:
+        # If connection fails, show why
+        on_error(f"Connection Error: {e}")
+        return pd.DataFrame()
+
+# --- STORAGE BACKENDS ---
+SQLITE_PATH = "planner.db"
+LEADERBOARD_PULL_SECONDS = 60   # how often the mirror copies the Sheets leaderboard into SQLite
+MIRROR_MAX_ATTEMPTS = 5
+
+class SheetsBackend:
+    """Every read and write is a Google Sheets round trip."""
+    name = "sheets"
+
+    def load_attendance(self):
+        return read_attendance()
+
+    def load_attendance_for(self, mis):
+        # Sheets cannot filter server-side; only this student's marks are kept
+        m = mis_number(mis)
+        return {code for code in read_attendance() if attendance_mis(code) == m}
+
+    def update_attendance(self, code, action):
+        update_attendance_in_sheet(code, action)
+
+    def compact_attendance(self):
+        return compact_attendance()
+
+    def get_leaderboard(self):
+        return get_leaderboard_data()
+
+SHEETS_TIMEOUT = 5             # seconds a script run waits for a first, uncached read
+ATTENDANCE_REVALIDATE = 60     # seconds before a background re-read of the attendance sheet
+LEADERBOARD_REVALIDATE = 30
+
+class AsyncSheetsBackend:
+    """
+    Google Sheets without blocking the script run.
+
+    Writes are applied to a local copy of the attendance column at once and
+    sent by a single writer thread, in order. Reads return the local copy
+    (or the last leaderboard) immediately and re-read the sheet in the
+    background when it is older than the revalidate interval. Only the very
+    first read waits, and at most SHEETS_TIMEOUT; if it gets nothing it
+    raises StorageUnavailable. A failed re-read keeps the last good copy.
+    """
+    name = "sheets-async"
+
+    def __init__(self, timeout=SHEETS_TIMEOUT):
+        self.timeout = timeout
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sheets-write")
+        self._reader = ThreadPoolExecutor(max_workers=2, thread_name_prefix="sheets-read")
+        self._lock = threading.Lock()
+        self._marks = None             # local view of the attendance column
+        self._marks_at = 0
+        self._marks_job = None
+        self._pending = OrderedDict()  # code -> action, queued but not yet written
+        self._board = None
+        self._board_at = 0
+        self._board_job = None
+        self.last_error = None
+        self.failed_writes = 0
+
+    def _wait(self, job, what):
+        try:
+            return job.result(timeout=self.timeout)
+        except FutureTimeout:
+            count("sheets_timeout", op=what)
+            return None
+
+    # --- attendance ---
+    def _reload_marks(self):
+        # Runs on the writer thread, so every write queued before it is already in the sheet.
+        try:
+            loaded = set(read_attendance())
+        except Exception as e:
+            # Keep the last good copy (still None if there never was one, so the next read retries)
+            count("sheets_read_failed", op="load_attendance")
+            with self._lock:
+                self.last_error = f"load_attendance: {e}"
+                if self._marks is not None: self._marks_at = time.time()
+                self._marks_job = None
+            return
+        with self._lock:
+            for code, action in self._pending.items():
+                (loaded.add if action == "add" else loaded.discard)(code)
+            self._marks, self._marks_at, self._marks_job = loaded, time.time(), None
+
+    def load_attendance(self):
+        with self._lock:
+            stale = time.time() - self._marks_at > ATTENDANCE_REVALIDATE
+            if stale and self._marks_job is None:
+                self._marks_job = self._writer.submit(self._reload_marks)
+            job, marks = self._marks_job, self._marks
+        if marks is None:
+            self._wait(job, "load_attendance")
+            with self._lock: marks = self._marks
+            if marks is None: raise StorageUnavailable(self.last_error or "attendance sheet did not answer in time")
+        return {code: True for code in marks}
+
+    def load_attendance_for(self, mis):
+        m = mis_number(mis)
+        return {code for code in self.load_attendance() if attendance_mis(code) == m}
+
+    def _write(self, code, action):
+        try:
+            with timer("sheets.update_attendance"):
+                apply_attendance_update(get_google_sheet(0), code, action)
+        except Exception as e:
+            self.failed_writes += 1
+            self.last_error = f"write {code}: {e}"
+            count("sheets_write_failed")
+        finally:
+            with self._lock:
+                if self._pending.get(code) == action: del self._pending[code]
+
+    def compact_attendance(self):
+        # On the writer thread, after every queued write; blocks until done
+        return self._writer.submit(compact_attendance).result()
+
+    def update_attendance(self, code, action):
+        with self._lock:
+            if self._marks is not None:
+                (self._marks.add if action == "add" else self._marks.discard)(code)
+            self._pending[code] = action
+            self._pending.move_to_end(code)
+        self._writer.submit(self._write, code, action)
+
+    # --- leaderboard ---
+    def _reload_board(self):
+        df = get_leaderboard_data(on_error=self._record_error)
+        with self._lock:
+            # An empty frame after a failure keeps the last good leaderboard.
+            if not df.empty or self._board is None: self._board = df
+            self._board_at, self._board_job = time.time(), None
+
+    def _record_error(self, message):
+        self.last_error = message
+
+    def refresh_leaderboard(self, wait=True):
+        """Forces a re-read; with wait the caller blocks for at most the timeout."""
+        with self._lock:
+            if self._board_job is None: self._board_job = self._reader.submit(self._reload_board)
+            job = self._board_job
+        if wait: self._wait(job, "leaderboard")
+
+    def get_leaderboard(self):
+        with self._lock:
+            stale = time.time() - self._board_at > LEADERBOARD_REVALIDATE
+            board = self._board
+        if stale: self.refresh_leaderboard(wait=board is None)
+        with self._lock: board = self._board
+        return board if board is not None else pd.DataFrame()
+
+    def metrics(self):
+        with self._lock:
+            return {
+                "pending_writes": len(self._pending),
+                "failed_writes": self.failed_writes,
+                "attendance_age_seconds": round(time.time() - self._marks_at, 1) if self._marks_at else None,
+                "leaderboard_age_seconds": round(time.time() - self._board_at, 1) if self._board_at else None,
+                "last_error": self.last_error,
+            }
+
+class SQLiteBackend:
+    """
+    Attendance and a leaderboard copy in a local SQLite file (WAL mode).
+    Writes are local and sub-millisecond; with a mirror attached they are
+    also replayed to Google Sheets in the background.
+    """
+    name = "sqlite"
+    per_mis_reads = True   # AttendanceStore reads one student at a time through idx_marks_mis
+
+    # Marks are keyed by their base-36 token: packed codes can exceed SQLite's 64-bit INTEGER.
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS marks (
+            token     TEXT PRIMARY KEY,
+            mis       INTEGER NOT NULL,
+            marked_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_marks_mis ON marks(mis);
+        CREATE TABLE IF NOT EXISTS leaderboard (
+            mis    TEXT,
+            branch TEXT,
+            name   TEXT,
+            score  INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS idx_leaderboard_branch_score ON leaderboard(branch, score DESC);
+    """
+
+    def __init__(self, path=SQLITE_PATH, mirror=None):
+        self.path = path
+        self.mirror = mirror
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.executescript(self.SCHEMA)
+        self._migrate_long_ids()
+        if mirror:
+            mirror.start(self)
+
+    def _conn(self):
+        # One connection per thread; Streamlit runs every session in its own thread.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _migrate_long_ids(self):
+        # Databases written before packed codes have an `attendance` table of long-form IDs.
+        conn = self._conn()
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'attendance'").fetchone(): return
+        codes = [parse_attendance_id(cls_id) for (cls_id,) in conn.execute("SELECT cls_id FROM attendance")]
+        self.import_attendance(c for c in codes if c is not None)
+        with conn:
+            conn.execute("DROP TABLE attendance")
+
+    @timed("sqlite.load_attendance")
+    def load_attendance(self):
+        return {int(token, 36): True for (token,) in self._conn().execute("SELECT token FROM marks")}
+
+    @timed("sqlite.load_attendance_for")
+    def load_attendance_for(self, mis):
+        rows = self._conn().execute("SELECT token FROM marks WHERE mis = ?", (mis_number(mis),))
+        return {int(token, 36) for (token,) in rows}
+
+    @timed("sqlite.update_attendance")
+    def update_attendance(self, code, action):
+        with self._conn() as conn:
+            if action == "add":
+                conn.execute("INSERT OR IGNORE INTO marks (token, mis, marked_at) VALUES (?, ?, ?)",
+                             (attendance_token(code), attendance_mis(code), time.time()))
+            elif action == "remove":
+                conn.execute("DELETE FROM marks WHERE token = ?", (attendance_token(code),))
+        if self.mirror:
+            self.mirror.push(code, action)
+
+    def import_attendance(self, codes):
+        """Bulk-loads existing marks (used once to seed an empty database from Sheets)."""
+        now = time.time()
+        with self._conn() as conn:
+            conn.executemany("INSERT OR IGNORE INTO marks (token, mis, marked_at) VALUES (?, ?, ?)",
+                             [(attendance_token(c), attendance_mis(c), now) for c in codes])
+
+    def is_empty(self):
+        return self._conn().execute("SELECT 1 FROM marks LIMIT 1").fetchone() is None
+
+    def replace_leaderboard(self, df):
+        rows = [(str(r.get("MIS", "")), str(r.get("Branch", "")), str(r.get("Name", "")), int(r.get("Score", 0)))
+                for r in df.to_dict("records")]
+        with self._conn() as conn:
+            conn.execute("DELETE FROM leaderboard")
+            conn.executemany("INSERT INTO leaderboard (mis, branch, name, score) VALUES (?, ?, ?, ?)", rows)
+
+    @timed("sqlite.leaderboard")
+    def get_leaderboard(self):
+        rows = self._conn().execute("SELECT score, branch, name, mis FROM leaderboard").fetchall()
+        return pd.DataFrame(rows, columns=["Score", "Branch", "Name", "MIS"]) if rows else pd.DataFrame()
+
+class SheetsMirror:
+    """
+    Background thread that replays local attendance writes to Google Sheets
+    and periodically copies the Sheets leaderboard (fed by the game's Apps
+    Script) into SQLite. Only the latest action per code is kept, so a
+    remove can never overtake the add it undoes; a failed write waits out
+    its backoff in place while the thread carries on with the rest.
+    """
+
+    def __init__(self, sheets=None):
+        self.sheets = sheets or SheetsBackend()
+        self._pending = OrderedDict()   # code -> (action, attempt, not_before)
+        self._wake = threading.Condition()
+        self._thread = None
+        self._seed_pending = False
+        self.pushed = self.failed = 0
+
+    def start(self, local):
+        if self._thread: return
+        self.local = local
+        self._seed_pending = local.is_empty()
+        self._seed()
+        self._thread = threading.Thread(target=self._run, name="sheets-mirror", daemon=True)
+        self._thread.start()
+
+    def _seed(self):
+        # An empty database starts from the sheet's marks; retried from the thread until the sheet answers
+        if not self._seed_pending: return
+        try:
+            self.local.import_attendance(self.sheets.load_attendance())
+            self._seed_pending = False
+        except Exception:
+            count("mirror_seed", result="failed")
+
+    def push(self, code, action):
+        with self._wake:
+            self._pending[code] = (action, 1, 0.0)
+            self._wake.notify()
+
+    def pending(self):
+        return len(self._pending)
+
+    def _next_due(self, timeout):
+        with self._wake:
+            now = time.time()
+            for code, (action, attempt, not_before) in self._pending.items():
+                if not_before <= now:
+                    del self._pending[code]
+                    return code, action, attempt
+            self._wake.wait(timeout)
+            return None
+
+    def _run(self):
+        next_pull = 0
+        while True:
+            if time.time() >= next_pull:
+                self._seed()
+                self._pull_leaderboard()
+                next_pull = time.time() + LEADERBOARD_PULL_SECONDS
+            item = self._next_due(timeout=1)
+            if item is None: continue
+            code, action, attempt = item
+            if self._apply(code, action):
+                self.pushed += 1
+                count("mirror_push", result="ok")
+            elif attempt < MIRROR_MAX_ATTEMPTS:
+                with self._wake:
+                    # A newer action for the code, pushed meanwhile, replaces this one
+                    self._pending.setdefault(code, (action, attempt + 1, time.time() + min(30, 2 ** attempt)))
+            else:
+                self.failed += 1
+                count("mirror_push", result="dropped")
+
+    def _apply(self, code, action):
+        try:
+            apply_attendance_update(get_google_sheet(0), code, action)
+            return True
+        except Exception:
+            return False
+
+    def _pull_leaderboard(self):
+        try:
+            df = self.sheets.get_leaderboard()
+            if not df.empty: self.local.replace_leaderboard(df)
+        except Exception:
+            pass
+
+def make_backend(kind="sheets", sqlite_path=SQLITE_PATH, mirror=False, async_io=True):
+    """
+    'sheets' (default) or 'sqlite'. mirror=True keeps the spreadsheet updated
+    in the background; async_io=False makes the sheets backend block again.
+    """
+    if kind == "sqlite":
+        os.makedirs(os.path.dirname(os.path.abspath(sqlite_path)), exist_ok=True)
+        return SQLiteBackend(sqlite_path, SheetsMirror() if mirror else None)
+    return AsyncSheetsBackend() if async_io else SheetsBackend()
+
+def get_secret(key, default=None):
+    """st.secrets.get that also works when no secrets file exists at all."""
+    try:
+        return st.secrets.get(key, default)
+    except Exception:
+        return default
+
+# --- SHARED ATTENDANCE STORE ---
+ATTENDANCE_MEMORY_BUDGET = 16 * 1024 * 1024  # bytes, snapshot + all session overlays
+ATTENDANCE_SNAPSHOT_TTL = 300                # seconds before the sheet is re-read
+ATTENDANCE_IDLE_SECONDS = 30 * 60            # sessions idle this long are evicted first
+
+CLASS_MASK = (1 << CLASS_BITS) - 1
+
+def _ids_footprint(ids):
+    if isinstance(ids, array): return sys.getsizeof(ids)
+    return sys.getsizeof(ids) + sum(sys.getsizeof(i) for i in ids)
+
+def _class_array(class_codes):
+    # Sorted uint64 per student: 8 bytes a mark instead of a set entry plus a string.
+    return array("Q", sorted(class_codes))
+
+class AttendanceStore:
+    """
+    One read-mostly copy of the attendance sheet per process, indexed by MIS
+    (as an int) and held as the low, per-class bits of each packed code.
+    Sessions attach to the MIS they are viewing (reference counted). A write
+    goes to the backend and then straight into the shared snapshot, so every
+    session of that student sees it; the writing session also keeps it in an
+    overlay, tagged with a write sequence number, until a snapshot read
+    after the write has replaced it. A snapshot read that started before the
+    write gets the overlay entries applied on top.
+    Backends with per_mis_reads (SQLite) are never read whole: each student
+    is loaded on its own when first viewed.
+    """
+
+    def __init__(self, backend, budget=ATTENDANCE_MEMORY_BUDGET, ttl=ATTENDANCE_SNAPSHOT_TTL):
+        self.backend = backend
+        self.budget = budget
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._by_mis = {}              # mis number -> array of class codes (from the sheet)
+        self._refs = {}                # mis -> number of attached sessions
+        self._sessions = OrderedDict() # session id -> overlay, least recently seen first
+        self._loaded_at = 0
+        self._complete = False         # False once unreferenced students were dropped
+        self._mis_at = {}              # mis -> when it was re-read on its own (after an eviction)
+        self._seq = 0                  # last write sequence number handed to an overlay
+        self.evictions = 0
+
+    # --- snapshot ---
+    def _refresh(self, mis=None):
+        with self._lock:
+            now = time.time()
+            fresh = now - self._loaded_at < self.ttl
+            if fresh and (self._complete or mis in self._by_mis): return
+            if mis is not None and now - self._mis_at.get(mis, 0) < self.ttl: return
+            seq = self._seq
+        if mis is not None and (fresh or getattr(self.backend, "per_mis_reads", False)):
+            # Indexed backend, or evicted under the memory budget: this student only
+            try:
+                codes = _class_array(c & CLASS_MASK for c in self.backend.load_attendance_for(mis))
+            except Exception:
+                count("attendance_refresh_failed")
+                return   # not marked loaded, so the next view tries again
+            with self._lock:
+                self._by_mis[mis] = codes
+                self._mis_at[mis] = time.time()
+                self._settle(seq, mis)
+            return
+        try:
+            loaded = self.backend.load_attendance()
+        except Exception:
+            count("attendance_refresh_failed")
+            return   # keep serving the previous snapshot; not marked loaded
+        by_mis = {}
+        for code in loaded:
+            by_mis.setdefault(attendance_mis(code), []).append(code & CLASS_MASK)
+        by_mis = {m: _class_array(codes) for m, codes in by_mis.items()}
+        if mis is not None: by_mis.setdefault(mis, array("Q"))
+        with self._lock:
+            self._by_mis = by_mis
+            self._loaded_at = time.time()
+            self._complete = True
+            self._mis_at = {}
+            self._settle(seq)
+
+    def _settle(self, seq, mis=None):
+        # Writes up to seq were in the backend before it was read; later ones are reapplied on top.
+        for ov in self._sessions.values():
+            if mis is not None and ov["mis"] != mis: continue
+            for changes in (ov["added"], ov["removed"]):
+                for c in [c for c, s in changes.items() if s <= seq]: del changes[c]
+            if ov["added"] or ov["removed"]: self._apply(ov["mis"], ov["added"], ov["removed"])
+
+    def _apply(self, mis, added=(), removed=()):
+        if mis not in self._by_mis and not added: return
+        self._by_mis[mis] = _class_array(set(self._by_mis.get(mis, ())).union(added).difference(removed))
+
+    # --- sessions ---
+    def attach(self, session_id, mis):
+        mis = mis_number(mis)
+        with self._lock:
+            ov = self._sessions.get(session_id)
+            if ov and ov["mis"] != mis:
+                self.detach(session_id)
+                ov = None
+            if not ov:
+                ov = {"mis": mis, "added": {}, "removed": {}, "last_seen": 0}   # class code -> write seq
+                self._sessions[session_id] = ov
+                self._refs[mis] = self._refs.get(mis, 0) + 1
+            ov["last_seen"] = time.time()
+            self._sessions.move_to_end(session_id)
+        self._refresh(mis)
+
+    def detach(self, session_id):
+        with self._lock:
+            ov = self._sessions.pop(session_id, None)
+            if not ov: return
+            self._refs[ov["mis"]] -= 1
+            if self._refs[ov["mis"]] <= 0: del self._refs[ov["mis"]]
+
+    # --- reads & writes ---
+    def marks(self, session_id, mis):
+        """Packed attendance codes marked present for `mis`, as every session of that student sees them."""
+        self.attach(session_id, mis)
+        with self._lock:
+            ov = self._sessions[session_id]
+            base = ov["mis"] << CLASS_BITS
+            return {base | c for c in self._by_mis.get(ov["mis"], ())}
+
+    def mark(self, session_id, mis, code, present):
+        self.attach(session_id, mis)
+        # Backend first: a snapshot read after this point already includes the write
+        self.backend.update_attendance(code, "add" if present else "remove")
+        with self._lock:
+            self._seq += 1
+            ov = self._sessions[session_id]
+            c = code & CLASS_MASK
+            (ov["added"] if present else ov["removed"])[c] = self._seq
+            (ov["removed"] if present else ov["added"]).pop(c, None)
+            self._apply(ov["mis"], *(((c,), ()) if present else ((), (c,))))
+        self._enforce_budget()
+
+    # --- memory ---
+    def _overlay_footprint(self, ov):
+        return _ids_footprint(ov["added"]) + _ids_footprint(ov["removed"])
+
+    def used_bytes(self):
+        with self._lock:
+            snap = sum(_ids_footprint(ids) for ids in self._by_mis.values())
+            return snap + sum(self._overlay_footprint(ov) for ov in self._sessions.values())
+
+    def _enforce_budget(self):
+        with self._lock:
+            now = time.time()
+            # 1. Idle sessions go first, least recently seen first.
+            for sid in [sid for sid, ov in self._sessions.items() if now - ov["last_seen"] > ATTENDANCE_IDLE_SECONDS]:
+                self.detach(sid)
+                self.evictions += 1
+            if self.used_bytes() <= self.budget: return
+            # 2. Then students nobody is looking at; they are re-read on demand.
+            for mis in [m for m in self._by_mis if m not in self._refs]:
+                del self._by_mis[mis]
+                self._mis_at.pop(mis, None)
+                self._complete = False
+                self.evictions += 1
+
+    def metrics(self):
+        with self._lock:
+            now = time.time()
+            sessions = [{
+                "session": sid[:8], "mis": ov["mis"],
+                "overlay_marks": len(ov["added"]) + len(ov["removed"]),
+                "overlay_bytes": self._overlay_footprint(ov),
+                "shared_bytes": _ids_footprint(self._by_mis.get(ov["mis"], array("Q"))),
+                "idle_seconds": round(now - ov["last_seen"], 1),
+            } for sid, ov in self._sessions.items()]
+            return {
+                "budget_bytes": self.budget,
+                "used_bytes": self.used_bytes(),
+                "snapshot_students": len(self._by_mis),
+                "snapshot_marks": sum(len(ids) for ids in self._by_mis.values()),
+                "snapshot_age_seconds": round(now - self._loaded_at, 1) if self._loaded_at else None,
+                "attached_sessions": len(self._sessions),
+                "evictions": self.evictions,
+                "sessions": sessions,
+            }